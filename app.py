@@ -1,22 +1,48 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, g, has_request_context
+from flask import before_render_template, template_rendered, has_app_context, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
 from datetime import datetime, timedelta
 from functools import wraps
+from contextlib import contextmanager
 import json
 from sqlalchemy import func
-from sqlalchemy import extract
+from sqlalchemy import event
+from sqlalchemy import insert
+from sqlalchemy import select, union_all, literal_column, null, cast, table, column, text, case
+from sqlalchemy import create_engine, inspect
 from collections import OrderedDict
 import calendar
-from sqlalchemy.orm import joinedload
+import bisect
+import time
+import threading
+from collections import deque
+from sqlalchemy.orm import joinedload, selectinload, aliased, contains_eager
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+import click
+import sqlite3
+import socket
+import base64
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape as xml_escape
+from jinja2.utils import htmlsafe_json_dumps
+from config import ProductionConfig, get_config, get_engine_options
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = os.urandom(24)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///bismi_farm.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=2)  # Session expires after 2 hours
+config_class = get_config()
+app.config.from_object(config_class)
+if not app.config['SECRET_KEY']:
+    if config_class is ProductionConfig:
+        raise RuntimeError('Set the SECRET_KEY environment variable in production')
+    # Sessions will not survive a restart or work across several processes
+    app.config['SECRET_KEY'] = os.urandom(24)
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', get_engine_options(app.config))
 
 # Add custom strftime filter
 @app.template_filter('strftime')
@@ -29,6 +55,62 @@ def strftime_filter(date, format):
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
+# Connection and transaction tuning
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+POSTGRES_WRITE_LOCK = 7291  # Advisory lock key write transactions queue on under PostgreSQL
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """Apply SQLITE_PRAGMAS and take over transaction control from the sqlite3 module"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    # The begin listener below issues BEGIN itself; pragmas such as journal_mode must run outside a transaction
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+@event.listens_for(Engine, 'begin')
+def begin_write_transaction(connection):
+    """Start write requests with BEGIN IMMEDIATE so they wait on busy_timeout for the write lock.
+
+    A deferred transaction that reads first and writes later fails at once
+    with "database is locked" when another writer committed in between,
+    because its read snapshot can no longer be upgraded. Taking the write
+    lock up front turns that into an orderly queue. Reads keep plain BEGIN
+    and run concurrently with the writer under WAL.
+
+    The write paths read counters such as the ledger and bird counts and
+    write them back, which is only safe with one writer at a time. On
+    PostgreSQL, whose READ COMMITTED lets writers interleave, write
+    transactions queue on an advisory lock instead.
+    """
+    if connection.dialect.name not in ('sqlite', 'postgresql'):
+        return
+    # Work outside a write request opts in (see write_transactions)
+    write = has_app_context() and g.get('write_transactions', False)
+    if has_request_context():
+        write = write or request.method in WRITE_METHODS
+    # Straight to the driver so the statements stay out of the per-request query counts
+    driver_connection = connection.connection.driver_connection
+    if connection.dialect.name == 'sqlite':
+        driver_connection.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+    elif write:
+        with driver_connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', (POSTGRES_WRITE_LOCK,))
+
+@contextmanager
+def write_transactions():
+    """Start the transactions of the block as write transactions (see begin_write_transaction),
+    for writes outside a request or on the way through a read request"""
+    previous = g.get('write_transactions', False)
+    g.write_transactions = True
+    try:
+        yield
+    finally:
+        g.write_transactions = previous
+
 # Custom login required decorator
 def login_required(f):
     @wraps(f)
@@ -79,7 +161,6 @@ class Farm(db.Model):
     name = db.Column(db.String(100), nullable=False)
     total_capacity = db.Column(db.Integer, nullable=False)
     num_sheds = db.Column(db.Integer, nullable=False)
-    shed_capacities = db.Column(db.Text, nullable=False, default='[]')  # Store as JSON string
     total_area = db.Column(db.Float, nullable=False)  # Total area in square meters
     owner_name = db.Column(db.String(100), nullable=False)
     contact_number = db.Column(db.String(20), nullable=False)  # Contact number as string to preserve leading zeros
@@ -88,47 +169,118 @@ class Farm(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     manager_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     manager = db.relationship('User', backref=db.backref('managed_farms', lazy=True))
+    sheds = db.relationship('Shed', backref='farm', lazy='selectin', order_by='Shed.shed_number',
+                            cascade='all, delete-orphan')
+
+    def get_active_sheds(self):
+        """The sheds in use, leaving out retired ones (see Shed)"""
+        return self.sheds[:self.num_sheds]
 
     def get_shed_capacities(self):
-        return json.loads(self.shed_capacities)
+        return [shed.capacity for shed in self.get_active_sheds()]
 
     def set_shed_capacities(self, capacities):
-        self.shed_capacities = json.dumps(capacities)
+        """Resize the farm's sheds to the given capacities, keeping the rows of sheds that remain.
+
+        A dropped shed that holds birds of an ongoing or closing batch is
+        refused with a ValueError. One that only holds closed batches is
+        retired at capacity 0 so their shed history stays, and an empty one
+        is deleted.
+        """
+        sheds = list(self.sheds)
+        for shed_number, capacity in enumerate(capacities, 1):
+            if shed_number <= len(sheds):
+                sheds[shed_number - 1].capacity = capacity
+            else:
+                self.sheds.append(Shed(shed_number=shed_number, capacity=capacity))
+        dropped = sheds[len(capacities):]
+        statuses = {}
+        if dropped:
+            for shed_id, status in db.session.query(BatchShedAllocation.shed_id, Batch.status).join(
+                    Batch, Batch.id == BatchShedAllocation.batch_id).filter(
+                    BatchShedAllocation.shed_id.in_([shed.id for shed in dropped if shed.id is not None])):
+                statuses.setdefault(shed_id, set()).add(status)
+        for shed in dropped:
+            if statuses.get(shed.id, set()) & set(ACTIVE_BATCH_STATUSES):
+                raise ValueError(f'Shed {shed.shed_number} holds birds of an open batch and cannot be removed')
+            if shed.id in statuses:
+                shed.capacity = 0
+            else:
+                self.sheds.remove(shed)
+
+    # JSON string accessors kept for older callers
+    @property
+    def shed_capacities(self):
+        return json.dumps(self.get_shed_capacities())
+
+    @shed_capacities.setter
+    def shed_capacities(self, value):
+        self.set_shed_capacities(json.loads(value) if value else [])
 
     def get_available_capacity(self):
         """Calculate available capacity considering all active batches"""
-        active_batches = Batch.query.filter(
+        total_birds_in_farm = db.session.query(func.sum(Batch.total_birds)).filter(
             Batch.farm_id == self.id,
-            Batch.status.in_(['ongoing', 'closing'])
-        ).all()
-        
-        total_birds_in_farm = sum(batch.total_birds for batch in active_batches)
-        return self.total_capacity - total_birds_in_farm
+            Batch.status.in_(ACTIVE_BATCH_STATUSES)
+        ).scalar()
+        return self.total_capacity - (total_birds_in_farm or 0)
 
     def get_shed_available_capacities(self):
         """Calculate available capacity for each shed"""
-        shed_capacities = self.get_shed_capacities()
-        shed_used = [0] * len(shed_capacities)
-        
-        # Get all active batches
-        active_batches = Batch.query.filter(
-            Batch.farm_id == self.id,
-            Batch.status.in_(['ongoing', 'closing'])
-        ).all()
-        
-        # Sum up birds in each shed from all active batches
-        for batch in active_batches:
-            batch_shed_birds = batch.get_shed_birds()
-            for i, birds in enumerate(batch_shed_birds):
-                if i < len(shed_used):
-                    shed_used[i] += birds
-        
-        # Calculate available capacity for each shed
-        return [capacity - used for capacity, used in zip(shed_capacities, shed_used)]
+        return get_shed_availability([self.id]).get(self.id, [])
+
+class Shed(db.Model):
+    """A shed of a farm. Sheds numbered above the farm's num_sheds are retired:
+    they stay at capacity 0 only to keep the allocations of closed batches."""
+    id = db.Column(db.Integer, primary_key=True)
+    farm_id = db.Column(db.Integer, db.ForeignKey('farm.id', ondelete='CASCADE'), nullable=False)
+    shed_number = db.Column(db.Integer, nullable=False)  # 1-based position within the farm
+    capacity = db.Column(db.Integer, nullable=False, default=0)
+
+    # No delete cascade: allocations are batch history and go only with their batch
+    allocations = db.relationship('BatchShedAllocation', backref=db.backref('shed', lazy='joined'))
+
+    __table_args__ = (db.UniqueConstraint('farm_id', 'shed_number', name='uq_shed_farm_number'),)
+
+class BatchShedAllocation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id', ondelete='CASCADE'), nullable=False)
+    shed_id = db.Column(db.Integer, db.ForeignKey('shed.id', ondelete='CASCADE'), nullable=False)
+    birds = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('batch_id', 'shed_id', name='uq_batch_shed_allocation_batch_shed'),
+        db.Index('ix_batch_shed_allocation_shed', 'shed_id'),
+    )
+
+# Birds placed in each shed by active batches, maintained on flush (see refresh_shed_occupancy)
+shed_occupancy = db.Table('shed_occupancy',
+    db.Column('shed_id', db.Integer, db.ForeignKey('shed.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('farm_id', db.Integer, db.ForeignKey('farm.id', ondelete='CASCADE'), nullable=False, index=True),
+    db.Column('occupied_birds', db.Integer, nullable=False, default=0)
+)
+
+# Batch number allocation state (see allocate_farm_batch_number). Every farm
+# number below next_number is either held by a batch or listed as free.
+farm_batch_number_counter = db.Table('farm_batch_number_counter',
+    db.Column('farm_id', db.Integer, db.ForeignKey('farm.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('next_number', db.Integer, nullable=False, default=1)
+)
+
+farm_batch_number_free = db.Table('farm_batch_number_free',
+    db.Column('farm_id', db.Integer, db.ForeignKey('farm.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('number', db.Integer, primary_key=True)
+)
+
+# Global counters such as the BATCH-0001 sequence
+number_sequence = db.Table('number_sequence',
+    db.Column('name', db.String(50), primary_key=True),
+    db.Column('next_value', db.Integer, nullable=False)
+)
 
 class Batch(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    farm_id = db.Column(db.Integer, db.ForeignKey('farm.id'), nullable=False)
+    farm_id = db.Column(db.Integer, db.ForeignKey('farm.id', ondelete='CASCADE'), nullable=False)
     manager_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Allow nullable for backward compatibility
     batch_number = db.Column(db.String(50), nullable=False)
     farm_batch_number = db.Column(db.Integer, nullable=False)  # New column for farm-specific batch number
@@ -138,7 +290,6 @@ class Batch(db.Model):
     available_birds = db.Column(db.Integer, nullable=False)
     total_mortality = db.Column(db.Integer, nullable=False, default=0)  # Total mortality count
     feed_stock = db.Column(db.Float, nullable=False, default=0)  # Current feed stock in kg
-    shed_birds = db.Column(db.Text, nullable=False, default='[]')  # Store as JSON string with default empty array
     cost_per_chicken = db.Column(db.Float, nullable=False, default=0.0)
     feed_usage = db.Column(db.Float, nullable=False, default=0.0)  # Total feed used in kg
     status = db.Column(db.String(20), nullable=False, default='ongoing')  # 'ongoing', 'closing', 'closed'
@@ -149,26 +300,59 @@ class Batch(db.Model):
     # Relationships
     farm = db.relationship('Farm', backref=db.backref('batches', lazy=True))
     manager = db.relationship('User', backref=db.backref('managed_batches', lazy=True))
+    shed_allocations = db.relationship('BatchShedAllocation', backref='batch', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_batch_status', 'status'),
+        db.Index('ix_batch_manager_status', 'manager_id', 'status'),
+        db.Index('ix_batch_farm_status', 'farm_id', 'status'),
+        db.Index('ix_batch_farm_number', 'farm_id', 'farm_batch_number'),
+        db.Index('ix_batch_created_at_id', 'created_at', 'id'),
+    )
 
     def get_shed_birds(self):
-        try:
-            shed_birds = json.loads(self.shed_birds) if self.shed_birds else []
-        except (json.JSONDecodeError, TypeError):
-            shed_birds = []
-        
+        birds_by_shed = {allocation.shed.shed_number: allocation.birds for allocation in self.shed_allocations}
+        num_sheds = max(birds_by_shed, default=0)
+
         # Ensure the list matches the current number of sheds in the farm
         if self.farm:
-            current_num_sheds = self.farm.num_sheds
-            while len(shed_birds) < current_num_sheds:
-                shed_birds.append(0)  # Pad with zeros for new sheds
-        
-        return shed_birds
+            num_sheds = max(num_sheds, self.farm.num_sheds)
+
+        return [birds_by_shed.get(shed_number, 0) for shed_number in range(1, num_sheds + 1)]
 
     def set_shed_birds(self, birds):
-        try:
-            self.shed_birds = json.dumps(birds) if birds is not None else '[]'
-        except (TypeError, ValueError):
-            self.shed_birds = '[]'
+        """Allocate birds to the farm's sheds by position, updating the existing allocation rows.
+
+        Allocations in retired sheds are left alone; birds given for a shed
+        the farm does not have raise a ValueError.
+        """
+        farm = self.farm if self.farm is not None else db.session.get(Farm, int(self.farm_id))
+        sheds = farm.get_active_sheds()
+        birds = birds or []
+        if any(birds[len(sheds):]):
+            raise ValueError(f'{len(birds)} shed counts given but the farm has {len(sheds)} shed(s)')
+        allocations = {allocation.shed_id: allocation for allocation in self.shed_allocations
+                       if allocation.shed in sheds}
+        for shed, count in zip(sheds, birds):
+            allocation = allocations.pop(shed.id, None)
+            if not count:
+                if allocation is not None:
+                    self.shed_allocations.remove(allocation)
+            elif allocation is not None:
+                allocation.birds = count
+            else:
+                self.shed_allocations.append(BatchShedAllocation(shed=shed, birds=count))
+        for allocation in allocations.values():
+            self.shed_allocations.remove(allocation)
+
+    # JSON string accessors kept for older callers
+    @property
+    def shed_birds(self):
+        return json.dumps(self.get_shed_birds())
+
+    @shed_birds.setter
+    def shed_birds(self, value):
+        self.set_shed_birds(json.loads(value) if value else [])
 
     def get_age_days(self):
         # Use local timezone instead of UTC
@@ -187,9 +371,8 @@ class Batch(db.Model):
         if self.available_birds <= 0 and self.status == 'closing':
             self.status = 'closed'
             self.closed_at = datetime.now()  # Set the closed date
-            financial_summary = self.financial_summary or FinancialSummary(batch_id=self.id)
-            financial_summary.calculate_summary(self)
-            db.session.add(financial_summary)
+            get_batch_ledger(self).freeze()
+            enqueue_job('calculate_summary', batch_id=self.id)
 
     def get_total_revenue(self):
         """Calculate total revenue from all harvests"""
@@ -205,53 +388,32 @@ class Batch(db.Model):
             total += harvest.quantity
         return total
 
+    def get_costs(self):
+        """Get all cost components for this batch from the cost engine"""
+        return get_batch_costs([self.id])[self.id]
+
     def get_feed_cost(self):
         """Calculate total feed cost from all batch updates"""
-        total = 0
-        for update in self.updates:
-            for feed in update.feeds:
-                quantity = update.get_feed_quantity(feed.id)
-                total += quantity * feed.price
-        return total
+        return self.get_costs()['feed_cost']
 
     def get_medicine_cost(self):
         """Calculate total medicine cost from all batch updates"""
-        total = 0
-        for update in self.updates:
-            for medicine in update.medicines:
-                quantity = update.get_medicine_quantity(medicine.id)
-                total += quantity * medicine.price
-        return total
+        return self.get_costs()['medicine_cost']
 
     def get_health_materials_cost(self):
         """Calculate total health materials cost from all batch updates"""
-        total = 0
-        for update in self.updates:
-            for material in update.health_materials:
-                quantity = update.get_health_material_quantity(material.id)
-                total += quantity * material.price
-        return total
+        return self.get_costs()['health_material_cost']
 
     def get_vaccine_cost(self):
         """Calculate total vaccine cost from all batch updates"""
-        total = 0
-        for update in self.updates:
-            for vaccine_update in update.vaccine_updates:
-                vaccine_id = vaccine_update[0]
-                quantity = vaccine_update[2]
-                vaccine = next((v for v in update.vaccines if v.id == vaccine_id), None)
-                if vaccine:
-                    total += vaccine.price * quantity
-        return total
+        return self.get_costs()['vaccine_cost']
 
     def get_total_expenses(self):
         """Calculate total expenses including chicken cost, feed, medicines, health materials, and vaccines"""
+        costs = self.get_costs()
         chicken_cost = self.cost_per_chicken * self.total_birds
-        feed_cost = self.get_feed_cost()
-        medicine_cost = self.get_medicine_cost()
-        health_materials_cost = self.get_health_materials_cost()
-        vaccine_cost = self.get_vaccine_cost()
-        return chicken_cost + feed_cost + medicine_cost + health_materials_cost + vaccine_cost
+        return (chicken_cost + costs['feed_cost'] + costs['medicine_cost'] +
+                costs['health_material_cost'] + costs['vaccine_cost'])
 
     def get_total_profit(self):
         """Calculate total profit (revenue - expenses)"""
@@ -272,17 +434,7 @@ class Batch(db.Model):
 
     def get_total_feed_delivered(self):
         """Calculate total feed delivered from all batch updates"""
-        total = 0
-        for update in self.updates:
-            # Query the batch_update_feeds table to get feed quantities for this update
-            feed_quantities = db.session.query(batch_update_feeds.c.quantity).filter(
-                batch_update_feeds.c.batch_update_id == update.id
-            ).all()
-            
-            for quantity_row in feed_quantities:
-                total += quantity_row[0]  # quantity_row is a tuple, get the first element
-        
-        return total
+        return self.get_costs()['feed_packets']
 
 class Feed(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -324,16 +476,42 @@ class Vaccine(db.Model):
     quantity_per_unit = db.Column(db.Float, nullable=False)  # in ml
     price = db.Column(db.Float, nullable=False)
     doses_required = db.Column(db.Integer, nullable=False)  # Number of times vaccine should be given
-    dose_ages = db.Column(db.Text, nullable=False)  # JSON string of ages for each dose in days
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    doses = db.relationship('VaccineDose', backref='vaccine', lazy='selectin', order_by='VaccineDose.dose_number',
+                            cascade='all, delete-orphan')
+
     def get_dose_ages(self):
-        return json.loads(self.dose_ages)
+        return [dose.age_days for dose in self.doses]
 
     def set_dose_ages(self, ages):
-        self.dose_ages = json.dumps(ages)
+        doses = list(self.doses)
+        for dose_number, age in enumerate(ages, 1):
+            if dose_number <= len(doses):
+                doses[dose_number - 1].age_days = age
+            else:
+                self.doses.append(VaccineDose(dose_number=dose_number, age_days=age))
+        for dose in doses[len(ages):]:
+            self.doses.remove(dose)
+
+    # JSON string accessors kept for older callers
+    @property
+    def dose_ages(self):
+        return json.dumps(self.get_dose_ages())
+
+    @dose_ages.setter
+    def dose_ages(self, value):
+        self.set_dose_ages(json.loads(value) if value else [])
+
+class VaccineDose(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    vaccine_id = db.Column(db.Integer, db.ForeignKey('vaccine.id'), nullable=False)
+    dose_number = db.Column(db.Integer, nullable=False)
+    age_days = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('vaccine_id', 'dose_number', name='uq_vaccine_dose_vaccine_number'),)
 
 class MedicineSchedule(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -341,28 +519,34 @@ class MedicineSchedule(db.Model):
     schedule_date = db.Column(db.Date, nullable=False)
     notes = db.Column(db.Text)
     completed = db.Column(db.Boolean, default=False)
+    auto_generated = db.Column(db.Boolean, nullable=False, default=False)  # Made from an auto-schedule, replaced when it changes
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     
     medicine = db.relationship('Medicine', backref='schedules')
     batches = db.relationship('Batch', secondary='medicine_schedule_batches', backref='medicine_schedules')
 
+    __table_args__ = (db.Index('ix_medicine_schedule_date_completed', 'schedule_date', 'completed'),)
+
 # Association table for many-to-many relationship between MedicineSchedule and Batch
 medicine_schedule_batches = db.Table('medicine_schedule_batches',
-    db.Column('medicine_schedule_id', db.Integer, db.ForeignKey('medicine_schedule.id'), primary_key=True),
-    db.Column('batch_id', db.Integer, db.ForeignKey('batch.id'), primary_key=True)
+    db.Column('medicine_schedule_id', db.Integer, db.ForeignKey('medicine_schedule.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('batch_id', db.Integer, db.ForeignKey('batch.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_medicine_schedule_batches_batch', 'batch_id', 'medicine_schedule_id')
 )
 
 # Association table for many-to-many relationship between VaccineSchedule and Batch
 vaccine_schedule_batches = db.Table('vaccine_schedule_batches',
-    db.Column('vaccine_schedule_id', db.Integer, db.ForeignKey('vaccine_schedule.id'), primary_key=True),
-    db.Column('batch_id', db.Integer, db.ForeignKey('batch.id'), primary_key=True)
+    db.Column('vaccine_schedule_id', db.Integer, db.ForeignKey('vaccine_schedule.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('batch_id', db.Integer, db.ForeignKey('batch.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_vaccine_schedule_batches_batch', 'batch_id', 'vaccine_schedule_id')
 )
 
 # Association table for many-to-many relationship between HealthMaterialSchedule and Batch
 health_material_schedule_batches = db.Table('health_material_schedule_batches',
-    db.Column('health_material_schedule_id', db.Integer, db.ForeignKey('health_material_schedule.id'), primary_key=True),
-    db.Column('batch_id', db.Integer, db.ForeignKey('batch.id'), primary_key=True)
+    db.Column('health_material_schedule_id', db.Integer, db.ForeignKey('health_material_schedule.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('batch_id', db.Integer, db.ForeignKey('batch.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_health_material_schedule_batches_batch', 'batch_id', 'health_material_schedule_id')
 )
 
 class VaccineSchedule(db.Model):
@@ -372,12 +556,15 @@ class VaccineSchedule(db.Model):
     scheduled_date = db.Column(db.Date, nullable=False)
     completed = db.Column(db.Boolean, default=False)
     notes = db.Column(db.Text)
+    auto_generated = db.Column(db.Boolean, nullable=False, default=False)  # Made from an auto-schedule, replaced when it changes
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
     vaccine = db.relationship('Vaccine', backref='schedules')
     batches = db.relationship('Batch', secondary=vaccine_schedule_batches, backref='vaccine_schedules')
 
+    __table_args__ = (db.Index('ix_vaccine_schedule_date_completed', 'scheduled_date', 'completed'),)
+
 class HealthMaterial(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -395,24 +582,28 @@ class HealthMaterialSchedule(db.Model):
     scheduled_date = db.Column(db.Date, nullable=False)
     completed = db.Column(db.Boolean, default=False)
     notes = db.Column(db.Text)
+    auto_generated = db.Column(db.Boolean, nullable=False, default=False)  # Made from an auto-schedule, replaced when it changes
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
     health_material = db.relationship('HealthMaterial', backref='schedules')
     batches = db.relationship('Batch', secondary=health_material_schedule_batches, backref='health_material_schedules')
 
+    __table_args__ = (db.Index('ix_health_material_schedule_date_completed', 'scheduled_date', 'completed'),)
+
 # Association tables for batch updates
 batch_update_feeds = db.Table('batch_update_feeds',
-    db.Column('batch_update_id', db.Integer, db.ForeignKey('batch_update.id'), primary_key=True),
+    db.Column('batch_update_id', db.Integer, db.ForeignKey('batch_update.id', ondelete='CASCADE'), primary_key=True),
     db.Column('feed_id', db.Integer, db.ForeignKey('feed.id'), primary_key=True),
     db.Column('quantity', db.Float, nullable=False),
     db.Column('quantity_per_unit_at_time', db.Float, nullable=False),  # Weight per unit at time of update
     db.Column('price_at_time', db.Float, nullable=False),
-    db.Column('total_cost', db.Float, nullable=False)
+    db.Column('total_cost', db.Float, nullable=False),
+    db.Index('ix_batch_update_feeds_feed_update', 'feed_id', 'batch_update_id')
 )
 
 batch_update_items = db.Table('batch_update_items',
-    db.Column('batch_update_id', db.Integer, db.ForeignKey('batch_update.id'), primary_key=True),
+    db.Column('batch_update_id', db.Integer, db.ForeignKey('batch_update.id', ondelete='CASCADE'), primary_key=True),
     db.Column('item_id', db.Integer, nullable=False),  # ID of medicine/health_material/vaccine
     db.Column('item_type', db.String(20), nullable=False),  # 'medicine', 'health_material', or 'vaccine'
     db.Column('quantity', db.Float, nullable=False),
@@ -422,7 +613,7 @@ batch_update_items = db.Table('batch_update_items',
 
 class BatchUpdate(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id'), nullable=False)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id', ondelete='CASCADE'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.now().date)
     mortality_count = db.Column(db.Integer, nullable=False, default=0)
     feed_used = db.Column(db.Float, nullable=False, default=0)  # Feed used in packets
@@ -445,6 +636,10 @@ class BatchUpdate(db.Model):
     feed_returns = db.relationship('BatchFeedReturn', backref='batch_update', lazy=True, cascade='all, delete-orphan')
     miscellaneous_items = db.relationship('MiscellaneousItem', backref='batch_update', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('uq_batch_update_batch_date', 'batch_id', 'date', unique=True),  # One update per batch per day
+        db.Index('ix_batch_update_remarks_priority', 'remarks_priority', 'created_at'),
+    )
 
     def get_feed_quantity(self, feed_id):
         """Get the quantity of a specific feed used in this update"""
@@ -503,7 +698,7 @@ class BatchUpdate(db.Model):
 
 class BatchFeedReturn(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    batch_update_id = db.Column(db.Integer, db.ForeignKey('batch_update.id'), nullable=False)
+    batch_update_id = db.Column(db.Integer, db.ForeignKey('batch_update.id', ondelete='CASCADE'), nullable=False)
     feed_id = db.Column(db.Integer, db.ForeignKey('feed.id'), nullable=False)
     quantity = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
@@ -512,7 +707,7 @@ class BatchFeedReturn(db.Model):
 
 class BatchUpdateItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    batch_update_id = db.Column(db.Integer, db.ForeignKey('batch_update.id'), nullable=False)
+    batch_update_id = db.Column(db.Integer, db.ForeignKey('batch_update.id', ondelete='CASCADE'), nullable=False)
     item_id = db.Column(db.Integer, nullable=False)  # ID of medicine/health_material/vaccine
     item_type = db.Column(db.String(20), nullable=False)  # 'medicine', 'health_material', or 'vaccine'
     quantity = db.Column(db.Float, nullable=False)
@@ -524,19 +719,17 @@ class BatchUpdateItem(db.Model):
     dose_number = db.Column(db.Integer, nullable=True)  # For vaccines only
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
 
+    __table_args__ = (db.Index('ix_batch_update_item_update_type', 'batch_update_id', 'item_type'),)
+
     def get_item(self):
-        """Get the actual item object based on item_type and item_id"""
-        if self.item_type == 'medicine':
-            return Medicine.query.get(self.item_id)
-        elif self.item_type == 'health_material':
-            return HealthMaterial.query.get(self.item_id)
-        elif self.item_type == 'vaccine':
-            return Vaccine.query.get(self.item_id)
-        return None
+        """Get the catalog entry (see get_catalog) of the medicine, health material or vaccine used"""
+        if self.item_type not in CATALOG_MODELS:
+            return None
+        return get_catalog(self.item_type).get(self.item_id)
 
 class Harvest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id'), nullable=False)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id', ondelete='CASCADE'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.now().date)
     quantity = db.Column(db.Integer, nullable=False)
     weight = db.Column(db.Float, nullable=False)  # Weight in kg
@@ -549,6 +742,11 @@ class Harvest(db.Model):
     # Relationship
     batch = db.relationship('Batch', backref=db.backref('harvests', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_harvest_batch_date', 'batch_id', 'date'),
+        db.Index('ix_harvest_date_id', 'date', 'id'),
+    )
+
 class Activity(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     icon = db.Column(db.String(50), nullable=False)  # Font Awesome icon class
@@ -563,7 +761,7 @@ class Activity(db.Model):
 
 class MiscellaneousItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    batch_update_id = db.Column(db.Integer, db.ForeignKey('batch_update.id'), nullable=False)
+    batch_update_id = db.Column(db.Integer, db.ForeignKey('batch_update.id', ondelete='CASCADE'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     quantity_per_unit = db.Column(db.Float, nullable=False)
     unit_type = db.Column(db.String(20), nullable=False)  # e.g., 'piece', 'kg', 'litre'
@@ -578,7 +776,7 @@ class MiscellaneousItem(db.Model):
 
 class PastFeedAllocation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    batch_update_id = db.Column(db.Integer, db.ForeignKey('batch_update.id'), nullable=False)
+    batch_update_id = db.Column(db.Integer, db.ForeignKey('batch_update.id', ondelete='CASCADE'), nullable=False)
     allocation_date = db.Column(db.Date, nullable=False, default=datetime.now().date)  # Date when allocation was added
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
@@ -611,160 +809,192 @@ class FinancialSummary(db.Model):
 
     def calculate_fcr(self, batch):
         """Calculate FCR (Feed Conversion Ratio) and determine the appropriate rate"""
-        # Calculate total feed used in kg
-        total_feed_used = 0.0
-        for update in batch.updates:
-            for feed in update.feeds:
-                feed_quantity = update.get_feed_quantity(feed.id)
-                quantity_per_unit = update.get_feed_quantity_per_unit(feed.id)
-                if feed_quantity and quantity_per_unit:
-                    total_feed_used += feed_quantity * quantity_per_unit
-        print(total_feed_used)
-        # Subtract feed stock from total feed used
-        if batch.feed_stock > 0:
-            # Get the latest feed quantity per unit
-            i=-1
-            while i != -40:
-                latest_update = batch.updates[i] if batch.updates else None
-                print(latest_update)
-                print(latest_update.feeds)
-                if latest_update and latest_update.feeds:
-                    latest_feed = latest_update.feeds[0]
-                    quantity_per_unit = latest_update.get_feed_quantity_per_unit(latest_feed.id)
-                    print("quantity",quantity_per_unit)
-                    if quantity_per_unit:
-                        total_feed_used -= batch.feed_stock * quantity_per_unit
-                        break
-                else:
-                    i=i-1
-        # count = 0
-        # quantity_unit = 0
-        # for update in batch.updates:
-        #     for feed in update.feeds:
-        #         quantity_per_unit = update.get_feed_quantity_per_unit(feed.id)
-        #         if quantity_per_unit:
-        #             quantity_unit += quantity_per_unit
-        #             count += 1
-        # quantity_per_unit = quantity_unit/count
-        # total_feed_used = batch.feed_usage * quantity_per_unit
-        # print(quantity_per_unit)
-        print(batch.feed_stock)
-        print(total_feed_used)
-
-        # Calculate total weight sold
-        total_weight_sold = batch.get_total_weight_sold()
-        self.total_weight_sold = total_weight_sold
-
-        # Calculate FCR
-        if total_weight_sold > 0:
-            self.fcr_value = total_feed_used / total_weight_sold
-        else:
-            self.fcr_value = 0.0
-        self.fcr_value = round(self.fcr_value, 3)
-        print("fcr value",self.fcr_value)
-
-        # Determine FCR rate based on the calculated FCR value
-        if self.fcr_value > 0:
-            fcr_rates = FCRRate.query.order_by(FCRRate.lower_limit).all()
-            print(fcr_rates)
-            for rate in fcr_rates:
-                if self.fcr_value >= rate.lower_limit and (rate.upper_limit is None or self.fcr_value <= rate.upper_limit):
-                    self.fcr_rate = rate.rate
-                    break
-            self.fcr_price = total_weight_sold * (self.fcr_rate or 0.0)
-        else:
-            self.fcr_rate = 0.0
-            self.fcr_price = 0.0
-        print(self.fcr_rate,", ",self.fcr_price)
+        fcr = calculate_batch_fcrs([batch.id])[batch.id]
+        self.fcr_value = fcr['fcr_value']
+        self.fcr_rate = fcr['fcr_rate']
+        self.fcr_price = fcr['fcr_price']
 
     def calculate_summary(self, batch):
-        """Calculate financial summary for a batch"""
-        # Calculate feed costs from batch updates
-        feed_costs = 0
-        for update in batch.updates:
-            for feed in update.feeds:
-                feed_prices = db.session.query(batch_update_feeds.c.total_cost).filter(
-                    batch_update_feeds.c.batch_update_id == update.id,
-                    batch_update_feeds.c.feed_id == feed.id
-                ).scalar()
-                
-                if feed_prices:
-                    feed_costs += feed_prices
-                
+        """Calculate financial summary for a batch from its running ledger"""
+        ledger = get_batch_ledger(batch)
+
         # Subtract feed stock cost from total feed costs
-        feed_stock_cost = 0
-        if batch.feed_stock > 0 and batch.updates:
-            # Get the latest update with feeds
-            latest_update = None
-            for update in reversed(batch.updates):
-                if update.feeds:
-                    latest_update = update
-                    break
-            
-            if latest_update:
-                # Get the latest feed price for each feed type
-                for feed in latest_update.feeds:
-                    latest_price = db.session.query(batch_update_feeds.c.price_at_time).filter(
-                        batch_update_feeds.c.feed_id == feed.id
-                    ).order_by(batch_update_feeds.c.batch_update_id.desc()).first()
-                    
-                    if latest_price:
-                        # Calculate cost of feed stock for this feed type
-                        feed_stock_cost += latest_price[0] * batch.feed_stock
-                        break  # Since we only need one feed price for the stock
-        
-        feed_costs -= feed_stock_cost
+        feed_costs = ledger.feed_cost
+        if batch.feed_stock > 0:
+            # Price the leftover stock at the latest price of the most recently allocated feed
+            latest_feed = db.session.query(batch_update_feeds.c.feed_id).join(
+                BatchUpdate, BatchUpdate.id == batch_update_feeds.c.batch_update_id
+            ).filter(
+                BatchUpdate.batch_id == batch.id
+            ).order_by(batch_update_feeds.c.batch_update_id.desc()).first()
 
-        # Calculate medicine costs from batch updates
-        medicine_costs = 0
-        for update in batch.updates:
-            for item in update.items:
-                if item.item_type == 'medicine':
-                    medicine_costs += item.total_cost
-
-        # Calculate vaccine costs from batch updates
-        vaccine_costs = 0
-        for update in batch.updates:
-            for item in update.items:
-                if item.item_type == 'vaccine':
-                    vaccine_costs += item.total_cost
-
-        # Calculate health material costs from batch updates
-        health_material_costs = 0
-        for update in batch.updates:
-            for item in update.items:
-                if item.item_type == 'health_material':
-                    health_material_costs += item.total_cost
-
-        # Calculate miscellaneous costs from batch updates
-        misc_costs = 0
-        for update in batch.updates:
-            for misc_item in update.miscellaneous_items:
-                misc_costs += misc_item.total_cost
+            if latest_feed:
+                latest_price = db.session.query(batch_update_feeds.c.price_at_time).filter(
+                    batch_update_feeds.c.feed_id == latest_feed[0]
+                ).order_by(batch_update_feeds.c.batch_update_id.desc()).first()
+                if latest_price:
+                    feed_costs -= latest_price[0] * batch.feed_stock
 
         # Calculate total bird cost
-        bird_cost = (batch.total_birds - batch.extra_chicks) * batch.cost_per_chicken
+        bird_cost = ledger.get_bird_cost()
 
         # Calculate FCR and determine rate
         self.calculate_fcr(batch)
 
-        # Calculate total revenue from harvests
-        total_revenue = sum(harvest.total_value for harvest in batch.harvests)
-
         # Calculate total profit
-        total_profit = total_revenue - (feed_costs + medicine_costs + vaccine_costs + 
-                                      health_material_costs + misc_costs + bird_cost + (self.fcr_price or 0))
+        total_profit = ledger.revenue - (feed_costs + ledger.medicine_cost + ledger.vaccine_cost +
+                                         ledger.health_material_cost + ledger.miscellaneous_cost +
+                                         bird_cost + (self.fcr_price or 0))
 
         # Update the summary
         self.total_feed_cost = feed_costs
-        self.total_medicine_cost = medicine_costs
-        self.total_vaccine_cost = vaccine_costs
-        self.total_health_material_cost = health_material_costs
-        self.total_miscellaneous_cost = misc_costs
+        self.total_medicine_cost = ledger.medicine_cost
+        self.total_vaccine_cost = ledger.vaccine_cost
+        self.total_health_material_cost = ledger.health_material_cost
+        self.total_miscellaneous_cost = ledger.miscellaneous_cost
         self.total_bird_cost = bird_cost
-        self.total_revenue = total_revenue
+        self.total_revenue = ledger.revenue
         self.total_profit = total_profit
 
+class BatchLedger(db.Model):
+    """Running financial totals for a batch, kept up to date by every write path"""
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id', ondelete='CASCADE'), unique=True, nullable=False)
+    feed_packets = db.Column(db.Float, nullable=False, default=0.0)  # Feed delivered in packets
+    feed_kg = db.Column(db.Float, nullable=False, default=0.0)  # Feed delivered in kg
+    feed_cost = db.Column(db.Float, nullable=False, default=0.0)  # At the price stored with each allocation
+    returned_packets = db.Column(db.Float, nullable=False, default=0.0)
+    returned_kg = db.Column(db.Float, nullable=False, default=0.0)
+    medicine_cost = db.Column(db.Float, nullable=False, default=0.0)
+    vaccine_cost = db.Column(db.Float, nullable=False, default=0.0)
+    health_material_cost = db.Column(db.Float, nullable=False, default=0.0)
+    miscellaneous_cost = db.Column(db.Float, nullable=False, default=0.0)
+    harvested_birds = db.Column(db.Integer, nullable=False, default=0)
+    weight_sold = db.Column(db.Float, nullable=False, default=0.0)  # in kg
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    frozen = db.Column(db.Boolean, nullable=False, default=False)  # Set when the batch is closed
+    frozen_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    # Relationship
+    batch = db.relationship('Batch', backref=db.backref('ledger', uselist=False, cascade='all, delete-orphan'))
+
+    def apply(self, delta, sign=1):
+        """Add (sign=1) or remove (sign=-1) a set of ledger values.
+
+        A frozen ledger only changes through corrections to a closed batch
+        (editing or deleting its updates and harvests); each one is logged
+        and queues a rebuild of the batch's financial summary.
+        """
+        if not any(delta.values()):
+            return
+        if self.frozen:
+            print(f"Changing the frozen ledger of closed batch {self.batch_id}: {delta}")
+            enqueue_job('calculate_summary', batch_id=self.batch_id)
+        for field, value in delta.items():
+            setattr(self, field, (getattr(self, field) or 0) + sign * (value or 0))
+
+    def get_values(self):
+        return {field: getattr(self, field) or 0 for field in LEDGER_FIELDS}
+
+    def freeze(self):
+        self.frozen = True
+        self.frozen_at = datetime.now()
+
+    def unfreeze(self):
+        self.frozen = False
+        self.frozen_at = None
+
+    def get_bird_cost(self):
+        return (self.batch.total_birds - self.batch.extra_chicks) * self.batch.cost_per_chicken
+
+    def get_total_expenses(self):
+        return (self.feed_cost + self.medicine_cost + self.vaccine_cost + self.health_material_cost +
+                self.miscellaneous_cost + self.get_bird_cost())
+
+    def get_feed_used_kg(self):
+        """Feed delivered minus returns and the stock still on the farm, in kg"""
+        stock_kg = 0.0
+        if self.batch.feed_stock > 0 and self.feed_packets > 0:
+            stock_kg = self.batch.feed_stock * (self.feed_kg / self.feed_packets)
+        return max(0.0, self.feed_kg - self.returned_kg - stock_kg)
+
+    def get_live_fcr(self):
+        if self.weight_sold > 0:
+            return round(self.get_feed_used_kg() / self.weight_sold, 3)
+        return 0.0
+
+    def get_live_profit(self):
+        """Revenue minus expenses so far (before the farmer's FCR payment)"""
+        return self.revenue - self.get_total_expenses()
+
+class BatchDailyMetric(db.Model):
+    """Precomputed per-day series for a batch, rebuilt from the changed day onwards"""
+    __tablename__ = 'batch_daily_metrics'
+    __table_args__ = (db.UniqueConstraint('batch_id', 'date', name='uq_batch_daily_metrics_batch_date'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id', ondelete='CASCADE'), nullable=False, index=True)
+    date = db.Column(db.Date, nullable=False)
+    age_days = db.Column(db.Integer, nullable=False, default=0)
+    mortality = db.Column(db.Integer, nullable=False, default=0)  # Deaths on this day
+    cumulative_mortality = db.Column(db.Integer, nullable=False, default=0)
+    birds_alive = db.Column(db.Integer, nullable=False, default=0)  # Birds placed minus cumulative mortality
+    feed_delivered_packets = db.Column(db.Float, nullable=False, default=0.0)  # Cumulative
+    feed_delivered_kg = db.Column(db.Float, nullable=False, default=0.0)  # Cumulative
+    feed_used_kg = db.Column(db.Float, nullable=False, default=0.0)  # Cumulative
+    feed_returned_kg = db.Column(db.Float, nullable=False, default=0.0)  # Cumulative
+    avg_weight = db.Column(db.Float, nullable=False, default=0.0)  # in kg
+    male_weight = db.Column(db.Float, nullable=False, default=0.0)
+    female_weight = db.Column(db.Float, nullable=False, default=0.0)
+    daily_gain = db.Column(db.Float, nullable=False, default=0.0)  # Change in average weight since the previous row
+    daily_cost = db.Column(db.Float, nullable=False, default=0.0)  # Feed, items and miscellaneous spent on this day
+    running_cost = db.Column(db.Float, nullable=False, default=0.0)  # Chicks cost plus every daily cost so far
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    # Relationship
+    batch = db.relationship('Batch', backref=db.backref('daily_metrics', lazy=True, order_by='BatchDailyMetric.date',
+                                                        cascade='all, delete-orphan'))
+
+    def to_dict(self):
+        return {
+            'date': self.date.strftime('%Y-%m-%d'),
+            'age_days': self.age_days,
+            'mortality': self.mortality,
+            'cumulative_mortality': self.cumulative_mortality,
+            'birds_alive': self.birds_alive,
+            'feed_delivered_kg': round(self.feed_delivered_kg, 2),
+            'feed_used_kg': round(self.feed_used_kg, 2),
+            'feed_returned_kg': round(self.feed_returned_kg, 2),
+            'avg_weight': self.avg_weight,
+            'male_weight': self.male_weight,
+            'female_weight': self.female_weight,
+            'daily_gain': round(self.daily_gain, 3),
+            'daily_cost': round(self.daily_cost, 2),
+            'running_cost': round(self.running_cost, 2)
+        }
+
+# Farm report figures per farm and period over closed batches, kept current on flush (see refresh_farm_report_cube)
+farm_report_cube = db.Table('farm_report_cube',
+    db.Column('farm_id', db.Integer, db.ForeignKey('farm.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('period', db.String(10), primary_key=True),  # 'all', '2025', '2025-Q1' or '2025-03'
+    db.Column('period_type', db.String(10), nullable=False),  # 'all', 'year', 'quarter' or 'month'
+    db.Column('batch_count', db.Integer, nullable=False, default=0),
+    db.Column('total_profit', db.Float, nullable=False, default=0.0),  # Sum of the profitable batches
+    db.Column('total_loss', db.Float, nullable=False, default=0.0),  # Sum of the loss-making batches (negative)
+    db.Column('net_profit', db.Float, nullable=False, default=0.0),
+    db.Column('total_expenses', db.Float, nullable=False, default=0.0),
+    db.Column('avg_mortality_rate', db.Float, nullable=False, default=0.0),  # Percent
+    db.Column('avg_fcr', db.Float, nullable=False, default=0.0),
+    db.Column('best_batch_id', db.Integer, nullable=True),
+    db.Column('best_batch_number', db.String(50), nullable=True),
+    db.Column('best_batch_profit', db.Float, nullable=True),
+    db.Column('best_manager_id', db.Integer, nullable=True),
+    db.Column('updated_at', db.DateTime, nullable=False, default=datetime.now),
+    db.Index('ix_farm_report_cube_period_net_profit', 'period', 'net_profit')
+)
+
 class FCRRate(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     lower_limit = db.Column(db.Float, nullable=False)
@@ -780,23 +1010,2442 @@ class AutoSchedule(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     item_type = db.Column(db.String(20), nullable=False)  # 'medicine', 'vaccine', or 'health_material'
     item_id = db.Column(db.Integer, nullable=False)
-    schedule_ages = db.Column(db.Text, nullable=False)  # JSON string of ages in days
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    ages = db.relationship('AutoScheduleAge', backref='auto_schedule', lazy='selectin',
+                           order_by='AutoScheduleAge.position', cascade='all, delete-orphan')
+
     def get_schedule_ages(self):
-        try:
-            ages = json.loads(self.schedule_ages)
-            # Ensure all ages are integers
-            return [int(age) for age in ages if age is not None]
-        except (json.JSONDecodeError, TypeError, ValueError):
-            return []
+        return [age.age_days for age in self.ages]
 
     def set_schedule_ages(self, ages):
         # Ensure all ages are integers and filter out None values
         valid_ages = [int(age) for age in ages if age is not None]
-        self.schedule_ages = json.dumps(valid_ages)
+        rows = list(self.ages)
+        for position, age in enumerate(valid_ages):
+            if position < len(rows):
+                rows[position].age_days = age
+            else:
+                self.ages.append(AutoScheduleAge(position=position, age_days=age))
+        for row in rows[len(valid_ages):]:
+            self.ages.remove(row)
+
+    # JSON string accessors kept for older callers
+    @property
+    def schedule_ages(self):
+        return json.dumps(self.get_schedule_ages())
+
+    @schedule_ages.setter
+    def schedule_ages(self, value):
+        self.set_schedule_ages(json.loads(value) if value else [])
+
+class AutoScheduleAge(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    auto_schedule_id = db.Column(db.Integer, db.ForeignKey('auto_schedule.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    age_days = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('auto_schedule_id', 'position', name='uq_auto_schedule_age_position'),)
+
+class Job(db.Model):
+    """A unit of background work, run by the job workers (see work_jobs)"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # Key into JOB_HANDLERS
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments for the handler
+    dedupe_key = db.Column(db.String(255), nullable=True)  # Kind plus payload, folds repeated requests into one queued job
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'succeeded', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    result = db.Column(db.Text, nullable=True)  # JSON returned by the handler
+    error = db.Column(db.Text, nullable=True)
+    worker = db.Column(db.String(100), nullable=True)  # host:pid:thread of the worker that ran it last
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.now)  # Pushed back between retries
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+        db.Index('ix_job_dedupe_key_status', 'dedupe_key', 'status'),
+    )
+
+    def get_payload(self):
+        return json.loads(self.payload) if self.payload else {}
+
+    def get_result(self):
+        return json.loads(self.result) if self.result else None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'result': self.get_result(),
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class SyncOperation(db.Model):
+    """A write replayed from a device's offline queue, kept so that sending it again does not apply it twice"""
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(64), nullable=False, unique=True)  # Idempotency key generated on the device
+    kind = db.Column(db.String(50), nullable=False)  # Key into SYNC_OPERATION_SCHEMAS
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
+    result = db.Column(db.Text, nullable=False)  # JSON result first reported, returned again for a resent key
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+# Batch cost engine
+COST_ENGINE_CHUNK_SIZE = 500  # Keep IN lists well below SQLite's bound parameter limit
+
+def _empty_batch_costs():
+    return {
+        'feed_packets': 0.0,
+        'feed_kg': 0.0,
+        'feed_cost': 0.0,
+        'feed_cost_at_time': 0.0,
+        'medicine_cost': 0.0,
+        'vaccine_cost': 0.0,
+        'health_material_cost': 0.0,
+        'miscellaneous_cost': 0.0
+    }
+
+def get_batch_costs(batch_ids):
+    """Get every cost component for a list of batches with grouped SQL aggregates.
+
+    Returns a dict keyed by batch id. 'feed_cost' prices feed at the current
+    Feed.price (as the batch pages always showed it) while 'feed_cost_at_time'
+    uses the price stored with each allocation. Item costs come from the
+    total_cost recorded on each BatchUpdateItem / MiscellaneousItem.
+    """
+    batch_ids = list(dict.fromkeys(batch_ids))
+    costs = {batch_id: _empty_batch_costs() for batch_id in batch_ids}
+
+    for start in range(0, len(batch_ids), COST_ENGINE_CHUNK_SIZE):
+        chunk = batch_ids[start:start + COST_ENGINE_CHUNK_SIZE]
+
+        # Feed allocations: packets delivered and cost, one row per batch
+        feed_rows = db.session.query(
+            BatchUpdate.batch_id,
+            func.sum(batch_update_feeds.c.quantity),
+            func.sum(batch_update_feeds.c.quantity * batch_update_feeds.c.quantity_per_unit_at_time),
+            func.sum(batch_update_feeds.c.quantity * func.coalesce(Feed.price, 0)),
+            func.sum(batch_update_feeds.c.total_cost)
+        ).join(
+            batch_update_feeds, batch_update_feeds.c.batch_update_id == BatchUpdate.id
+        ).outerjoin(
+            Feed, Feed.id == batch_update_feeds.c.feed_id
+        ).filter(
+            BatchUpdate.batch_id.in_(chunk)
+        ).group_by(BatchUpdate.batch_id).all()
+        for batch_id, packets, feed_kg, feed_cost, feed_cost_at_time in feed_rows:
+            costs[batch_id]['feed_packets'] = packets or 0.0
+            costs[batch_id]['feed_kg'] = feed_kg or 0.0
+            costs[batch_id]['feed_cost'] = feed_cost or 0.0
+            costs[batch_id]['feed_cost_at_time'] = feed_cost_at_time or 0.0
+
+        # Medicines, vaccines and health materials, one row per batch and item type
+        item_rows = db.session.query(
+            BatchUpdate.batch_id,
+            BatchUpdateItem.item_type,
+            func.sum(BatchUpdateItem.total_cost)
+        ).join(
+            BatchUpdateItem, BatchUpdateItem.batch_update_id == BatchUpdate.id
+        ).filter(
+            BatchUpdate.batch_id.in_(chunk)
+        ).group_by(BatchUpdate.batch_id, BatchUpdateItem.item_type).all()
+        for batch_id, item_type, total_cost in item_rows:
+            key = f'{item_type}_cost'
+            if key in costs[batch_id]:
+                costs[batch_id][key] = total_cost or 0.0
+
+        # Miscellaneous items
+        misc_rows = db.session.query(
+            BatchUpdate.batch_id,
+            func.sum(MiscellaneousItem.total_cost)
+        ).join(
+            MiscellaneousItem, MiscellaneousItem.batch_update_id == BatchUpdate.id
+        ).filter(
+            BatchUpdate.batch_id.in_(chunk)
+        ).group_by(BatchUpdate.batch_id).all()
+        for batch_id, total_cost in misc_rows:
+            costs[batch_id]['miscellaneous_cost'] = total_cost or 0.0
+
+    return costs
+
+# Batch ledger maintenance
+LEDGER_UPDATE_FIELDS = ('feed_packets', 'feed_kg', 'feed_cost', 'returned_packets', 'returned_kg',
+                        'medicine_cost', 'vaccine_cost', 'health_material_cost', 'miscellaneous_cost')
+LEDGER_HARVEST_FIELDS = ('harvested_birds', 'weight_sold', 'revenue')
+LEDGER_FIELDS = LEDGER_UPDATE_FIELDS + LEDGER_HARVEST_FIELDS
+
+def get_update_ledger_delta(update_id):
+    """Get the ledger values contributed by a single batch update"""
+    delta = dict.fromkeys(LEDGER_UPDATE_FIELDS, 0.0)
+    if update_id is None:
+        return delta
+
+    feed_row = db.session.query(
+        func.sum(batch_update_feeds.c.quantity),
+        func.sum(batch_update_feeds.c.quantity * batch_update_feeds.c.quantity_per_unit_at_time),
+        func.sum(batch_update_feeds.c.total_cost)
+    ).filter(batch_update_feeds.c.batch_update_id == update_id).one()
+    delta['feed_packets'] = feed_row[0] or 0.0
+    delta['feed_kg'] = feed_row[1] or 0.0
+    delta['feed_cost'] = feed_row[2] or 0.0
+
+    return_row = db.session.query(
+        func.sum(BatchFeedReturn.quantity),
+        func.sum(BatchFeedReturn.quantity * func.coalesce(Feed.weight, 0))
+    ).outerjoin(Feed, Feed.id == BatchFeedReturn.feed_id).filter(
+        BatchFeedReturn.batch_update_id == update_id
+    ).one()
+    delta['returned_packets'] = return_row[0] or 0.0
+    delta['returned_kg'] = return_row[1] or 0.0
+
+    item_rows = db.session.query(
+        BatchUpdateItem.item_type,
+        func.sum(BatchUpdateItem.total_cost)
+    ).filter(BatchUpdateItem.batch_update_id == update_id).group_by(BatchUpdateItem.item_type).all()
+    for item_type, total_cost in item_rows:
+        key = f'{item_type}_cost'
+        if key in delta:
+            delta[key] = total_cost or 0.0
+
+    delta['miscellaneous_cost'] = db.session.query(
+        func.sum(MiscellaneousItem.total_cost)
+    ).filter(MiscellaneousItem.batch_update_id == update_id).scalar() or 0.0
+    return delta
+
+def get_harvest_ledger_delta(harvest):
+    return {
+        'harvested_birds': harvest.quantity or 0,
+        'weight_sold': harvest.weight or 0.0,
+        'revenue': harvest.total_value or 0.0
+    }
+
+def record_harvest(batch, date, quantity, weight, selling_price, notes=''):
+    """Add a harvest to a batch, with its ledger totals, remaining birds and status"""
+    harvest = Harvest(
+        batch_id=batch.id,
+        date=date,
+        quantity=quantity,
+        weight=weight,
+        selling_price=selling_price,
+        total_value=weight * selling_price,
+        notes=notes
+    )
+    db.session.add(harvest)
+    get_batch_ledger(batch).apply(get_harvest_ledger_delta(harvest))
+    batch.available_birds -= quantity
+    batch.check_and_update_status()
+    return harvest
+
+def subtract_ledger_delta(new, old):
+    return {field: new.get(field, 0) - old.get(field, 0) for field in set(new) | set(old)}
+
+def compute_batch_ledger_values(batch_ids):
+    """Recompute ledger values from scratch for a list of batches"""
+    batch_ids = list(dict.fromkeys(batch_ids))
+    costs = get_batch_costs(batch_ids)
+    values = {}
+    for batch_id in batch_ids:
+        batch_costs = costs[batch_id]
+        values[batch_id] = dict.fromkeys(LEDGER_FIELDS, 0.0)
+        values[batch_id].update({
+            'feed_packets': batch_costs['feed_packets'],
+            'feed_kg': batch_costs['feed_kg'],
+            'feed_cost': batch_costs['feed_cost_at_time'],
+            'medicine_cost': batch_costs['medicine_cost'],
+            'vaccine_cost': batch_costs['vaccine_cost'],
+            'health_material_cost': batch_costs['health_material_cost'],
+            'miscellaneous_cost': batch_costs['miscellaneous_cost']
+        })
+
+    for start in range(0, len(batch_ids), COST_ENGINE_CHUNK_SIZE):
+        chunk = batch_ids[start:start + COST_ENGINE_CHUNK_SIZE]
+        return_rows = db.session.query(
+            BatchUpdate.batch_id,
+            func.sum(BatchFeedReturn.quantity),
+            func.sum(BatchFeedReturn.quantity * func.coalesce(Feed.weight, 0))
+        ).join(
+            BatchFeedReturn, BatchFeedReturn.batch_update_id == BatchUpdate.id
+        ).outerjoin(
+            Feed, Feed.id == BatchFeedReturn.feed_id
+        ).filter(BatchUpdate.batch_id.in_(chunk)).group_by(BatchUpdate.batch_id).all()
+        for batch_id, packets, kg in return_rows:
+            values[batch_id]['returned_packets'] = packets or 0.0
+            values[batch_id]['returned_kg'] = kg or 0.0
+
+        harvest_rows = db.session.query(
+            Harvest.batch_id,
+            func.sum(Harvest.quantity),
+            func.sum(Harvest.weight),
+            func.sum(Harvest.total_value)
+        ).filter(Harvest.batch_id.in_(chunk)).group_by(Harvest.batch_id).all()
+        for batch_id, birds, weight, revenue in harvest_rows:
+            values[batch_id]['harvested_birds'] = birds or 0
+            values[batch_id]['weight_sold'] = weight or 0.0
+            values[batch_id]['revenue'] = revenue or 0.0
+    return values
+
+def get_batch_ledger(batch):
+    """Get the running ledger for a batch, building it from scratch the first time"""
+    ledger = batch.ledger
+    if ledger is None:
+        # Computed before the ledger joins the session, whose autoflush would otherwise insert it half-built
+        values = compute_batch_ledger_values([batch.id])[batch.id] if batch.id is not None else {}
+        ledger = BatchLedger(batch=batch, frozen=batch.status == 'closed', **values)
+        db.session.add(ledger)
+    return ledger
+
+def find_ledger_drift(batch_ids=None, tolerance=0.01):
+    """Compare stored ledgers with a from-scratch recomputation.
+
+    Returns a list of (batch, field, stored, expected) tuples for every
+    value that is off by more than the tolerance, including batches whose
+    ledger has not been created yet.
+    """
+    query = Batch.query.options(joinedload(Batch.ledger))
+    if batch_ids is not None:
+        query = query.filter(Batch.id.in_(batch_ids))
+    batches = query.all()
+    expected = compute_batch_ledger_values([batch.id for batch in batches])
+    drift = []
+    for batch in batches:
+        stored = batch.ledger.get_values() if batch.ledger else dict.fromkeys(LEDGER_FIELDS, 0.0)
+        for field in LEDGER_FIELDS:
+            if abs(stored[field] - expected[batch.id][field]) > tolerance:
+                drift.append((batch, field, stored[field], expected[batch.id][field]))
+    return drift
+
+def rebuild_batch_ledger(batch):
+    """Overwrite a batch ledger with values recomputed from scratch"""
+    ledger = get_batch_ledger(batch)
+    for field, value in compute_batch_ledger_values([batch.id])[batch.id].items():
+        setattr(ledger, field, value)
+    return ledger
+
+# FCR calculation
+def get_fcr_rate_bands():
+    """Load the FCR rate bands once, sorted by lower limit for binary search"""
+    rates = FCRRate.query.order_by(FCRRate.lower_limit, FCRRate.id).all()
+    return ([rate.lower_limit for rate in rates], [rate.upper_limit for rate in rates], [rate.rate for rate in rates])
+
+def find_fcr_rate(fcr_value, bands):
+    """Find the rate of the first band containing fcr_value, or None"""
+    lower_limits, upper_limits, rates = bands
+    index = bisect.bisect_right(lower_limits, fcr_value) - 1
+    if index < 0:
+        return None
+    # A value sitting on a shared boundary belongs to the lower band
+    while index > 0 and upper_limits[index - 1] is not None and fcr_value <= upper_limits[index - 1]:
+        index -= 1
+    if upper_limits[index] is None or fcr_value <= upper_limits[index]:
+        return rates[index]
+    return None
+
+def calculate_batch_fcrs(batch_ids, bands=None):
+    """Calculate FCR, rate and farmer price for many batches at once.
+
+    Feed rows are loaded per chunk in a single query as columns (batch id,
+    quantity, kg per packet) ordered by update date. Feed used is delivered kg
+    minus returned kg minus the stock still on the farm, with the stock valued
+    at the kg per packet of the most recent allocation.
+    """
+    batch_ids = list(dict.fromkeys(batch_ids))
+    if bands is None:
+        bands = get_fcr_rate_bands()
+    results = {}
+
+    for start in range(0, len(batch_ids), COST_ENGINE_CHUNK_SIZE):
+        chunk = batch_ids[start:start + COST_ENGINE_CHUNK_SIZE]
+
+        feed_rows = db.session.query(
+            BatchUpdate.batch_id,
+            batch_update_feeds.c.quantity,
+            batch_update_feeds.c.quantity_per_unit_at_time
+        ).join(
+            batch_update_feeds, batch_update_feeds.c.batch_update_id == BatchUpdate.id
+        ).filter(
+            BatchUpdate.batch_id.in_(chunk)
+        ).order_by(BatchUpdate.batch_id, BatchUpdate.date, BatchUpdate.id).all()
+        row_batch_ids = [row[0] for row in feed_rows]
+        quantities = [row[1] or 0.0 for row in feed_rows]
+        kg_per_packet = [row[2] or 0.0 for row in feed_rows]
+        feed_kg = [quantity * kg for quantity, kg in zip(quantities, kg_per_packet)]
+
+        delivered_kg = dict.fromkeys(chunk, 0.0)
+        latest_kg_per_packet = dict.fromkeys(chunk, 0.0)
+        for batch_id, kg, per_packet in zip(row_batch_ids, feed_kg, kg_per_packet):
+            delivered_kg[batch_id] += kg
+            if per_packet:
+                latest_kg_per_packet[batch_id] = per_packet
+
+        returned_kg = dict(db.session.query(
+            BatchUpdate.batch_id,
+            func.sum(BatchFeedReturn.quantity * func.coalesce(Feed.weight, 0))
+        ).join(
+            BatchFeedReturn, BatchFeedReturn.batch_update_id == BatchUpdate.id
+        ).outerjoin(
+            Feed, Feed.id == BatchFeedReturn.feed_id
+        ).filter(BatchUpdate.batch_id.in_(chunk)).group_by(BatchUpdate.batch_id).all())
+
+        weight_sold = dict(db.session.query(
+            Harvest.batch_id,
+            func.sum(Harvest.weight)
+        ).filter(Harvest.batch_id.in_(chunk)).group_by(Harvest.batch_id).all())
+
+        feed_stock = dict(db.session.query(Batch.id, Batch.feed_stock).filter(Batch.id.in_(chunk)).all())
+
+        for batch_id in chunk:
+            stock_kg = max(0.0, feed_stock.get(batch_id) or 0.0) * latest_kg_per_packet[batch_id]
+            feed_used_kg = max(0.0, delivered_kg[batch_id] - (returned_kg.get(batch_id) or 0.0) - stock_kg)
+            total_weight_sold = weight_sold.get(batch_id) or 0.0
+            fcr_value = round(feed_used_kg / total_weight_sold, 3) if total_weight_sold > 0 else 0.0
+            fcr_rate = (find_fcr_rate(fcr_value, bands) or 0.0) if fcr_value > 0 else 0.0
+            results[batch_id] = {
+                'delivered_kg': delivered_kg[batch_id],
+                'returned_kg': returned_kg.get(batch_id) or 0.0,
+                'stock_kg': stock_kg,
+                'feed_used_kg': feed_used_kg,
+                'weight_sold': total_weight_sold,
+                'fcr_value': fcr_value,
+                'fcr_rate': fcr_rate,
+                'fcr_price': total_weight_sold * fcr_rate
+            }
+    return results
+
+# Daily batch metrics
+def refresh_batch_daily_metrics(batch, from_date=None):
+    """Rebuild the daily metrics of a batch from from_date onwards.
+
+    Rows before from_date are kept and their cumulative values carried
+    forward, so a change to a recent update only rewrites the tail of the
+    series. Without from_date (or when no earlier row exists) the whole
+    series is rebuilt.
+    """
+    db.session.flush()
+    previous = None
+    if from_date is not None:
+        previous = BatchDailyMetric.query.filter(
+            BatchDailyMetric.batch_id == batch.id,
+            BatchDailyMetric.date < from_date
+        ).order_by(BatchDailyMetric.date.desc()).first()
+        if previous is None:
+            from_date = None
+
+    stale = BatchDailyMetric.query.filter(BatchDailyMetric.batch_id == batch.id)
+    updates = BatchUpdate.query.filter(BatchUpdate.batch_id == batch.id)
+    if from_date is not None:
+        stale = stale.filter(BatchDailyMetric.date >= from_date)
+        updates = updates.filter(BatchUpdate.date >= from_date)
+    stale.delete(synchronize_session=False)
+    updates = updates.order_by(BatchUpdate.date, BatchUpdate.id).all()
+    update_ids = [update.id for update in updates]
+
+    feed_totals = {}
+    return_totals = {}
+    item_totals = {}
+    misc_totals = {}
+    for start in range(0, len(update_ids), COST_ENGINE_CHUNK_SIZE):
+        chunk = update_ids[start:start + COST_ENGINE_CHUNK_SIZE]
+        for update_id, packets, kg, cost in db.session.query(
+            batch_update_feeds.c.batch_update_id,
+            func.sum(batch_update_feeds.c.quantity),
+            func.sum(batch_update_feeds.c.quantity * batch_update_feeds.c.quantity_per_unit_at_time),
+            func.sum(batch_update_feeds.c.total_cost)
+        ).filter(batch_update_feeds.c.batch_update_id.in_(chunk)).group_by(batch_update_feeds.c.batch_update_id):
+            feed_totals[update_id] = (packets or 0.0, kg or 0.0, cost or 0.0)
+        return_totals.update(db.session.query(
+            BatchFeedReturn.batch_update_id,
+            func.sum(BatchFeedReturn.quantity * func.coalesce(Feed.weight, 0))
+        ).outerjoin(Feed, Feed.id == BatchFeedReturn.feed_id).filter(
+            BatchFeedReturn.batch_update_id.in_(chunk)
+        ).group_by(BatchFeedReturn.batch_update_id).all())
+        item_totals.update(db.session.query(
+            BatchUpdateItem.batch_update_id,
+            func.sum(BatchUpdateItem.total_cost)
+        ).filter(BatchUpdateItem.batch_update_id.in_(chunk)).group_by(BatchUpdateItem.batch_update_id).all())
+        misc_totals.update(db.session.query(
+            MiscellaneousItem.batch_update_id,
+            func.sum(MiscellaneousItem.total_cost)
+        ).filter(MiscellaneousItem.batch_update_id.in_(chunk)).group_by(MiscellaneousItem.batch_update_id).all())
+
+    if previous is not None:
+        cumulative_mortality = previous.cumulative_mortality
+        delivered_packets = previous.feed_delivered_packets
+        delivered_kg = previous.feed_delivered_kg
+        used_kg = previous.feed_used_kg
+        returned_kg = previous.feed_returned_kg
+        running_cost = previous.running_cost
+        last_avg_weight = previous.avg_weight
+    else:
+        cumulative_mortality = 0
+        delivered_packets = delivered_kg = used_kg = returned_kg = 0.0
+        running_cost = (batch.total_birds - batch.extra_chicks) * batch.cost_per_chicken
+        last_avg_weight = 0.0
+
+    start_date = batch.created_at.date()
+    metrics = []
+    for update in updates:
+        packets, kg, feed_cost = feed_totals.get(update.id, (0.0, 0.0, 0.0))
+        delivered_packets += packets
+        delivered_kg += kg
+        kg_per_packet = delivered_kg / delivered_packets if delivered_packets else 0.0
+        used_kg += (update.feed_used or 0) * kg_per_packet
+        returned_kg += return_totals.get(update.id) or 0.0
+        cumulative_mortality += update.mortality_count or 0
+        daily_cost = feed_cost + (item_totals.get(update.id) or 0.0) + (misc_totals.get(update.id) or 0.0)
+        running_cost += daily_cost
+
+        # Two updates on the same day share one row
+        if metrics and metrics[-1]['date'] == update.date:
+            metric = metrics[-1]
+            metric['mortality'] += update.mortality_count or 0
+            metric['daily_cost'] += daily_cost
+        else:
+            metric = {'batch_id': batch.id, 'date': update.date, 'age_days': (update.date - start_date).days + 1,
+                      'mortality': update.mortality_count or 0, 'daily_cost': daily_cost}
+            metrics.append(metric)
+        avg_weight = update.avg_weight or 0.0
+        metric.update({
+            'cumulative_mortality': cumulative_mortality,
+            'birds_alive': batch.total_birds - cumulative_mortality,
+            'feed_delivered_packets': delivered_packets,
+            'feed_delivered_kg': delivered_kg,
+            'feed_used_kg': used_kg,
+            'feed_returned_kg': returned_kg,
+            'avg_weight': avg_weight,
+            'male_weight': update.male_weight or 0.0,
+            'female_weight': update.female_weight or 0.0,
+            'daily_gain': avg_weight - last_avg_weight if avg_weight and last_avg_weight else 0.0,
+            'running_cost': running_cost
+        })
+        if avg_weight:
+            last_avg_weight = avg_weight
+
+    # One executemany instead of an INSERT per row to fetch each new id
+    if metrics:
+        db.session.execute(insert(BatchDailyMetric), metrics)
+    db.session.expire(batch, ['daily_metrics'])
+    return metrics
+
+def get_batch_daily_metrics(batch):
+    """Get the daily metrics series of a batch, materializing it on first use.
+
+    The first use is usually a GET, whose deferred read transaction cannot
+    be upgraded to a write once another writer has committed. The series is
+    built in a write transaction of its own instead, in a separate session
+    so the objects the caller has loaded are left as they are.
+    """
+    metrics = BatchDailyMetric.query.filter_by(batch_id=batch.id).order_by(BatchDailyMetric.date).all()
+    if metrics or not BatchUpdate.query.filter_by(batch_id=batch.id).first():
+        return metrics
+    batch_id = batch.id
+    with app.app_context(), write_transactions():
+        # Another request may have built it while this one waited for the write lock
+        if not BatchDailyMetric.query.filter_by(batch_id=batch_id).first():
+            refresh_batch_daily_metrics(db.session.get(Batch, batch_id))
+            db.session.commit()
+        return BatchDailyMetric.query.filter_by(batch_id=batch_id).order_by(BatchDailyMetric.date).all()
+
+# Dashboard aggregation
+DASHBOARD_CACHE_TTL = 60  # seconds
+DASHBOARD_CACHED_MODELS = (Farm, Batch, BatchUpdate, Harvest, FinancialSummary, BatchLedger, BatchDailyMetric,
+                           MedicineSchedule, VaccineSchedule, HealthMaterialSchedule)
+_dashboard_cache = {}
+_dashboard_generation = 0  # Bumped by every invalidation
+
+def invalidate_dashboard_cache():
+    global _dashboard_generation
+    _dashboard_generation += 1
+    _dashboard_cache.clear()
+
+def get_month_buckets(column, months):
+    """CASE numbering the months a datetime column falls in, and the filter covering them all.
+
+    Both are plain range comparisons on the column, so they use its index
+    and behave the same on every database, unlike extract() or strftime().
+    """
+    starts = [datetime(year, month, 1) for year, month in months]
+    last_year, last_month = months[-1]
+    starts.append(datetime(last_year + last_month // 12, last_month % 12 + 1, 1))
+    bucket = case(*[((column >= starts[i]) & (column < starts[i + 1]), i) for i in range(len(months))])
+    return bucket, (column >= starts[0]) & (column < starts[-1])
+
+def compute_dashboard_data():
+    """Compute every dashboard widget figure with a handful of grouped queries"""
+    now = datetime.now()
+    today = now.date()
+    month_start = today.replace(day=1)
+
+    farms_count = db.session.query(func.count(Farm.id)).scalar() or 0
+
+    # Batch counts and available birds per status
+    batch_status_counts = {'ongoing': 0, 'closing': 0, 'closed': 0}
+    total_birds = 0
+    for status, count, birds in db.session.query(
+        Batch.status, func.count(Batch.id), func.coalesce(func.sum(Batch.available_birds), 0)
+    ).group_by(Batch.status):
+        batch_status_counts[status] = count
+        if status in ('ongoing', 'closing'):
+            total_birds += birds
+
+    # Pending schedules across all three schedule tables via the schedule_entries view
+    pending_schedules_count = db.session.execute(select(func.count()).select_from(schedule_entries).where(
+        schedule_entries.c.completed == False
+    )).scalar()
+
+    # Profit and FCR for the last 12 months, one grouped scan
+    months = [(today.year if today.month - i > 0 else today.year - 1,
+               (today.month - i - 1) % 12 + 1) for i in range(11, -1, -1)]
+    bucket, month_range = get_month_buckets(FinancialSummary.created_at, months)
+    summaries = db.session.query(
+        bucket.label('bucket'),
+        FinancialSummary.total_profit.label('profit'),
+        FinancialSummary.fcr_value.label('fcr_value')
+    ).filter(month_range).subquery()
+    monthly = {}
+    # AVG leaves out summaries without an FCR
+    for index, profit, avg_fcr in db.session.query(
+        summaries.c.bucket, func.sum(summaries.c.profit), func.avg(summaries.c.fcr_value)
+    ).group_by(summaries.c.bucket):
+        monthly[months[index]] = (float(profit or 0), float(avg_fcr or 0))
+
+    profit_by_month = []
+    fcr_by_month = []
+    for year, month in months:
+        label = f"{calendar.month_abbr[month]} {year}"
+        profit, avg_fcr = monthly.get((year, month), (0.0, 0.0))
+        profit_by_month.append({'month': label, 'profit': profit})
+        fcr_by_month.append({'month': label, 'fcr': avg_fcr})
+    total_profit_this_month, avg_fcr_this_month = monthly.get((today.year, today.month), (0.0, 0.0))
+
+    # Latest high or medium risk remark per open batch
+    risk_rows = db.session.query(
+        BatchUpdate.batch_id, BatchUpdate.remarks_priority, BatchUpdate.remarks, BatchUpdate.created_at,
+        Batch.batch_number, Farm.name
+    ).join(Batch, BatchUpdate.batch_id == Batch.id).outerjoin(Farm, Farm.id == Batch.farm_id).filter(
+        BatchUpdate.remarks_priority.in_(['high', 'medium']),
+        Batch.status != 'closed'
+    ).order_by(
+        BatchUpdate.remarks_priority.desc(),  # 'high' > 'medium'
+        BatchUpdate.created_at.desc()
+    ).all()
+    seen_batches = set()
+    risk_batches = []
+    for batch_id, priority, remark, created_at, batch_number, farm_name in risk_rows:
+        if batch_id not in seen_batches:
+            risk_batches.append({
+                'batch_id': batch_id,
+                'batch_number': batch_number,
+                'farm_name': farm_name,
+                'priority': priority,
+                'remark': remark,
+                'created_at': created_at.strftime('%Y-%m-%d')
+            })
+            seen_batches.add(batch_id)
+
+    # Mortality rate this month, from the precomputed daily metrics
+    total_mortalities, placed_birds = db.session.query(
+        func.coalesce(func.sum(BatchDailyMetric.mortality), 0),
+        func.coalesce(func.sum(BatchDailyMetric.birds_alive + BatchDailyMetric.cumulative_mortality), 0)
+    ).filter(BatchDailyMetric.date >= month_start).one()
+    avg_mortality_rate_this_month = (total_mortalities / placed_birds) * 100 if placed_birds > 0 else 0
+
+    # Open batches with their farm and ledger: batches above 28 days and live figures
+    open_batches = Batch.query.filter(Batch.status.in_(['ongoing', 'closing'])).options(
+        joinedload(Batch.farm), joinedload(Batch.ledger)
+    ).all()
+    above_28_batches = []
+    live_profit_open_batches = 0.0
+    live_fcr_values = []
+    for batch in open_batches:
+        age_days = batch.get_age_days()
+        if age_days > 28:
+            above_28_batches.append({
+                'batch_id': batch.id,
+                'batch_number': batch.batch_number,
+                'farm_name': batch.farm.name if batch.farm else None,
+                'age_days': age_days,
+                'status': batch.status,
+                'created_at': batch.created_at.strftime('%Y-%m-%d')
+            })
+        if batch.ledger:
+            live_profit_open_batches += batch.ledger.get_live_profit()
+            if batch.ledger.weight_sold > 0:
+                live_fcr_values.append(batch.ledger.get_live_fcr())
+
+    return {
+        'farms_count': farms_count,
+        'active_batches_count': batch_status_counts['ongoing'] + batch_status_counts['closing'],
+        'total_birds': total_birds,
+        'pending_schedules_count': pending_schedules_count,
+        'profit_by_month': profit_by_month,
+        'fcr_by_month': fcr_by_month,
+        'avg_fcr_this_month': avg_fcr_this_month,
+        'total_profit_this_month': total_profit_this_month,
+        'risk_batches': risk_batches,
+        'batch_status_counts': batch_status_counts,
+        'avg_mortality_rate_this_month': avg_mortality_rate_this_month,
+        'live_profit_open_batches': live_profit_open_batches,
+        'live_fcr_open_batches': sum(live_fcr_values) / len(live_fcr_values) if live_fcr_values else 0,
+        'above_28_batches': above_28_batches,
+        'generated_at': now.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def get_dashboard_data(role):
+    """Get the dashboard figures, cached per role and day for DASHBOARD_CACHE_TTL seconds"""
+    key = (role, datetime.now().date())
+    cached = _dashboard_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    generation = _dashboard_generation
+    data = compute_dashboard_data()
+    # A commit that landed while computing may not be in data, so it is not kept
+    if generation == _dashboard_generation:
+        _dashboard_cache[key] = (time.monotonic() + DASHBOARD_CACHE_TTL, data)
+    return data
+
+# Writes only mark the session; the cache is dropped once they commit, so no
+# request can refill it from data that is not committed yet (or never will be)
+@event.listens_for(db.session, 'after_flush')
+def _invalidate_dashboard_on_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, DASHBOARD_CACHED_MODELS):
+            session.info['invalidate_dashboard'] = True
+            return
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _invalidate_dashboard_on_bulk_write(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['invalidate_dashboard'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_dashboard_on_commit(session):
+    if session.info.pop('invalidate_dashboard', False):
+        invalidate_dashboard_cache()
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_dashboard_invalidation(session):
+    session.info.pop('invalidate_dashboard', None)
+
+# Keyset pagination
+PAGE_SIZE = 50  # Rows per page of the batch, harvest and update listings
+MAX_PAGE_SIZE = 200  # Upper bound for a ?limit= asking for bigger pages
+
+def encode_cursor(values):
+    """Opaque cursor for the sort key values of the last row of a page"""
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, columns):
+    """Sort key values of a cursor, converted back to the types of the columns; ValueError when malformed"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+    decoded = []
+    for column, value in zip(columns, values):
+        python_type = column.type.python_type
+        if value is None:
+            raise ValueError('Invalid cursor')
+        try:
+            decoded.append(python_type.fromisoformat(value) if hasattr(python_type, 'fromisoformat') else python_type(value))
+        except (TypeError, ValueError) as e:  # e.g. a number where a date belongs
+            raise ValueError('Invalid cursor') from e
+    return decoded
+
+def get_keyset_page(query, columns, cursor=None, limit=None):
+    """One page of a query, newest first on columns, starting after the row the cursor points at.
+
+    The last column must be unique (the id) so every row has a distinct
+    position; with an index on the columns the page costs the same however
+    deep into the history it is. limit defaults to PAGE_SIZE and is kept
+    between 1 and MAX_PAGE_SIZE. Returns (rows, cursor of the next page or None).
+    """
+    limit = min(max(limit or PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    if cursor:
+        query = query.filter(db.tuple_(*columns) < db.tuple_(*decode_cursor(cursor, columns)))
+    rows = query.order_by(*[column.desc() for column in columns]).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+    return rows, next_cursor
+
+# Batch loading profiles
+def get_batch_load_options(profile):
+    """Eager-loading options for a named profile: 'list', 'detail' or 'report'"""
+    manager_options = joinedload(Batch.manager).joinedload(User.employee)
+    if profile == 'list':
+        return [joinedload(Batch.farm), manager_options]
+    if profile == 'detail':
+        # The collections are read in bulk by get_batch_detail
+        return [
+            joinedload(Batch.farm),
+            manager_options,
+            joinedload(Batch.financial_summary)
+        ]
+    if profile == 'report':
+        return [
+            joinedload(Batch.farm),
+            manager_options,
+            joinedload(Batch.financial_summary),
+            selectinload(Batch.harvests)
+        ]
+    raise ValueError(f'Unknown batch load profile: {profile}')
+
+def batch_query(profile='list'):
+    """Batch query with the eager loads of a named profile applied"""
+    return Batch.query.options(*get_batch_load_options(profile))
+
+def get_latest_updates(batch_ids):
+    """Get the most recent BatchUpdate of each batch in one windowed query"""
+    batch_ids = list(dict.fromkeys(batch_ids))
+    latest = {}
+    for start in range(0, len(batch_ids), COST_ENGINE_CHUNK_SIZE):
+        chunk = batch_ids[start:start + COST_ENGINE_CHUNK_SIZE]
+        ranked = db.session.query(
+            BatchUpdate,
+            func.row_number().over(
+                partition_by=BatchUpdate.batch_id,
+                order_by=(BatchUpdate.date.desc(), BatchUpdate.id.desc())
+            ).label('position')
+        ).filter(BatchUpdate.batch_id.in_(chunk)).subquery()
+        latest_update = aliased(BatchUpdate, ranked)
+        for update in db.session.query(latest_update).filter(ranked.c.position == 1):
+            latest[update.batch_id] = update
+    return latest
+
+# Batch detail view model
+def jsonable(value):
+    """A view model with its dates and datetimes turned into ISO strings, for jsonify"""
+    if isinstance(value, dict):
+        return {key: jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+def get_update_views(batch_id, update_ids=None):
+    """A batch's updates (all of them, or those ids) as plain dicts with everything the pages show, oldest first.
+
+    Six bulk queries however many updates there are: the updates, then their
+    feed allocations, items, miscellaneous items, feed returns and past
+    allocation dates. Feed and item names come from joins on the catalogs
+    instead of a lookup per row.
+    """
+    scope = [BatchUpdate.batch_id == batch_id]
+    if update_ids is not None:
+        if not update_ids:
+            return []
+        scope.append(BatchUpdate.id.in_(update_ids))
+
+    views = {}
+    for row in db.session.execute(select(
+        BatchUpdate.id, BatchUpdate.date, BatchUpdate.mortality_count, BatchUpdate.feed_used, BatchUpdate.avg_weight,
+        BatchUpdate.male_weight, BatchUpdate.female_weight, BatchUpdate.remarks, BatchUpdate.remarks_priority
+    ).where(*scope).order_by(BatchUpdate.date, BatchUpdate.id)):
+        views[row.id] = dict(row._mapping, past_allocation_date=None, feeds=[], medicines=[], health_materials=[],
+                             vaccines=[], miscellaneous=[], feed_returns=[], feed_packets=0.0, item_count=0)
+
+    for row in db.session.execute(select(
+        batch_update_feeds.c.batch_update_id, batch_update_feeds.c.feed_id, Feed.brand, Feed.category,
+        batch_update_feeds.c.quantity, batch_update_feeds.c.quantity_per_unit_at_time, batch_update_feeds.c.price_at_time
+    ).join(BatchUpdate, BatchUpdate.id == batch_update_feeds.c.batch_update_id).outerjoin(
+        Feed, Feed.id == batch_update_feeds.c.feed_id
+    ).where(*scope).order_by(batch_update_feeds.c.batch_update_id, batch_update_feeds.c.feed_id)):
+        view = views[row.batch_update_id]
+        view['feeds'].append({
+            'feed_id': row.feed_id,
+            'brand': row.brand,
+            'category': row.category,
+            'quantity': row.quantity,
+            'quantity_per_unit': row.quantity_per_unit_at_time,
+            'price': row.price_at_time,
+            'cost': row.quantity * row.price_at_time
+        })
+        view['feed_packets'] += row.quantity
+
+    item_lists = {'medicine': 'medicines', 'health_material': 'health_materials', 'vaccine': 'vaccines'}
+    for row in db.session.execute(select(
+        BatchUpdateItem.batch_update_id, BatchUpdateItem.item_type, BatchUpdateItem.item_id,
+        func.coalesce(Medicine.name, Vaccine.name, HealthMaterial.name).label('name'), BatchUpdateItem.quantity,
+        BatchUpdateItem.quantity_per_unit_at_time, BatchUpdateItem.unit_type, BatchUpdateItem.price_at_time,
+        BatchUpdateItem.total_cost, BatchUpdateItem.schedule_id, BatchUpdateItem.dose_number
+    ).join(BatchUpdate, BatchUpdate.id == BatchUpdateItem.batch_update_id).outerjoin(
+        Medicine, db.and_(BatchUpdateItem.item_type == 'medicine', Medicine.id == BatchUpdateItem.item_id)).outerjoin(
+        Vaccine, db.and_(BatchUpdateItem.item_type == 'vaccine', Vaccine.id == BatchUpdateItem.item_id)).outerjoin(
+        HealthMaterial, db.and_(BatchUpdateItem.item_type == 'health_material', HealthMaterial.id == BatchUpdateItem.item_id)
+    ).where(*scope).order_by(BatchUpdateItem.id)):
+        view = views[row.batch_update_id]
+        if row.item_type in item_lists:
+            view[item_lists[row.item_type]].append({key: value for key, value in row._mapping.items() if key != 'batch_update_id'})
+        view['item_count'] += 1
+
+    for row in db.session.execute(select(
+        MiscellaneousItem.batch_update_id, MiscellaneousItem.name, MiscellaneousItem.quantity_per_unit,
+        MiscellaneousItem.unit_type, MiscellaneousItem.price_per_unit, MiscellaneousItem.units_used, MiscellaneousItem.total_cost
+    ).join(BatchUpdate, BatchUpdate.id == MiscellaneousItem.batch_update_id).where(*scope).order_by(MiscellaneousItem.id)):
+        views[row.batch_update_id]['miscellaneous'].append({key: value for key, value in row._mapping.items() if key != 'batch_update_id'})
+
+    for row in db.session.execute(select(
+        BatchFeedReturn.batch_update_id, BatchFeedReturn.feed_id, Feed.brand, Feed.category, BatchFeedReturn.quantity
+    ).join(BatchUpdate, BatchUpdate.id == BatchFeedReturn.batch_update_id).outerjoin(
+        Feed, Feed.id == BatchFeedReturn.feed_id
+    ).where(*scope).order_by(BatchFeedReturn.id)):
+        views[row.batch_update_id]['feed_returns'].append({key: value for key, value in row._mapping.items() if key != 'batch_update_id'})
+
+    for row in db.session.execute(select(
+        PastFeedAllocation.batch_update_id, PastFeedAllocation.allocation_date
+    ).join(BatchUpdate, BatchUpdate.id == PastFeedAllocation.batch_update_id).where(*scope).order_by(PastFeedAllocation.id)):
+        view = views[row.batch_update_id]
+        if view['past_allocation_date'] is None:
+            view['past_allocation_date'] = row.allocation_date
+
+    return list(views.values())
+
+def get_batch_usage(batch_id):
+    """A batch's feed and item usage lists, oldest first, read with two narrow queries instead of its update views"""
+    usage = {'feed': [], 'medicine': [], 'health_material': [], 'vaccine': []}
+    for row in db.session.execute(select(
+        BatchUpdate.date, Feed.brand, Feed.category, batch_update_feeds.c.quantity
+    ).join(BatchUpdate, BatchUpdate.id == batch_update_feeds.c.batch_update_id).outerjoin(
+        Feed, Feed.id == batch_update_feeds.c.feed_id
+    ).where(BatchUpdate.batch_id == batch_id).order_by(BatchUpdate.date, BatchUpdate.id, batch_update_feeds.c.feed_id)):
+        usage['feed'].append({'date': row.date, 'name': f"{row.brand} {row.category}", 'quantity': row.quantity})
+
+    for row in db.session.execute(select(
+        BatchUpdate.date, BatchUpdateItem.item_type,
+        func.coalesce(Medicine.name, Vaccine.name, HealthMaterial.name).label('name'), BatchUpdateItem.quantity
+    ).join(BatchUpdate, BatchUpdate.id == BatchUpdateItem.batch_update_id).outerjoin(
+        Medicine, db.and_(BatchUpdateItem.item_type == 'medicine', Medicine.id == BatchUpdateItem.item_id)).outerjoin(
+        Vaccine, db.and_(BatchUpdateItem.item_type == 'vaccine', Vaccine.id == BatchUpdateItem.item_id)).outerjoin(
+        HealthMaterial, db.and_(BatchUpdateItem.item_type == 'health_material', HealthMaterial.id == BatchUpdateItem.item_id)
+    ).where(BatchUpdate.batch_id == batch_id).order_by(BatchUpdate.date, BatchUpdate.id, BatchUpdateItem.id)):
+        if row.item_type in usage:
+            usage[row.item_type].append({'date': row.date, 'name': row.name, 'quantity': row.quantity})
+    return usage
+
+def get_batch_detail(batch, with_updates=True):
+    """Everything the batch pages show as plain data, so the templates only format it.
+
+    Expects the batch loaded with its farm, manager, employee and financial
+    summary (batch_query('detail')); adds the updates (see
+    get_update_views), harvests and schedule dates in bulk queries.
+    Pages that load the update timeline a page at a time pass
+    with_updates=False: 'updates' is then None and the usage lists come
+    from get_batch_usage, so the cost no longer grows with every update's
+    feeds, items and returns.
+    """
+    if with_updates:
+        updates = get_update_views(batch.id)
+        update_dates = [update['date'] for update in updates]
+        usage = {
+            'feed': [{'date': update['date'], 'name': f"{feed['brand']} {feed['category']}", 'quantity': feed['quantity']}
+                     for update in updates for feed in update['feeds']],
+            'medicine': [{'date': update['date'], 'name': item['name'], 'quantity': item['quantity']}
+                         for update in updates for item in update['medicines']],
+            'health_material': [{'date': update['date'], 'name': item['name'], 'quantity': item['quantity']}
+                                for update in updates for item in update['health_materials']],
+            'vaccine': [{'date': update['date'], 'name': item['name'], 'quantity': item['quantity']}
+                        for update in updates for item in update['vaccines']]
+        }
+    else:
+        updates = None
+        update_dates = list(db.session.execute(select(BatchUpdate.date).where(
+            BatchUpdate.batch_id == batch.id).order_by(BatchUpdate.date, BatchUpdate.id)).scalars())
+        usage = get_batch_usage(batch.id)
+    harvests = [dict(row._mapping) for row in db.session.execute(select(
+        Harvest.id, Harvest.date, Harvest.quantity, Harvest.weight, Harvest.selling_price, Harvest.total_value, Harvest.notes
+    ).where(Harvest.batch_id == batch.id).order_by(Harvest.date, Harvest.id))]
+    schedule_dates = sorted(set(db.session.execute(select(schedule_entries.c.date).where(
+        schedule_entries.c.batch_id == batch.id)).scalars()))
+
+    harvested_weight = sum(harvest['weight'] for harvest in harvests)
+    harvested_birds = sum(harvest['quantity'] for harvest in harvests)
+    harvested_value = sum(harvest['total_value'] for harvest in harvests)
+    manager = batch.manager
+    summary = batch.financial_summary
+    return {
+        'batch': {
+            'id': batch.id,
+            'batch_number': batch.batch_number,
+            'farm_batch_number': batch.farm_batch_number,
+            'status': batch.status,
+            'brand': batch.brand,
+            'total_birds': batch.total_birds,
+            'available_birds': batch.available_birds,
+            'total_mortality': batch.total_mortality,
+            'mortality_rate': batch.total_mortality / batch.total_birds * 100 if batch.total_birds > 0 else 0,
+            'feed_usage': batch.feed_usage,
+            'feed_stock': batch.feed_stock,
+            'feed_delivered': sum(entry['quantity'] for entry in usage['feed']),
+            'cost_per_chicken': batch.cost_per_chicken,
+            'age_days': batch.get_age_days(),
+            'created_at': batch.created_at,
+            'closed_at': batch.closed_at,
+            'farm': {
+                'id': batch.farm.id,
+                'name': batch.farm.name,
+                'owner_name': batch.farm.owner_name,
+                'num_sheds': batch.farm.num_sheds,
+                'contact_number': batch.farm.contact_number
+            },
+            'manager': {
+                'id': manager.id,
+                'name': manager.employee.name if manager.employee else manager.username,
+                'user_type': manager.user_type
+            } if manager else None
+        },
+        'financial_summary': {
+            column.name: getattr(summary, column.name) for column in FinancialSummary.__table__.columns
+        } if summary else None,
+        'updates': updates,
+        'update_dates': update_dates,
+        'last_update_date': update_dates[-1] if update_dates else None,
+        'usage': usage,
+        'harvests': harvests,
+        'harvest_totals': {
+            'birds': harvested_birds,
+            'weight': harvested_weight,
+            'value': harvested_value,
+            'price_per_kg': harvested_value / harvested_weight if harvested_weight > 0 else None,
+            'weight_per_bird': harvested_weight / harvested_birds if harvested_birds > 0 else None
+        },
+        'schedule_dates': schedule_dates
+    }
+
+# Catalog cache
+# Feeds, medicines, vaccines and health materials are small and rarely edited
+# but read by every update form and saved update. Each process keeps them in
+# memory as plain dicts. Every catalog has a version in number_sequence that
+# is bumped in the same transaction as any change to it, so every process
+# reloads a catalog on its first read after the change commits.
+CATALOG_MODELS = OrderedDict([
+    ('feed', Feed),
+    ('medicine', Medicine),
+    ('vaccine', Vaccine),
+    ('health_material', HealthMaterial)
+])
+_catalogs = {}
+
+class Catalog:
+    """One catalog at one version: its entries in id order, by id, and as the JSON the forms and /api/catalogs use.
+
+    Entries are shared between requests and threads, so callers must not
+    change them.
+    """
+
+    def __init__(self, name, version, entries):
+        self.name = name
+        self.version = version
+        self.entries = entries
+        self.by_id = {entry['id']: entry for entry in entries}
+        self.json = str(htmlsafe_json_dumps(jsonable(entries)))  # Safe inside <script> like |tojson
+
+    def get(self, item_id):
+        return self.by_id.get(item_id)
+
+    def get_many(self, item_ids):
+        """{id: entry} for the given ids, leaving out unknown ones"""
+        return {item_id: self.by_id[item_id] for item_id in item_ids if item_id in self.by_id}
+
+def catalog_sequence(name):
+    return f'catalog_{name}'
+
+def load_catalog_entries(name):
+    """A catalog's rows as dicts, in two queries at most; vaccines get their dose_ages and an 'ml' unit_type"""
+    model = CATALOG_MODELS[name]
+    columns = [column for column in model.__table__.columns if column.name not in ('created_at', 'updated_at')]
+    entries = [dict(row._mapping) for row in db.session.execute(select(*columns).order_by(model.id))]
+    if model is Vaccine:
+        dose_ages = {}
+        for vaccine_id, age_days in db.session.execute(select(VaccineDose.vaccine_id, VaccineDose.age_days).order_by(
+                VaccineDose.vaccine_id, VaccineDose.dose_number)):
+            dose_ages.setdefault(vaccine_id, []).append(age_days)
+        for entry in entries:
+            entry['dose_ages'] = dose_ages.get(entry['id'], [])
+            entry['unit_type'] = 'ml'
+    return entries
+
+def get_catalog_versions():
+    """{catalog name: version}, read once per transaction; catalogs never changed are at version 0"""
+    versions = db.session.info.get('catalog_versions')
+    if versions is None:
+        sequences = {catalog_sequence(name): name for name in CATALOG_MODELS}
+        versions = dict.fromkeys(CATALOG_MODELS, 0)
+        for sequence, version in db.session.execute(select(number_sequence.c.name, number_sequence.c.next_value).where(
+                number_sequence.c.name.in_(sequences))):
+            versions[sequences[sequence]] = version
+        db.session.info['catalog_versions'] = versions
+    return versions
+
+def get_catalog(name):
+    """The cached catalog, reloaded when its version has moved on since it was loaded"""
+    if name in db.session.info.get('catalog_changes', ()):
+        # Changed in this transaction: it may still roll back, so keep it out of the cache
+        return Catalog(name, None, load_catalog_entries(name))
+    version = get_catalog_versions()[name]
+    catalog = _catalogs.get(name)
+    if catalog is None or catalog.version != version:
+        catalog = _catalogs[name] = Catalog(name, version, load_catalog_entries(name))
+    return catalog
+
+def bump_catalog_versions(connection, names):
+    for name in names:
+        sequence = catalog_sequence(name)
+        if not connection.execute(number_sequence.update().where(number_sequence.c.name == sequence).values(
+                next_value=number_sequence.c.next_value + 1)).rowcount:
+            connection.execute(number_sequence.insert().values(name=sequence, next_value=1))
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_catalog_changes(session, flush_context):
+    pending = session.info.setdefault('catalog_pending', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, VaccineDose):
+            pending.add('vaccine')
+        for name, model in CATALOG_MODELS.items():
+            if isinstance(obj, model):
+                pending.add(name)
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def _bump_catalog_versions(session, flush_context):
+    changed = session.info.setdefault('catalog_changes', set())
+    names = session.info.pop('catalog_pending', set()) - changed
+    if not names:
+        return
+    # One bump per catalog and transaction is enough to tell every process to reload it
+    bump_catalog_versions(session.connection(), names)
+    changed.update(names)
+    session.info.pop('catalog_versions', None)
+
+@event.listens_for(db.session, 'after_commit')
+@event.listens_for(db.session, 'after_rollback')
+def _reset_catalog_versions(session):
+    for key in ('catalog_versions', 'catalog_changes', 'catalog_pending'):
+        session.info.pop(key, None)
+
+# Batched daily updates
+BATCH_UPDATE_LIMIT = 500  # Updates accepted per request
+REMARKS_PRIORITIES = ('low', 'medium', 'high')
+ITEM_TYPES = ('medicine', 'health_material', 'vaccine')
+
+BATCH_UPDATE_SCHEMA = {
+    'batch_id': (int, True, None),
+    'date': ('date', True, None),
+    'mortality_count': (int, False, 0),
+    'feed_used': (float, False, 0.0),
+    'avg_weight': (float, False, 0.0),
+    'male_weight': (float, False, 0.0),
+    'female_weight': (float, False, 0.0),
+    'remarks': (str, False, None),
+    'remarks_priority': (REMARKS_PRIORITIES, False, 'low'),
+    'feeds': ([{'feed_id': (int, True, None), 'quantity': ('positive', True, None)}], False, []),
+    'feed_returns': ([{'feed_id': (int, True, None), 'quantity': ('positive', True, None)}], False, []),
+    'scheduled_items': ([{
+        'item_type': (ITEM_TYPES, True, None),
+        'schedule_id': (int, True, None),
+        'quantity': ('positive', True, None)
+    }], False, []),
+    'other_items': ([{
+        'item_type': (ITEM_TYPES, True, None),
+        'item_id': (int, True, None),
+        'quantity': ('positive', True, None),
+        'dose_number': (int, False, 1)
+    }], False, []),
+    'miscellaneous': ([{
+        'name': (str, True, None),
+        'quantity_per_unit': (float, True, None),
+        'unit_type': (str, True, None),
+        'price_per_unit': (float, True, None),
+        'units_used': ('positive', True, None)
+    }], False, [])
+}
+
+def validate_schema(data, schema, path=''):
+    """Check a JSON object against a schema, returning (values, errors).
+
+    A schema maps each field to (kind, required, default). The kind is int,
+    float, str, 'date' (an ISO date string), 'positive' (a number above
+    zero), a tuple of allowed strings, or a one-item list holding the schema
+    of the objects in a list. Numbers may not be negative and unknown fields
+    are errors.
+    """
+    if not isinstance(data, dict):
+        return None, [f'{path or "update"}: expected an object']
+    values, errors = {}, []
+    for field in data.keys() - schema.keys():
+        errors.append(f'{path}{field}: unknown field')
+    for field, (kind, required, default) in schema.items():
+        name = f'{path}{field}'
+        value = data.get(field)
+        if value is None:
+            if required:
+                errors.append(f'{name}: required')
+            values[field] = default
+            continue
+        if isinstance(kind, list):
+            if not isinstance(value, list):
+                errors.append(f'{name}: expected a list')
+                continue
+            values[field] = []
+            for position, entry in enumerate(value):
+                entry_values, entry_errors = validate_schema(entry, kind[0], f'{name}[{position}].')
+                values[field].append(entry_values)
+                errors.extend(entry_errors)
+        elif isinstance(kind, tuple):
+            if value not in kind:
+                errors.append(f"{name}: expected one of {', '.join(kind)}")
+            values[field] = value
+        elif kind == 'date':
+            try:
+                values[field] = datetime.strptime(value, '%Y-%m-%d').date() if isinstance(value, str) else None
+            except ValueError:
+                values[field] = None
+            if values[field] is None:
+                errors.append(f'{name}: expected a YYYY-MM-DD date')
+        elif kind is str:
+            if not isinstance(value, str):
+                errors.append(f'{name}: expected a string')
+            values[field] = value
+        else:
+            # JSON numbers; booleans are ints in Python but never a valid count or quantity
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or (kind is int and not isinstance(value, int)):
+                errors.append(f"{name}: expected {'an integer' if kind is int else 'a number'}")
+            elif value < 0 or (kind == 'positive' and value == 0):
+                errors.append(f"{name}: must be {'above zero' if kind == 'positive' else 'zero or more'}")
+            values[field] = value
+    return values, errors
+
+def apply_batch_updates(entries, user_type, user_id):
+    """Validate and record many daily updates, returning one result per entry in the same order.
+
+    Every entry is checked against BATCH_UPDATE_SCHEMA first. Batches,
+    existing updates and schedules are then resolved with one query per
+    type, and feeds and items through the catalog cache. An entry that fails
+    a check is reported ('invalid', 'forbidden' or 'conflict') and skipped;
+    the others are written with bulk inserts into the caller's transaction,
+    along with their ledger totals, completed schedules and daily metrics.
+    Nothing is committed.
+    """
+    results = [None] * len(entries)
+    accepted = []
+    for index, entry in enumerate(entries):
+        values, errors = validate_schema(entry, BATCH_UPDATE_SCHEMA)
+        if errors:
+            results[index] = {'index': index, 'status': 'invalid', 'errors': errors}
+        else:
+            accepted.append((index, values))
+
+    batch_ids = {values['batch_id'] for _, values in accepted}
+    batches = {batch.id: batch for batch in Batch.query.options(joinedload(Batch.ledger)).filter(
+        Batch.id.in_(batch_ids))} if batch_ids else {}
+    existing = {}
+    if batch_ids:
+        for update_id, batch_id, day in db.session.execute(select(BatchUpdate.id, BatchUpdate.batch_id, BatchUpdate.date).where(
+                BatchUpdate.batch_id.in_(batch_ids), BatchUpdate.date.in_({values['date'] for _, values in accepted}))):
+            existing[(batch_id, day)] = update_id
+
+    # Schedule id -> (item id, dose number, ids of the batches it is for), one query per type
+    schedules = {}
+    for item_type, (schedule_model, link_table, link_column, _, item_column, _) in get_schedule_tables().items():
+        schedule_ids = {item['schedule_id'] for _, values in accepted for item in values['scheduled_items']
+                        if item['item_type'] == item_type}
+        schedules[item_type] = {}
+        if not schedule_ids:
+            continue
+        dose_number = schedule_model.dose_number if hasattr(schedule_model, 'dose_number') else null()
+        for schedule_id, item_id, dose, batch_id in db.session.execute(select(
+            schedule_model.id, getattr(schedule_model, item_column), dose_number, link_table.c.batch_id
+        ).outerjoin(link_table, getattr(link_table.c, link_column) == schedule_model.id).where(
+            schedule_model.id.in_(schedule_ids))):
+            schedules[item_type].setdefault(schedule_id, (item_id, dose, set()))[2].add(batch_id)
+    catalogs = {name: get_catalog(name) for name in CATALOG_MODELS}
+
+    rows = []
+    seen = set()
+    remaining = {}  # Birds left in each batch after the updates accepted so far
+    for index, values in accepted:
+        batch = batches.get(values['batch_id'])
+        key = (values['batch_id'], values['date'])
+        result = {'index': index, 'batch_id': values['batch_id'], 'date': values['date'].isoformat()}
+        results[index] = result
+        if batch is None:
+            result.update(status='invalid', errors=['batch_id: no such batch'])
+            continue
+        if user_type == 'assistant_supervisor' and batch.manager_id != user_id:
+            result.update(status='forbidden', message='You do not have permission to update this batch.')
+            continue
+        if batch.status not in ACTIVE_BATCH_STATUSES:
+            result.update(status='conflict', message=f'The batch is {batch.status} and takes no more daily updates.')
+            continue
+        if key in existing or key in seen:
+            result.update(status='conflict', update_id=existing.get(key),
+                          message='An update has already been submitted for this batch on this date.')
+            continue
+
+        errors = []
+        birds_left = remaining.get(batch.id, batch.available_birds)
+        if values['mortality_count'] > birds_left:
+            errors.append(f'mortality_count: more than the {birds_left} birds left in the batch')
+        feed_ids = [feed['feed_id'] for feed in values['feeds']]
+        if len(set(feed_ids)) < len(feed_ids):
+            errors.append('feeds: a feed is listed more than once')
+        for field in ('feeds', 'feed_returns'):
+            for position, feed in enumerate(values[field]):
+                if catalogs['feed'].get(feed['feed_id']) is None:
+                    errors.append(f'{field}[{position}].feed_id: no such feed')
+        for position, item in enumerate(values['scheduled_items']):
+            schedule = schedules[item['item_type']].get(item['schedule_id'])
+            if schedule is None or batch.id not in schedule[2]:
+                errors.append(f'scheduled_items[{position}].schedule_id: no such {item["item_type"]} schedule for this batch')
+            elif catalogs[item['item_type']].get(schedule[0]) is None:
+                errors.append(f'scheduled_items[{position}].schedule_id: the scheduled {item["item_type"]} no longer exists')
+        for position, item in enumerate(values['other_items']):
+            if catalogs[item['item_type']].get(item['item_id']) is None:
+                errors.append(f'other_items[{position}].item_id: no such {item["item_type"]}')
+        if errors:
+            result.update(status='invalid', errors=errors)
+            continue
+        seen.add(key)
+        remaining[batch.id] = birds_left - values['mortality_count']
+        rows.append((result, batch, values))
+
+    if not rows:
+        return results
+
+    # Matched back on (batch, date), which is unique: ordered RETURNING would make SQLite insert row by row
+    update_ids = {(batch_id, day): update_id for update_id, batch_id, day in db.session.execute(
+        insert(BatchUpdate).returning(BatchUpdate.id, BatchUpdate.batch_id, BatchUpdate.date), [{
+        'batch_id': batch.id,
+        'date': values['date'],
+        'mortality_count': values['mortality_count'],
+        'feed_used': values['feed_used'],
+        'avg_weight': values['avg_weight'],
+        'male_weight': values['male_weight'],
+        'female_weight': values['female_weight'],
+        'remarks': values['remarks'],
+        'remarks_priority': values['remarks_priority']
+    } for _, batch, values in rows])}
+
+    feed_rows, return_rows, item_rows, misc_rows = [], [], [], []
+    completed = {item_type: set() for item_type in schedules}
+    first_dates = {}
+    for result, batch, values in rows:
+        update_id = update_ids[(batch.id, values['date'])]
+        result.update(status='created', update_id=update_id)
+        delta = dict.fromkeys(LEDGER_UPDATE_FIELDS, 0.0)
+        for feed in values['feeds']:
+            entry = catalogs['feed'].get(feed['feed_id'])
+            feed_rows.append({'batch_update_id': update_id, 'feed_id': entry['id'], 'quantity': feed['quantity'],
+                              'quantity_per_unit_at_time': entry['weight'], 'price_at_time': entry['price'],
+                              'total_cost': feed['quantity'] * entry['price']})
+            delta['feed_packets'] += feed['quantity']
+            delta['feed_kg'] += feed['quantity'] * entry['weight']
+            delta['feed_cost'] += feed['quantity'] * entry['price']
+        for feed in values['feed_returns']:
+            return_rows.append({'batch_update_id': update_id, 'feed_id': feed['feed_id'], 'quantity': feed['quantity']})
+            delta['returned_packets'] += feed['quantity']
+            delta['returned_kg'] += feed['quantity'] * catalogs['feed'].get(feed['feed_id'])['weight']
+        for item in values['scheduled_items'] + values['other_items']:
+            schedule = schedules[item['item_type']].get(item.get('schedule_id'))
+            entry = catalogs[item['item_type']].get(schedule[0] if schedule else item['item_id'])
+            if item['item_type'] != 'vaccine':
+                dose_number = None
+            elif schedule:
+                dose_number = schedule[1]
+            else:
+                dose_number = item['dose_number']
+            item_rows.append({'batch_update_id': update_id, 'item_id': entry['id'], 'item_type': item['item_type'],
+                              'quantity': item['quantity'], 'quantity_per_unit_at_time': entry['quantity_per_unit'],
+                              'unit_type': entry['unit_type'], 'price_at_time': entry['price'],
+                              'total_cost': entry['price'] * item['quantity'],
+                              'schedule_id': item.get('schedule_id'), 'dose_number': dose_number})
+            delta[f"{item['item_type']}_cost"] += entry['price'] * item['quantity']
+            if schedule:
+                completed[item['item_type']].add(item['schedule_id'])
+        for item in values['miscellaneous']:
+            misc_rows.append(dict(item, batch_update_id=update_id, total_cost=item['price_per_unit'] * item['units_used']))
+            delta['miscellaneous_cost'] += item['price_per_unit'] * item['units_used']
+
+        allocated = sum(feed['quantity'] for feed in values['feeds'])
+        returned = sum(feed['quantity'] for feed in values['feed_returns'])
+        batch.available_birds -= values['mortality_count']
+        batch.total_mortality += values['mortality_count']
+        batch.feed_usage += values['feed_used']
+        batch.feed_stock += allocated - returned - values['feed_used']
+        get_batch_ledger(batch).apply(delta)
+        first_dates[batch.id] = min(first_dates.get(batch.id, values['date']), values['date'])
+
+    if feed_rows:
+        db.session.execute(batch_update_feeds.insert(), feed_rows)
+    if return_rows:
+        db.session.execute(insert(BatchFeedReturn), return_rows)
+    if item_rows:
+        db.session.execute(insert(BatchUpdateItem), item_rows)
+    if misc_rows:
+        db.session.execute(insert(MiscellaneousItem), misc_rows)
+    for item_type, schedule_ids in completed.items():
+        if schedule_ids:
+            schedule_model = get_schedule_tables()[item_type][0]
+            schedule_model.query.filter(schedule_model.id.in_(schedule_ids)).update(
+                {schedule_model.completed: True}, synchronize_session=False)
+    for batch_id, first_date in first_dates.items():
+        refresh_batch_daily_metrics(batches[batch_id], first_date)
+    return results
+
+# Offline sync
+# The service worker queues daily updates, harvests and schedule completions
+# made without a connection, each under an idempotency key generated on the
+# device, and replays them in order to /api/sync. The result of every key is
+# stored with its writes, so a queue resent after a lost response gets the
+# first results back instead of applying anything twice.
+SYNC_OPERATION_LIMIT = BATCH_UPDATE_LIMIT  # Operations accepted per request
+SYNC_KEY_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+SYNC_OPERATION_SCHEMAS = {
+    'daily_update': BATCH_UPDATE_SCHEMA,
+    'harvest': {
+        'batch_id': (int, True, None),
+        'date': ('date', True, None),
+        'quantity': (int, True, None),
+        'weight': (float, True, None),
+        'selling_price': (float, True, None),
+        'notes': (str, False, '')
+    },
+    'schedule_completion': {
+        'item_type': (ITEM_TYPES, True, None),
+        'schedule_id': (int, True, None)
+    }
+}
+
+def sync_harvest(values, batch, user_type, user_id):
+    """Record a queued harvest, returning its result"""
+    if batch is None:
+        return {'status': 'invalid', 'errors': ['batch_id: no such batch']}
+    if user_type == 'assistant_supervisor' and batch.manager_id != user_id:
+        return {'status': 'forbidden', 'message': 'You do not have access to this batch'}
+    if values['quantity'] == 0:
+        return {'status': 'invalid', 'errors': ['quantity: must be above zero']}
+    if batch.status not in ['closing', 'closed']:
+        return {'status': 'conflict', 'message': 'Harvesting is only available for batches in closing or closed status'}
+    if values['quantity'] > batch.available_birds:
+        return {'status': 'conflict', 'available_birds': batch.available_birds,
+                'message': 'Harvest quantity cannot exceed available birds'}
+    harvest = record_harvest(batch, values['date'], values['quantity'], values['weight'], values['selling_price'],
+                             values['notes'])
+    db.session.flush()
+    return {'status': 'created', 'harvest_id': harvest.id}
+
+def sync_schedule_completion(values, schedule, user_type, user_id):
+    """Mark a queued schedule completed, returning its result"""
+    if schedule is None:
+        return {'status': 'invalid', 'errors': [f"schedule_id: no such {values['item_type']} schedule"]}
+    if user_type not in ['admin', 'senior_supervisor', 'assistant_supervisor']:
+        return {'status': 'forbidden', 'message': 'Only administrators and managers can complete schedules.'}
+    if user_type == 'assistant_supervisor' and not any(batch.manager_id == user_id for batch in schedule.batches):
+        return {'status': 'forbidden', 'message': 'You can only complete schedules for your assigned batches.'}
+    if schedule.completed:
+        return {'status': 'conflict', 'message': 'This schedule has already been completed.'}
+    schedule.completed = True
+    return {'status': 'completed'}
+
+def apply_sync_operations(operations, user_type, user_id):
+    """Replay queued operations in order, returning one result per operation.
+
+    Each operation is {"key", "kind", "data"}, with data checked against
+    SYNC_OPERATION_SCHEMAS[kind]. A key seen before gets its stored result
+    back, marked replayed, and nothing is applied. Runs of consecutive daily
+    updates go through apply_batch_updates together; batches and schedules
+    for the rest are loaded up front with one query per type. The results
+    are stored under their keys in the caller's transaction. Nothing is
+    committed.
+    """
+    results = [None] * len(operations)
+    parsed = []
+    for index, operation in enumerate(operations):
+        operation = operation if isinstance(operation, dict) else {}
+        key, kind = operation.get('key'), operation.get('kind')
+        errors = []
+        if not isinstance(key, str) or not SYNC_KEY_PATTERN.match(key):
+            errors.append('key: expected 8 to 64 letters, digits, dashes or underscores')
+        if kind not in SYNC_OPERATION_SCHEMAS:
+            errors.append(f"kind: expected one of {', '.join(SYNC_OPERATION_SCHEMAS)}")
+        if errors:
+            results[index] = {'index': index, 'key': key if isinstance(key, str) else None, 'kind': kind,
+                              'status': 'invalid', 'errors': errors}
+        else:
+            parsed.append((index, key, kind, operation.get('data')))
+
+    keys = {key for _, key, _, _ in parsed}
+    stored = {key: json.loads(result) for key, result in db.session.execute(
+        select(SyncOperation.key, SyncOperation.result).where(SyncOperation.key.in_(keys)))} if keys else {}
+
+    fresh, first_seen = [], {}
+    for index, key, kind, data in parsed:
+        if key in stored:
+            results[index] = dict(stored[key], index=index, replayed=True)
+        elif key in first_seen:
+            continue  # Filled in from the first operation with the key once it has run
+        else:
+            first_seen[key] = index
+            fresh.append((index, key, kind, data))
+
+    # Harvested batches and completed schedules, one query per type
+    harvest_batch_ids = {data['batch_id'] for _, _, kind, data in fresh
+                         if kind == 'harvest' and isinstance(data, dict) and isinstance(data.get('batch_id'), int)}
+    batches = {batch.id: batch for batch in Batch.query.options(joinedload(Batch.ledger)).filter(
+        Batch.id.in_(harvest_batch_ids))} if harvest_batch_ids else {}
+    schedules = {}
+    for item_type, (schedule_model, *_) in get_schedule_tables().items():
+        schedule_ids = {data['schedule_id'] for _, _, kind, data in fresh
+                        if kind == 'schedule_completion' and isinstance(data, dict)
+                        and data.get('item_type') == item_type and isinstance(data.get('schedule_id'), int)}
+        schedules[item_type] = {schedule.id: schedule for schedule in schedule_model.query.options(
+            selectinload(schedule_model.batches)).filter(schedule_model.id.in_(schedule_ids))} if schedule_ids else {}
+
+    daily_updates = []
+
+    def apply_daily_updates():
+        update_results = apply_batch_updates([data for _, _, _, data in daily_updates], user_type, user_id)
+        for (index, key, kind, _), result in zip(daily_updates, update_results):
+            results[index] = dict(result, index=index, key=key, kind=kind)
+        daily_updates.clear()
+
+    for operation in fresh:
+        index, key, kind, data = operation
+        if kind == 'daily_update':
+            daily_updates.append(operation)
+            continue
+        if daily_updates:
+            apply_daily_updates()
+        values, errors = validate_schema(data, SYNC_OPERATION_SCHEMAS[kind], 'data.')
+        if errors:
+            result = {'status': 'invalid', 'errors': errors}
+        elif kind == 'harvest':
+            result = sync_harvest(values, batches.get(values['batch_id']), user_type, user_id)
+        else:
+            result = sync_schedule_completion(values, schedules[values['item_type']].get(values['schedule_id']),
+                                              user_type, user_id)
+        results[index] = dict(result, index=index, key=key, kind=kind)
+    if daily_updates:
+        apply_daily_updates()
+
+    for index, key, kind, _ in parsed:
+        if results[index] is None:
+            results[index] = dict(results[first_seen[key]], index=index, replayed=True)
+    if fresh:
+        db.session.execute(insert(SyncOperation), [{
+            'key': key,
+            'kind': kind,
+            'user_id': user_id,
+            'result': json.dumps({field: value for field, value in results[index].items() if field != 'index'})
+        } for index, key, kind, _ in fresh])
+    return results
+
+# Unified schedule read model
+SCHEDULE_ENTRY_ICONS = {'medicine': 'fa-pills', 'vaccine': 'fa-syringe', 'health_material': 'fa-spray-can'}
+
+schedule_entries = table('schedule_entries',
+    column('schedule_type', db.String),
+    column('schedule_id', db.Integer),
+    column('item_id', db.Integer),
+    column('item_name', db.String),
+    column('batch_id', db.Integer),
+    column('date', db.Date),
+    column('completed', db.Boolean),
+    column('dose_number', db.Integer)
+)
+
+def get_schedule_tables():
+    """Schedule model, association table, item model and column names for each item type"""
+    return {
+        'medicine': (MedicineSchedule, medicine_schedule_batches, 'medicine_schedule_id',
+                     Medicine, 'medicine_id', 'schedule_date'),
+        'vaccine': (VaccineSchedule, vaccine_schedule_batches, 'vaccine_schedule_id',
+                    Vaccine, 'vaccine_id', 'scheduled_date'),
+        'health_material': (HealthMaterialSchedule, health_material_schedule_batches, 'health_material_schedule_id',
+                            HealthMaterial, 'health_material_id', 'scheduled_date')
+    }
+
+def schedule_entries_select():
+    """The UNION ALL behind the schedule_entries view: one row per schedule and batch"""
+    arms = []
+    for item_type, (schedule_model, link_table, link_column, item_model, item_column, date_column) in get_schedule_tables().items():
+        dose_number = schedule_model.dose_number if hasattr(schedule_model, 'dose_number') else null()
+        arms.append(select(
+            literal_column(f"'{item_type}'").label('schedule_type'),
+            schedule_model.id.label('schedule_id'),
+            getattr(schedule_model, item_column).label('item_id'),
+            item_model.name.label('item_name'),
+            link_table.c.batch_id.label('batch_id'),
+            getattr(schedule_model, date_column).label('date'),
+            schedule_model.completed.label('completed'),
+            cast(dose_number, db.Integer).label('dose_number')
+        ).join(link_table, getattr(link_table.c, link_column) == schedule_model.id
+        ).join(item_model, item_model.id == getattr(schedule_model, item_column)))
+    return union_all(*arms)
+
+def create_schedule_entries_view(connection):
+    """(Re)create the schedule_entries view so it always matches schedule_entries_select()"""
+    definition = schedule_entries_select().compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    connection.execute(text('DROP VIEW IF EXISTS schedule_entries'))
+    connection.execute(text(f'CREATE VIEW schedule_entries AS {definition}'))
+
+def get_schedule_scope(user_type=None, user_id=None):
+    """Filter restricting schedule_entries to the batches a role can see, or None for everything"""
+    if user_type == 'assistant_supervisor':
+        return schedule_entries.c.batch_id.in_(select(Batch.id).where(Batch.manager_id == user_id))
+    if user_type == 'senior_supervisor':
+        return schedule_entries.c.batch_id.in_(select(Batch.id).where(Batch.status.in_(['ongoing', 'closing'])))
+    return None
+
+def get_schedule_dates(scope=None, start_date=None, end_date=None):
+    """Distinct schedule dates as 'YYYY-MM-DD' strings, in one query on schedule_entries"""
+    query = select(schedule_entries.c.date).distinct()
+    if scope is not None:
+        query = query.where(scope)
+    if start_date is not None:
+        query = query.where(schedule_entries.c.date >= start_date)
+    if end_date is not None:
+        query = query.where(schedule_entries.c.date <= end_date)
+    return [day.strftime('%Y-%m-%d') for day in db.session.execute(query).scalars()]
+
+def get_schedules_for_date(selected_date, scope=None):
+    """Schedules falling on a date, grouped by item type as ORM objects with item and batches loaded"""
+    query = select(schedule_entries.c.schedule_type, schedule_entries.c.schedule_id).distinct().where(
+        schedule_entries.c.date == selected_date)
+    if scope is not None:
+        query = query.where(scope)
+    ids = {item_type: [] for item_type in SCHEDULE_ENTRY_ICONS}
+    for item_type, schedule_id in db.session.execute(query):
+        ids[item_type].append(schedule_id)
+
+    schedules = {}
+    for item_type, (schedule_model, _, _, item_model, item_column, _) in get_schedule_tables().items():
+        if not ids[item_type]:
+            schedules[item_type] = []
+            continue
+        item_relationship = getattr(schedule_model, item_column[:-len('_id')])
+        schedules[item_type] = schedule_model.query.options(
+            joinedload(item_relationship),
+            selectinload(schedule_model.batches)
+        ).filter(schedule_model.id.in_(ids[item_type])).order_by(schedule_model.id).all()
+    return schedules
+
+# Shed occupancy index
+ACTIVE_BATCH_STATUSES = ('ongoing', 'closing')
+BATCH_STATUSES = ACTIVE_BATCH_STATUSES + ('closed',)
+
+def compute_shed_occupancy(shed_ids=None):
+    """Select (shed_id, farm_id, occupied_birds) straight from the allocations of active batches"""
+    active_birds = case((Batch.status.in_(ACTIVE_BATCH_STATUSES), BatchShedAllocation.birds), else_=0)
+    query = select(Shed.id, Shed.farm_id, func.coalesce(func.sum(active_birds), 0)).select_from(Shed).outerjoin(
+        BatchShedAllocation, BatchShedAllocation.shed_id == Shed.id
+    ).outerjoin(Batch, Batch.id == BatchShedAllocation.batch_id).group_by(Shed.id, Shed.farm_id)
+    if shed_ids is not None:
+        query = query.where(Shed.id.in_(shed_ids))
+    return query
+
+def refresh_shed_occupancy(connection, shed_ids=None):
+    """Recompute the shed_occupancy rows of the given sheds (all sheds when None)"""
+    shed_ids = None if shed_ids is None else list(shed_ids)
+    for start in range(0, len(shed_ids), COST_ENGINE_CHUNK_SIZE) if shed_ids is not None else [None]:
+        chunk = None if start is None else shed_ids[start:start + COST_ENGINE_CHUNK_SIZE]
+        delete = shed_occupancy.delete()
+        if chunk is not None:
+            delete = delete.where(shed_occupancy.c.shed_id.in_(chunk))
+        connection.execute(delete)
+        connection.execute(shed_occupancy.insert().from_select(
+            ['shed_id', 'farm_id', 'occupied_birds'], compute_shed_occupancy(chunk)))
+
+def get_shed_availability(farm_ids=None):
+    """Available capacity of every shed, as {farm_id: [available per shed in shed order]}, in one read"""
+    query = select(Shed.farm_id, Shed.capacity, func.coalesce(shed_occupancy.c.occupied_birds, 0)).join(
+        Farm, Farm.id == Shed.farm_id
+    ).outerjoin(
+        shed_occupancy, shed_occupancy.c.shed_id == Shed.id
+    ).where(Shed.shed_number <= Farm.num_sheds).order_by(Shed.farm_id, Shed.shed_number)
+    if farm_ids is not None:
+        query = query.where(Shed.farm_id.in_(farm_ids))
+    availability = {}
+    for farm_id, capacity, occupied in db.session.execute(query):
+        availability.setdefault(farm_id, []).append(capacity - occupied)
+    return availability
+
+def find_shed_occupancy_drift():
+    """Compare the index with a fresh computation: [(shed_id, stored, expected)] for every mismatch"""
+    stored = {shed_id: occupied for shed_id, occupied in db.session.execute(
+        select(shed_occupancy.c.shed_id, shed_occupancy.c.occupied_birds))}
+    drift = []
+    for shed_id, _, expected in db.session.execute(compute_shed_occupancy()):
+        occupied = stored.pop(shed_id, None)
+        if occupied != expected:
+            drift.append((shed_id, occupied, expected))
+    drift.extend((shed_id, occupied, None) for shed_id, occupied in stored.items())
+    return drift
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_shed_occupancy_changes(session, flush_context):
+    shed_ids = session.info.setdefault('occupancy_shed_ids', set())
+    batch_ids = session.info.setdefault('occupancy_batch_ids', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, BatchShedAllocation):
+            shed_ids.add(obj.shed_id)
+            # A reallocated row may have moved from another shed
+            shed_ids.update(inspect(obj).attrs.shed_id.history.deleted or ())
+        elif isinstance(obj, Shed):
+            shed_ids.add(obj.id)
+        elif isinstance(obj, Batch) and obj in session.deleted:
+            # The flush loaded the allocations to delete them along with the batch
+            shed_ids.update(allocation.shed_id for allocation in obj.shed_allocations)
+        elif isinstance(obj, Batch) and inspect(obj).attrs.status.history.has_changes():
+            batch_ids.add(obj.id)
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def _refresh_shed_occupancy(session, flush_context):
+    shed_ids = session.info.pop('occupancy_shed_ids', set())
+    batch_ids = session.info.pop('occupancy_batch_ids', set())
+    if not shed_ids and not batch_ids:
+        return
+    connection = session.connection()
+    for start in range(0, len(batch_ids), COST_ENGINE_CHUNK_SIZE):
+        chunk = list(batch_ids)[start:start + COST_ENGINE_CHUNK_SIZE]
+        shed_ids.update(connection.execute(select(BatchShedAllocation.shed_id).where(
+            BatchShedAllocation.batch_id.in_(chunk))).scalars())
+    shed_ids.discard(None)
+    refresh_shed_occupancy(connection, shed_ids)
+
+# Batch number allocation
+BATCH_NUMBER_SEQUENCE = 'batch_number'
+
+def parse_batch_number(batch_number):
+    """The integer part of a BATCH-0001 style number, None when it has none"""
+    try:
+        return int(batch_number.split('-')[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def next_sequence_value(connection, name):
+    """Take the next value of a global sequence, None when it has not been seeded.
+    The UPDATE holds the row lock until the transaction ends, so concurrent callers queue."""
+    result = connection.execute(number_sequence.update().where(number_sequence.c.name == name).values(
+        next_value=number_sequence.c.next_value + 1))
+    if not result.rowcount:
+        return None
+    return connection.execute(select(number_sequence.c.next_value).where(number_sequence.c.name == name)).scalar() - 1
+
+def seed_batch_number_sequence(connection):
+    """Start the BATCH-0001 sequence after the highest number already issued"""
+    issued = (parse_batch_number(number) for number in connection.execute(select(Batch.batch_number)).scalars())
+    connection.execute(number_sequence.insert().values(
+        name=BATCH_NUMBER_SEQUENCE, next_value=max(filter(None, issued), default=0) + 1))
+
+def seed_farm_batch_numbers(connection, farm_ids=None):
+    """Create the counter and free list of farms that have none yet (all such farms when None) from their batches"""
+    missing = select(Farm.id).where(~select(farm_batch_number_counter.c.farm_id).where(
+        farm_batch_number_counter.c.farm_id == Farm.id).exists())
+    if farm_ids is not None:
+        missing = missing.where(Farm.id.in_(farm_ids))
+    missing = list(connection.execute(missing).scalars())
+    for start in range(0, len(missing), COST_ENGINE_CHUNK_SIZE):
+        chunk = missing[start:start + COST_ENGINE_CHUNK_SIZE]
+        held = {farm_id: set() for farm_id in chunk}
+        for farm_id, number in connection.execute(select(Batch.farm_id, Batch.farm_batch_number).where(
+                Batch.farm_id.in_(chunk), Batch.farm_batch_number > 0)):
+            held[farm_id].add(number)
+        connection.execute(farm_batch_number_counter.insert(), [
+            {'farm_id': farm_id, 'next_number': max(numbers, default=0) + 1} for farm_id, numbers in held.items()])
+        free = [{'farm_id': farm_id, 'number': number} for farm_id, numbers in held.items()
+                for number in range(1, max(numbers, default=0)) if number not in numbers]
+        if free:
+            connection.execute(farm_batch_number_free.insert(), free)
+
+def _lock_farm_counter(connection, farm_id):
+    """Lock the farm's counter row for this transaction and return its next_number"""
+    query = select(farm_batch_number_counter.c.next_number).where(
+        farm_batch_number_counter.c.farm_id == farm_id).with_for_update()
+    next_number = connection.execute(query).scalar()
+    if next_number is None:
+        seed_farm_batch_numbers(connection, [farm_id])
+        next_number = connection.execute(query).scalar()
+    return next_number
+
+def _farm_number_held(connection, farm_id, number):
+    return connection.execute(select(Batch.id).where(
+        Batch.farm_id == farm_id, Batch.farm_batch_number == number).limit(1)).first() is not None
+
+def allocate_farm_batch_number(farm_id):
+    """Take the lowest farm batch number no batch of the farm holds.
+
+    Released numbers come back from the free list first, otherwise the counter
+    moves on, skipping numbers that were typed in by hand above it. The counter
+    row stays locked until commit, so concurrent adds on a farm never share a number.
+    """
+    connection = db.session.connection()
+    next_number = _lock_farm_counter(connection, farm_id)
+    lowest_free = connection.execute(select(func.min(farm_batch_number_free.c.number)).where(
+        farm_batch_number_free.c.farm_id == farm_id)).scalar()
+    if lowest_free is not None:
+        connection.execute(farm_batch_number_free.delete().where(
+            farm_batch_number_free.c.farm_id == farm_id, farm_batch_number_free.c.number == lowest_free))
+        return lowest_free
+    number = next_number
+    while _farm_number_held(connection, farm_id, number):
+        number += 1
+    connection.execute(farm_batch_number_counter.update().where(
+        farm_batch_number_counter.c.farm_id == farm_id).values(next_number=number + 1))
+    return number
+
+def release_farm_batch_number(connection, farm_id, number):
+    """Put a farm number back on the free list once no batch of the farm holds it"""
+    if not number or number <= 0 or _farm_number_held(connection, farm_id, number):
+        return
+    next_number = _lock_farm_counter(connection, farm_id)
+    # Numbers at or above the counter are handed out by the counter itself
+    if number < next_number and not connection.execute(select(farm_batch_number_free.c.number).where(
+            farm_batch_number_free.c.farm_id == farm_id, farm_batch_number_free.c.number == number)).first():
+        connection.execute(farm_batch_number_free.insert().values(farm_id=farm_id, number=number))
+
+def claim_farm_batch_number(connection, farm_id, number):
+    """Take a number a batch now holds (e.g. entered by hand) off the free list"""
+    if number and number > 0:
+        connection.execute(farm_batch_number_free.delete().where(
+            farm_batch_number_free.c.farm_id == farm_id, farm_batch_number_free.c.number == number))
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_farm_batch_number_changes(session, flush_context):
+    released = session.info.setdefault('released_farm_numbers', set())
+    claimed = session.info.setdefault('claimed_farm_numbers', set())
+    deleted_farms = session.info.setdefault('deleted_farm_ids', set())
+    for obj in session.new:
+        if isinstance(obj, Batch):
+            claimed.add((obj.farm_id, obj.farm_batch_number))
+    for obj in session.deleted:
+        if isinstance(obj, Batch):
+            released.add((obj.farm_id, obj.farm_batch_number))
+        elif isinstance(obj, Farm):
+            deleted_farms.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Batch):
+            history = inspect(obj).attrs.farm_batch_number.history
+            if history.has_changes():
+                released.update((obj.farm_id, number) for number in history.deleted or ())
+                claimed.add((obj.farm_id, obj.farm_batch_number))
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def _apply_farm_batch_number_changes(session, flush_context):
+    released = session.info.pop('released_farm_numbers', set())
+    claimed = session.info.pop('claimed_farm_numbers', set())
+    deleted_farms = session.info.pop('deleted_farm_ids', set())
+    if not released and not claimed and not deleted_farms:
+        return
+    connection = session.connection()
+    for farm_id, number in released:
+        if farm_id not in deleted_farms:
+            release_farm_batch_number(connection, farm_id, number)
+    for farm_id, number in claimed:
+        claim_farm_batch_number(connection, farm_id, number)
+    if deleted_farms:
+        connection.execute(farm_batch_number_free.delete().where(farm_batch_number_free.c.farm_id.in_(deleted_farms)))
+        connection.execute(farm_batch_number_counter.delete().where(farm_batch_number_counter.c.farm_id.in_(deleted_farms)))
+
+# Farm report cube
+REPORT_PERIOD_TYPES = ('all', 'year', 'quarter', 'month')
+REPORT_RANKING_METRICS = ('net_profit', 'total_profit', 'total_loss', 'total_expenses', 'avg_fcr',
+                          'avg_mortality_rate', 'batch_count')
+
+def get_report_periods(day):
+    """The cube periods a batch closed on this day counts towards, as (period, period_type)"""
+    return [
+        ('all', 'all'),
+        (f'{day.year}', 'year'),
+        (f'{day.year}-Q{(day.month - 1) // 3 + 1}', 'quarter'),
+        (f'{day.year}-{day.month:02d}', 'month')
+    ]
+
+def refresh_farm_report_cube(connection, farm_ids=None):
+    """Recompute every period row of the given farms (all farms when None) from their financial summaries"""
+    if farm_ids is None:
+        farm_ids = list(connection.execute(select(Farm.id)).scalars())
+    farm_ids = [farm_id for farm_id in farm_ids if farm_id is not None]
+    for start in range(0, len(farm_ids), COST_ENGINE_CHUNK_SIZE):
+        chunk = farm_ids[start:start + COST_ENGINE_CHUNK_SIZE]
+        rows = connection.execute(select(
+            Batch.farm_id, Batch.id, Batch.batch_number, Batch.manager_id, Batch.closed_at, Batch.created_at,
+            Batch.total_mortality, Batch.total_birds, FinancialSummary.total_profit, FinancialSummary.fcr_value,
+            FinancialSummary.total_feed_cost, FinancialSummary.total_medicine_cost, FinancialSummary.total_vaccine_cost,
+            FinancialSummary.total_health_material_cost, FinancialSummary.total_miscellaneous_cost,
+            FinancialSummary.total_bird_cost
+        ).join(FinancialSummary, FinancialSummary.batch_id == Batch.id).where(Batch.farm_id.in_(chunk))).all()
+
+        cells = {}
+        for row in rows:
+            profit = row.total_profit or 0.0
+            expenses = sum(cost or 0 for cost in (
+                row.total_feed_cost, row.total_medicine_cost, row.total_vaccine_cost,
+                row.total_health_material_cost, row.total_miscellaneous_cost, row.total_bird_cost))
+            for period, period_type in get_report_periods((row.closed_at or row.created_at).date()):
+                cell = cells.setdefault((row.farm_id, period), {
+                    'farm_id': row.farm_id, 'period': period, 'period_type': period_type, 'batch_count': 0,
+                    'total_profit': 0.0, 'total_loss': 0.0, 'total_expenses': 0.0, 'mortality_rates': [],
+                    'fcrs': [], 'best': None
+                })
+                cell['batch_count'] += 1
+                if profit > 0:
+                    cell['total_profit'] += profit
+                elif profit < 0:
+                    cell['total_loss'] += profit
+                cell['total_expenses'] += expenses
+                if row.total_birds:
+                    cell['mortality_rates'].append(row.total_mortality / row.total_birds * 100)
+                if row.fcr_value is not None:  # Summaries without an FCR stay out of the average
+                    cell['fcrs'].append(row.fcr_value)
+                if row.total_profit is not None and (cell['best'] is None or row.total_profit > cell['best'].total_profit):
+                    cell['best'] = row
+
+        connection.execute(farm_report_cube.delete().where(farm_report_cube.c.farm_id.in_(chunk)))
+        if cells:
+            now = datetime.now()
+            connection.execute(farm_report_cube.insert(), [{
+                'farm_id': cell['farm_id'],
+                'period': cell['period'],
+                'period_type': cell['period_type'],
+                'batch_count': cell['batch_count'],
+                'total_profit': cell['total_profit'],
+                'total_loss': cell['total_loss'],
+                'net_profit': cell['total_profit'] + cell['total_loss'],
+                'total_expenses': cell['total_expenses'],
+                'avg_mortality_rate': sum(cell['mortality_rates']) / len(cell['mortality_rates']) if cell['mortality_rates'] else 0.0,
+                'avg_fcr': sum(cell['fcrs']) / len(cell['fcrs']) if cell['fcrs'] else 0.0,
+                'best_batch_id': cell['best'].id if cell['best'] else None,
+                'best_batch_number': cell['best'].batch_number if cell['best'] else None,
+                'best_batch_profit': cell['best'].total_profit if cell['best'] else None,
+                'best_manager_id': cell['best'].manager_id if cell['best'] else None,
+                'updated_at': now
+            } for cell in cells.values()])
+
+def get_farm_report(farm_id, period='all'):
+    """One farm's cube row for a period, None when it has no closed batches in it"""
+    return db.session.execute(select(farm_report_cube).where(
+        farm_report_cube.c.farm_id == farm_id, farm_report_cube.c.period == period
+    )).mappings().first()
+
+def rank_farms(period='all', metric='net_profit', descending=True, limit=None):
+    """Cube rows of every farm for a period, ranked by a metric, with the farm name"""
+    if metric not in REPORT_RANKING_METRICS:
+        raise ValueError(f"Unknown metric '{metric}'")
+    order = farm_report_cube.c[metric].desc() if descending else farm_report_cube.c[metric].asc()
+    query = select(farm_report_cube, Farm.name.label('farm_name')).join(
+        Farm, Farm.id == farm_report_cube.c.farm_id
+    ).where(farm_report_cube.c.period == period).order_by(order, farm_report_cube.c.farm_id)
+    if limit:
+        query = query.limit(limit)
+    return db.session.execute(query).mappings().all()
+
+# Columns of a batch with a financial summary that feed the cube besides the summary itself
+REPORT_CUBE_BATCH_FIELDS = ('closed_at', 'created_at', 'total_mortality', 'total_birds', 'manager_id', 'farm_id')
+
+def _batch_changes_report_cube(session, batch):
+    """Whether a flushed batch change shows in the cube, which only holds batches with a financial summary.
+
+    That is a status change into or out of 'closed', or a change to a batch
+    that has a summary. Only closed batches keep one (reopening deletes it),
+    so daily updates and harvests of open batches leave the cube alone.
+    """
+    state = inspect(batch)
+    status = state.attrs.status.history
+    if 'closed' in list(status.added or ()) + list(status.deleted or ()):
+        return True
+    if batch not in session.deleted and not any(
+            state.attrs[field].history.has_changes() for field in REPORT_CUBE_BATCH_FIELDS):
+        return False
+    if 'financial_summary' in state.dict:
+        return state.dict['financial_summary'] is not None
+    return batch.status == 'closed'
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_farm_report_changes(session, flush_context):
+    farm_ids = session.info.setdefault('report_farm_ids', set())
+    batch_ids = session.info.setdefault('report_batch_ids', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, FinancialSummary):
+            batch_ids.add(obj.batch_id)
+        elif isinstance(obj, Batch) and _batch_changes_report_cube(session, obj):
+            farm_ids.add(obj.farm_id)
+            farm_ids.update(inspect(obj).attrs.farm_id.history.deleted or ())
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def _refresh_farm_report_cube(session, flush_context):
+    farm_ids = session.info.pop('report_farm_ids', set())
+    batch_ids = session.info.pop('report_batch_ids', set())
+    if not farm_ids and not batch_ids:
+        return
+    connection = session.connection()
+    batch_ids = list(batch_ids)
+    for start in range(0, len(batch_ids), COST_ENGINE_CHUNK_SIZE):
+        farm_ids.update(connection.execute(select(Batch.farm_id).where(
+            Batch.id.in_(batch_ids[start:start + COST_ENGINE_CHUNK_SIZE]))).scalars())
+    refresh_farm_report_cube(connection, {int(farm_id) for farm_id in farm_ids if farm_id is not None})
+
+# Export
+EXPORT_CHUNK_SIZE = 1000  # Rows fetched from the cursor and written out per chunk
+
+def _export_updates():
+    return select(
+        Farm.name.label('farm'), Batch.batch_number, BatchUpdate.date, BatchUpdate.mortality_count,
+        BatchUpdate.feed_used, BatchUpdate.avg_weight, BatchUpdate.male_weight, BatchUpdate.female_weight,
+        BatchUpdate.remarks, BatchUpdate.remarks_priority
+    ).select_from(BatchUpdate).join(Batch, Batch.id == BatchUpdate.batch_id).join(Farm, Farm.id == Batch.farm_id).order_by(
+        BatchUpdate.batch_id, BatchUpdate.date), BatchUpdate.date
+
+def _export_feeds():
+    return select(
+        Farm.name.label('farm'), Batch.batch_number, BatchUpdate.date, Feed.brand, Feed.category,
+        batch_update_feeds.c.quantity, batch_update_feeds.c.quantity_per_unit_at_time,
+        batch_update_feeds.c.price_at_time, batch_update_feeds.c.total_cost
+    ).select_from(batch_update_feeds).join(BatchUpdate, BatchUpdate.id == batch_update_feeds.c.batch_update_id).join(
+        Feed, Feed.id == batch_update_feeds.c.feed_id).join(Batch, Batch.id == BatchUpdate.batch_id).join(
+        Farm, Farm.id == Batch.farm_id).order_by(BatchUpdate.batch_id, BatchUpdate.date, batch_update_feeds.c.feed_id), BatchUpdate.date
+
+def _export_items():
+    return select(
+        Farm.name.label('farm'), Batch.batch_number, BatchUpdate.date, BatchUpdateItem.item_type,
+        func.coalesce(Medicine.name, Vaccine.name, HealthMaterial.name).label('item_name'), BatchUpdateItem.quantity,
+        BatchUpdateItem.quantity_per_unit_at_time, BatchUpdateItem.unit_type, BatchUpdateItem.price_at_time,
+        BatchUpdateItem.total_cost, BatchUpdateItem.dose_number
+    ).select_from(BatchUpdateItem).join(BatchUpdate, BatchUpdate.id == BatchUpdateItem.batch_update_id).join(
+        Batch, Batch.id == BatchUpdate.batch_id).join(Farm, Farm.id == Batch.farm_id).outerjoin(
+        Medicine, db.and_(BatchUpdateItem.item_type == 'medicine', Medicine.id == BatchUpdateItem.item_id)).outerjoin(
+        Vaccine, db.and_(BatchUpdateItem.item_type == 'vaccine', Vaccine.id == BatchUpdateItem.item_id)).outerjoin(
+        HealthMaterial, db.and_(BatchUpdateItem.item_type == 'health_material', HealthMaterial.id == BatchUpdateItem.item_id)
+    ).order_by(BatchUpdate.batch_id, BatchUpdate.date, BatchUpdateItem.id), BatchUpdate.date
+
+def _export_misc():
+    return select(
+        Farm.name.label('farm'), Batch.batch_number, BatchUpdate.date, MiscellaneousItem.name,
+        MiscellaneousItem.quantity_per_unit, MiscellaneousItem.unit_type, MiscellaneousItem.price_per_unit,
+        MiscellaneousItem.units_used, MiscellaneousItem.total_cost
+    ).select_from(MiscellaneousItem).join(BatchUpdate, BatchUpdate.id == MiscellaneousItem.batch_update_id).join(
+        Batch, Batch.id == BatchUpdate.batch_id).join(Farm, Farm.id == Batch.farm_id).order_by(
+        BatchUpdate.batch_id, BatchUpdate.date, MiscellaneousItem.id), BatchUpdate.date
+
+def _export_harvests():
+    return select(
+        Farm.name.label('farm'), Batch.batch_number, Harvest.date, Harvest.quantity, Harvest.weight,
+        Harvest.selling_price, Harvest.total_value, Harvest.notes
+    ).select_from(Harvest).join(Batch, Batch.id == Harvest.batch_id).join(Farm, Farm.id == Batch.farm_id).order_by(
+        Harvest.batch_id, Harvest.date, Harvest.id), Harvest.date
+
+def _export_summaries():
+    return select(
+        Farm.name.label('farm'), Batch.batch_number, Batch.status, Batch.created_at, Batch.closed_at,
+        Batch.total_birds, Batch.total_mortality, FinancialSummary.total_feed_cost, FinancialSummary.total_medicine_cost,
+        FinancialSummary.total_vaccine_cost, FinancialSummary.total_health_material_cost,
+        FinancialSummary.total_miscellaneous_cost, FinancialSummary.total_bird_cost, FinancialSummary.total_revenue,
+        FinancialSummary.total_profit, FinancialSummary.fcr_value, FinancialSummary.fcr_rate, FinancialSummary.fcr_price
+    ).select_from(FinancialSummary).join(Batch, Batch.id == FinancialSummary.batch_id).join(
+        Farm, Farm.id == Batch.farm_id).order_by(FinancialSummary.batch_id), Batch.closed_at
+
+# Dataset name: builder of (statement, date column the date range filters on)
+EXPORT_DATASETS = {
+    'updates': _export_updates,
+    'feeds': _export_feeds,
+    'items': _export_items,
+    'misc': _export_misc,
+    'harvests': _export_harvests,
+    'summaries': _export_summaries
+}
+
+def build_export_query(dataset, farm_id=None, status=None, start_date=None, end_date=None):
+    """The statement of an export dataset with the farm, batch status and date range filters applied"""
+    statement, date_column = EXPORT_DATASETS[dataset]()
+    if farm_id:
+        statement = statement.where(Batch.farm_id == farm_id)
+    if status:
+        statement = statement.where(Batch.status == status)
+    if start_date:
+        statement = statement.where(date_column >= start_date)
+    if end_date:
+        # Datetime columns include the whole end day
+        statement = statement.where(date_column < end_date + timedelta(days=1))
+    return statement
+
+def iter_export_rows(statement):
+    """Rows of a statement read through a server-side cursor, EXPORT_CHUNK_SIZE at a time.
+
+    Uses its own read-only connection so the rows can keep coming after the
+    request's session is done; only one chunk is held in memory at a time.
+    """
+    with db.engine.connect() as connection:
+        result = connection.execution_options(yield_per=EXPORT_CHUNK_SIZE).execute(statement)
+        for rows in result.partitions():
+            yield from rows
+
+def stream_csv(header, rows):
+    """Encode rows as CSV text, a chunk of rows per yielded string"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+class _ZipStream:
+    """Write-only file for zipfile that collects what is written until it is drained"""
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+_XLSX_INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    )
+}
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value!r}</v></c>'
+    if isinstance(value, datetime):
+        value = value.strftime('%Y-%m-%d %H:%M:%S')
+    text_value = xml_escape(_XLSX_INVALID_CHARS.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text_value}</t></is></c>'
+
+def stream_xlsx(sheet_name, header, rows):
+    """Encode rows as a one-sheet XLSX workbook, streamed as it is zipped.
+
+    Cells are written inline (no shared strings table), so nothing but the
+    current chunk is kept in memory. Dates and datetimes become ISO text.
+    Excel stops reading a sheet after 1,048,576 rows.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        workbook.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{xml_escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ))
+        with workbook.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            lines = ['<row>' + ''.join(_xlsx_cell(name) for name in header) + '</row>']
+            for count, row in enumerate(rows, 1):
+                lines.append('<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>')
+                if count % EXPORT_CHUNK_SIZE == 0:
+                    sheet.write(''.join(lines).encode('utf-8'))
+                    lines = []
+                    yield stream.drain()
+            sheet.write(''.join(lines).encode('utf-8') + b'</sheetData></worksheet>')
+    yield stream.drain()
+
+# Set-based deletion
+SCHEDULE_LINKS = (
+    (MedicineSchedule, medicine_schedule_batches, medicine_schedule_batches.c.medicine_schedule_id),
+    (VaccineSchedule, vaccine_schedule_batches, vaccine_schedule_batches.c.vaccine_schedule_id),
+    (HealthMaterialSchedule, health_material_schedule_batches, health_material_schedule_batches.c.health_material_schedule_id),
+)
+
+def delete_batches(batch_ids):
+    """Delete batches with their updates, harvests, schedules and summaries, one DELETE per table.
+
+    Children go first, so this works whether or not the database enforces
+    the ON DELETE CASCADE foreign keys. Schedules shared with batches that
+    stay are only unlinked. The shed occupancy index and the farm batch
+    numbers are kept in step by hand, since bulk deletes skip the flush
+    listeners. Runs in the caller's transaction; returns the number of batches deleted.
+    """
+    batch_ids = list(batch_ids)
+    if not batch_ids:
+        return 0
+    db.session.flush()
+    connection = db.session.connection()
+    numbers = connection.execute(select(Batch.farm_id, Batch.farm_batch_number).where(Batch.id.in_(batch_ids))).all()
+    shed_ids = set(connection.execute(select(BatchShedAllocation.shed_id).where(
+        BatchShedAllocation.batch_id.in_(batch_ids))).scalars())
+
+    update_ids = select(BatchUpdate.id).where(BatchUpdate.batch_id.in_(batch_ids))
+    for link_table in (batch_update_feeds, batch_update_items):
+        connection.execute(link_table.delete().where(link_table.c.batch_update_id.in_(update_ids)))
+    for model in (BatchUpdateItem, MiscellaneousItem, BatchFeedReturn, PastFeedAllocation):
+        connection.execute(db.delete(model).where(model.batch_update_id.in_(update_ids)))
+    connection.execute(db.delete(BatchUpdate).where(BatchUpdate.batch_id.in_(batch_ids)))
+
+    for schedule_model, link_table, link_schedule_id in SCHEDULE_LINKS:
+        shared = select(link_schedule_id).where(link_table.c.batch_id.not_in(batch_ids))
+        owned = list(connection.execute(select(link_schedule_id).where(
+            link_table.c.batch_id.in_(batch_ids), link_schedule_id.not_in(shared)).distinct()).scalars())
+        connection.execute(link_table.delete().where(link_table.c.batch_id.in_(batch_ids)))
+        for start in range(0, len(owned), COST_ENGINE_CHUNK_SIZE):
+            connection.execute(db.delete(schedule_model).where(
+                schedule_model.id.in_(owned[start:start + COST_ENGINE_CHUNK_SIZE])))
+
+    for model in (Harvest, FinancialSummary, BatchLedger, BatchDailyMetric, BatchShedAllocation):
+        connection.execute(db.delete(model).where(model.batch_id.in_(batch_ids)))
+    deleted = connection.execute(db.delete(Batch).where(Batch.id.in_(batch_ids))).rowcount
+
+    refresh_shed_occupancy(connection, shed_ids)
+    refresh_farm_report_cube(connection, {farm_id for farm_id, _ in numbers})
+    for farm_id, number in numbers:
+        release_farm_batch_number(connection, farm_id, number)
+    return deleted
+
+def delete_farm_records(farm_id, chunk_size=None):
+    """Delete a farm with all its batches and sheds.
+
+    With a chunk_size the batches go chunk_size at a time, each chunk in its
+    own committed transaction, so the write lock is only held briefly and
+    other requests get in between chunks. Without one everything happens in
+    the caller's transaction.
+    """
+    query = select(Batch.id).where(Batch.farm_id == farm_id).order_by(Batch.id).limit(chunk_size or COST_ENGINE_CHUNK_SIZE)
+    while True:
+        batch_ids = list(db.session.execute(query).scalars())
+        if not batch_ids:
+            break
+        delete_batches(batch_ids)
+        if chunk_size:
+            db.session.commit()
+
+    connection = db.session.connection()
+    for table in (shed_occupancy, farm_batch_number_free, farm_batch_number_counter, farm_report_cube):
+        connection.execute(table.delete().where(table.c.farm_id == farm_id))
+    connection.execute(db.delete(Shed).where(Shed.farm_id == farm_id))
+    connection.execute(db.delete(Farm).where(Farm.id == farm_id))
+    if chunk_size:
+        db.session.commit()
+
+# Background jobs
+JOB_HANDLERS = {}  # kind: (handler, max_attempts)
+_job_wakeup = threading.Event()
+_job_workers = []
+_job_workers_lock = threading.Lock()
+_job_workers_stop = threading.Event()
+
+def job_handler(kind, max_attempts=3):
+    """Register a function as the handler of a job kind; it gets the payload as keyword arguments"""
+    def register(f):
+        JOB_HANDLERS[kind] = (f, max_attempts)
+        return f
+    return register
+
+def enqueue_job(kind, **payload):
+    """Queue a job in the current transaction; the caller commits.
+
+    A job of the same kind and payload that is still queued is returned
+    instead of adding another one. Web processes start their workers on
+    the first request; scripts and CLI commands run the queue themselves
+    with work_jobs(..., until_idle=True) or `flask run-jobs`.
+    """
+    _, max_attempts = JOB_HANDLERS[kind]
+    payload = json.dumps(payload, sort_keys=True)
+    dedupe_key = f'{kind}:{payload}'[:255]
+    job = Job.query.filter_by(dedupe_key=dedupe_key, status='queued').first()
+    if job is None:
+        job = Job(kind=kind, payload=payload, dedupe_key=dedupe_key, max_attempts=max_attempts)
+        db.session.add(job)
+        db.session.flush()
+    db.session.info['wake_job_workers'] = True
+    return job
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_job_workers(session):
+    if session.info.pop('wake_job_workers', False):
+        _job_wakeup.set()
+
+def requeue_stale_jobs():
+    """Put jobs whose worker died mid-run (running for longer than JOB_TIMEOUT) back on the queue"""
+    cutoff = datetime.now() - timedelta(seconds=app.config['JOB_TIMEOUT'])
+    with write_transactions():
+        requeued = Job.query.filter(Job.status == 'running', Job.started_at < cutoff).update(
+            {Job.status: 'queued', Job.run_after: datetime.now()}, synchronize_session=False)
+        db.session.commit()
+    return requeued
+
+def claim_job(worker_name):
+    """Mark the oldest due job as running for this worker and return its id, None when there is none.
+
+    Idle polls are plain reads. Only the claim itself takes the write lock,
+    and the status check in its UPDATE makes it safe between workers
+    and processes.
+    """
+    now = datetime.now()
+    job_id = db.session.execute(select(Job.id).where(
+        Job.status == 'queued', Job.run_after <= now
+    ).order_by(Job.id).limit(1)).scalar()
+    db.session.rollback()  # End the read so the claim starts a write transaction of its own
+    if job_id is None:
+        return None
+    with write_transactions():
+        claimed = db.session.execute(db.update(Job).where(Job.id == job_id, Job.status == 'queued').values(
+            status='running', worker=worker_name, started_at=now, attempts=Job.attempts + 1
+        )).rowcount
+        db.session.commit()
+    return job_id if claimed else claim_job(worker_name)
+
+def run_job(job_id):
+    """Run a claimed job. Its handler's changes commit together with the succeeded status;
+    on an error they roll back and the job is retried with a growing delay until max_attempts."""
+    job = db.session.get(Job, job_id)
+    try:
+        if job.kind not in JOB_HANDLERS:
+            raise LookupError(f"No handler for job kind '{job.kind}'")
+        result = JOB_HANDLERS[job.kind][0](**job.get_payload())
+        job = db.session.get(Job, job_id)  # Handlers that commit in chunks expire it
+        job.status = 'succeeded'
+        job.result = json.dumps(result) if result is not None else None
+        job.error = None
+        job.finished_at = datetime.now()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.error = str(e)
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = datetime.now() + timedelta(seconds=app.config['JOB_RETRY_DELAY'] * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.now()
+        db.session.commit()
+        print(f"Job {job_id} ({job.kind}) failed on attempt {job.attempts}: {str(e)}")
+
+def work_jobs(worker_name, stop=None, until_idle=False):
+    """Claim and run jobs until stop is set, or with until_idle until no job is due"""
+    with app.app_context():
+        requeue_stale_jobs()
+        while not (stop and stop.is_set()):
+            try:
+                job_id = claim_job(worker_name)
+                if job_id is not None:
+                    # Handlers write, so their transactions take the write lock up front
+                    with write_transactions():
+                        run_job(job_id)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Job worker {worker_name} error: {str(e)}")
+                job_id = None
+            finally:
+                db.session.remove()
+            if job_id is None:
+                if until_idle:
+                    return
+                _job_wakeup.wait(app.config['JOB_POLL_INTERVAL'])
+                _job_wakeup.clear()
+
+def start_job_workers():
+    """Start JOB_WORKERS worker threads in this process, once"""
+    with _job_workers_lock:
+        if _job_workers or not app.config['JOB_WORKERS']:
+            return
+        for number in range(app.config['JOB_WORKERS']):
+            worker_name = f'{socket.gethostname()}:{os.getpid()}:{number}'
+            thread = threading.Thread(target=work_jobs, args=(worker_name, _job_workers_stop),
+                                      name=f'job-worker-{number}', daemon=True)
+            thread.start()
+            _job_workers.append(thread)
+
+def stop_job_workers():
+    """Stop the worker threads of this process once their current job is done, e.g. before the database goes away"""
+    with _job_workers_lock:
+        _job_workers_stop.set()
+        _job_wakeup.set()
+        for thread in _job_workers:
+            thread.join()
+        _job_workers.clear()
+        _job_workers_stop.clear()
+
+@job_handler('calculate_summary')
+def calculate_summary_job(batch_id):
+    """Build the financial summary of a closed batch"""
+    batch = db.session.get(Batch, batch_id)
+    if batch is None or batch.status != 'closed':
+        return {'skipped': True}
+    financial_summary = batch.financial_summary or FinancialSummary(batch_id=batch.id)
+    financial_summary.calculate_summary(batch)
+    db.session.add(financial_summary)
+    return {'batch_id': batch.id, 'total_profit': financial_summary.total_profit}
+
+@job_handler('regenerate_schedules')
+def regenerate_schedules_job(item_type=None, item_id=None):
+    """Rebuild the upcoming auto-schedules of every open batch"""
+    batches = Batch.query.filter(Batch.status.in_(ACTIVE_BATCH_STATUSES)).all()
+    removed, created = regenerate_schedules_for_batches(batches, item_type, item_id)
+    return {'batches': len(batches), 'removed': removed, 'created': created}
+
+@job_handler('delete_farm')
+def delete_farm_job(farm_id):
+    """Delete a farm chunk by chunk; a retry carries on where a failed run stopped"""
+    delete_farm_records(farm_id, app.config['DELETE_CHUNK_SIZE'])
+    return {'farm_id': farm_id}
+
+# Indexes, counters and caches kept from other tables, rebuilt by build_derived_tables rather than copied
+DERIVED_TABLES = ('number_sequence', 'farm_batch_number_counter', 'farm_batch_number_free', 'shed_occupancy',
+                  'farm_report_cube')
+
+def build_derived_tables(connection):
+    """Fill the derived tables that are still empty from the data they are kept from"""
+    # Fill the occupancy index the first time it exists next to sheds
+    if not connection.execute(select(shed_occupancy.c.shed_id).limit(1)).first():
+        refresh_shed_occupancy(connection)
+    # Build the report cube the first time it exists next to closed batches
+    if not connection.execute(select(farm_report_cube.c.farm_id).limit(1)).first():
+        refresh_farm_report_cube(connection)
+    # Start the batch number counters after the numbers already in use
+    seed_farm_batch_numbers(connection)
+    if not connection.execute(select(number_sequence.c.name).where(
+            number_sequence.c.name == BATCH_NUMBER_SEQUENCE)).first():
+        seed_batch_number_sequence(connection)
 
 def init_db():
     with app.app_context():
@@ -806,6 +3455,9 @@ def init_db():
 
             # Create all tables
             db.create_all()
+            with db.engine.begin() as connection:
+                create_schedule_entries_view(connection)
+                build_derived_tables(connection)
 
             # +
             
@@ -816,9 +3468,339 @@ def init_db():
 # Initialize database
 init_db()
 
+@app.cli.command('run-jobs')
+@click.option('--workers', type=int, default=None, help='Worker threads (defaults to JOB_WORKERS).')
+@click.option('--until-idle', is_flag=True, help='Exit once no job is due instead of waiting for more.')
+def run_jobs_command(workers, until_idle):
+    """Run background jobs in this process, e.g. next to web processes started with JOB_WORKERS=0"""
+    workers = workers or app.config['JOB_WORKERS'] or 1
+    stop = threading.Event()
+    threads = [threading.Thread(target=work_jobs, args=(f'{socket.gethostname()}:{os.getpid()}:{number}', stop, until_idle))
+               for number in range(workers)]
+    for thread in threads:
+        thread.start()
+    print(f'Running jobs with {workers} worker(s).')
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        # Let the running jobs finish, then stop
+        stop.set()
+        _job_wakeup.set()
+        for thread in threads:
+            thread.join()
+    remaining = Job.query.filter_by(status='queued').count()
+    print(f'Job workers stopped, {remaining} job(s) still queued.')
+
+@app.cli.command('verify-ledger')
+@click.option('--fix', is_flag=True, help='Rebuild the ledgers that drifted.')
+def verify_ledger_command(fix):
+    """Recompute every batch ledger from scratch and report any drift"""
+    drift = find_ledger_drift()
+    if not drift:
+        print('All batch ledgers match their recomputed values.')
+        return
+    for batch, field, stored, expected in drift:
+        print(f'{batch.batch_number} (id {batch.id}): {field} is {stored:.2f}, expected {expected:.2f}')
+    drifted_batches = {batch.id: batch for batch, _, _, _ in drift}
+    if fix:
+        for batch in drifted_batches.values():
+            rebuild_batch_ledger(batch)
+        db.session.commit()
+        print(f'Rebuilt {len(drifted_batches)} ledger(s).')
+    else:
+        print(f'{len(drifted_batches)} ledger(s) drifted. Run with --fix to rebuild them.')
+
+@app.cli.command('verify-shed-occupancy')
+@click.option('--fix', is_flag=True, help='Rebuild the occupancy index from the allocations.')
+def verify_shed_occupancy_command(fix):
+    """Compare the shed occupancy index with the allocations of active batches"""
+    drift = find_shed_occupancy_drift()
+    if not drift:
+        print('The shed occupancy index matches the batch allocations.')
+        return
+    for shed_id, stored, expected in drift:
+        print(f'Shed {shed_id}: index has {stored}, allocations give {expected}')
+    if fix:
+        refresh_shed_occupancy(db.session.connection())
+        db.session.commit()
+        print('Rebuilt the shed occupancy index.')
+
+@app.cli.command('rebuild-report-cube')
+def rebuild_report_cube_command():
+    """Recompute the farm report cube from the financial summaries"""
+    refresh_farm_report_cube(db.session.connection())
+    db.session.commit()
+    rows = db.session.execute(select(func.count()).select_from(farm_report_cube)).scalar()
+    print(f'Rebuilt the farm report cube: {rows} farm period row(s).')
+
+@app.cli.command('rebuild-daily-metrics')
+def rebuild_daily_metrics_command():
+    """Rebuild the batch_daily_metrics table for every batch"""
+    batches = Batch.query.all()
+    for batch in batches:
+        refresh_batch_daily_metrics(batch)
+    db.session.commit()
+    print(f'Rebuilt daily metrics for {len(batches)} batch(es).')
+
+@app.cli.command('regenerate-schedules')
+@click.option('--item-type', type=click.Choice(['medicine', 'vaccine', 'health_material']), default=None)
+@click.option('--item-id', type=int, default=None)
+def regenerate_schedules_command(item_type, item_id):
+    """Rebuild the upcoming auto-schedules of every open batch"""
+    batches = Batch.query.filter(Batch.status.in_(['ongoing', 'closing'])).all()
+    removed, created = regenerate_schedules_for_batches(batches, item_type, item_id)
+    db.session.commit()
+    print(f'Replaced {removed} pending auto-generated schedule(s) with {created} for {len(batches)} open batch(es).')
+
+@app.cli.command('recalculate-fcr')
+def recalculate_fcr_command():
+    """Recalculate FCR, rate and farmer price of every closed batch summary"""
+    summaries = FinancialSummary.query.all()
+    fcrs = calculate_batch_fcrs([summary.batch_id for summary in summaries])
+    changed = 0
+    for summary in summaries:
+        fcr = fcrs[summary.batch_id]
+        if summary.fcr_value == fcr['fcr_value'] and summary.fcr_rate == fcr['fcr_rate']:
+            continue
+        # The farmer's FCR payment is part of the expenses, so move the profit with it
+        summary.total_profit = (summary.total_profit or 0) + (summary.fcr_price or 0) - fcr['fcr_price']
+        summary.fcr_value = fcr['fcr_value']
+        summary.fcr_rate = fcr['fcr_rate']
+        summary.fcr_price = fcr['fcr_price']
+        changed += 1
+    db.session.commit()
+    print(f'Updated FCR on {changed} of {len(summaries)} financial summaries.')
+
+def import_database(source_url, chunk_size=1000):
+    """Copy every table from another database (typically the old SQLite file) into the configured one.
+
+    The target must already have the schema (init_db creates it) and be
+    empty apart from the DERIVED_TABLES init_db seeds; those are not copied
+    but cleared and rebuilt from the copied data. Run `flask db upgrade` on
+    the source first: columns missing from an older source schema are left
+    to their defaults and tables it lacks are skipped. PostgreSQL id
+    sequences are moved past the copied ids. Returns {table name: rows copied}.
+    """
+    source = create_engine(source_url)
+    source_tables = set(inspect(source).get_table_names())
+    copied = {}
+    with db.engine.begin() as target:
+        for table_obj in db.metadata.sorted_tables:
+            if table_obj.name in DERIVED_TABLES:
+                continue
+            if target.execute(select(func.count()).select_from(table_obj)).scalar():
+                raise RuntimeError(f'Target table {table_obj.name} is not empty')
+        for table_obj in reversed(db.metadata.sorted_tables):
+            if table_obj.name == 'number_sequence':
+                # Catalog versions stay, and move on below, so processes never keep a catalog cached from before
+                target.execute(number_sequence.delete().where(
+                    number_sequence.c.name.notin_([catalog_sequence(name) for name in CATALOG_MODELS])))
+            elif table_obj.name in DERIVED_TABLES:
+                target.execute(table_obj.delete())
+        with source.connect() as reader:
+            for table_obj in db.metadata.sorted_tables:
+                if table_obj.name not in source_tables or table_obj.name in DERIVED_TABLES:
+                    continue
+                names = {info['name'] for info in inspect(source).get_columns(table_obj.name)}
+                columns = [col for col in table_obj.columns if col.name in names]
+                result = reader.execution_options(yield_per=chunk_size).execute(select(*columns))
+                copied[table_obj.name] = 0
+                for rows in result.partitions():
+                    target.execute(table_obj.insert(), [row._asdict() for row in rows])
+                    copied[table_obj.name] += len(rows)
+        if target.dialect.name == 'postgresql':
+            for table_obj in db.metadata.sorted_tables:
+                if 'id' not in table_obj.c or not table_obj.c.id.autoincrement:
+                    continue
+                name = target.dialect.identifier_preparer.quote(table_obj.name)
+                target.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) "
+                    f"FROM {name}"
+                ))
+    with db.engine.begin() as target:
+        build_derived_tables(target)
+        bump_catalog_versions(target, CATALOG_MODELS)
+    source.dispose()
+    return copied
+
+@app.cli.command('import-database')
+@click.argument('source_url')
+def import_database_command(source_url):
+    """Copy all data from SOURCE_URL (e.g. sqlite:///instance/bismi_farm.db) into DATABASE_URL"""
+    copied = import_database(source_url)
+    for name, count in copied.items():
+        print(f'{name}: {count} rows')
+    print(f'Copied {sum(copied.values())} rows from {len(copied)} tables.')
+
+def get_hot_queries():
+    """Representative statements for the access paths the routes rely on, keyed by name"""
+    today = datetime.now().date()
+    return {
+        'open batches': select(Batch.id).where(Batch.status.in_(['ongoing', 'closing'])),
+        'batches of a manager': select(Batch.id).where(Batch.manager_id == 1, Batch.status == 'ongoing'),
+        'batches of a farm': select(Batch.id).where(Batch.farm_id == 1, Batch.status == 'closed'),
+        'update of a batch for a day': select(BatchUpdate.id).where(BatchUpdate.batch_id == 1, BatchUpdate.date == today),
+        'risk remarks': select(BatchUpdate.batch_id).where(BatchUpdate.remarks_priority.in_(['high', 'medium'])),
+        'harvests of a batch': select(Harvest.id).where(Harvest.batch_id == 1),
+        'update items of a type': select(BatchUpdateItem.id).where(
+            BatchUpdateItem.batch_update_id == 1, BatchUpdateItem.item_type == 'medicine'),
+        'latest price of a feed': select(batch_update_feeds.c.price_at_time).where(
+            batch_update_feeds.c.feed_id == 1).order_by(batch_update_feeds.c.batch_update_id.desc()).limit(1),
+        'pending schedules': select(func.count()).select_from(schedule_entries).where(
+            schedule_entries.c.date < today, schedule_entries.c.completed == False),
+        'schedules of a batch': select(schedule_entries.c.schedule_id).where(
+            schedule_entries.c.batch_id == 1, schedule_entries.c.date >= today)
+    }
+
+def find_unindexed_scans(statement):
+    """EXPLAIN a statement and return the plan lines that read a table without an index"""
+    connection = db.session.connection()
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    if connection.dialect.name == 'sqlite':
+        plan = [row[3] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))]
+        return [line for line in plan
+                if line.startswith('SCAN ') and 'USING' not in line and line.split()[1] in db.metadata.tables]
+    # Small tables make a sequential scan the cheapest plan, so only flag scans the planner cannot avoid
+    connection.execute(text('SET LOCAL enable_seqscan = off'))
+    plan = [row[0] for row in connection.execute(text(f'EXPLAIN {compiled}'))]
+    return [line.strip() for line in plan if 'Seq Scan' in line]
+
+@app.cli.command('explain-indexes')
+def explain_indexes_command():
+    """EXPLAIN the hot queries and fail if any of them reads a table without an index"""
+    failed = 0
+    for name, statement in get_hot_queries().items():
+        scans = find_unindexed_scans(statement)
+        print(f"{'FAIL' if scans else 'ok  '} {name}" + ''.join(f'\n       {line}' for line in scans))
+        failed += bool(scans)
+    db.session.rollback()
+    if failed:
+        raise click.ClickException(f'{failed} hot queries read a table without an index.')
+
+# Request instrumentation
+PERF_HISTORY_SIZE = 200  # Requests kept per endpoint for /admin/perf
+PERF_SLOWEST_STATEMENTS = 5
+_perf_history = {}
+_perf_lock = threading.Lock()
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+def query_budget(max_queries):
+    """Declare how many SQL statements a route may run per request"""
+    def decorator(f):
+        f.query_budget = max_queries
+        return f
+    return decorator
+
+def _perf_active():
+    return has_request_context() and 'perf' in g
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _perf_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _perf_active():
+        conn.info.setdefault('perf_query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _perf_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not _perf_active() or not conn.info.get('perf_query_start'):
+        return
+    elapsed_ms = (time.perf_counter() - conn.info['perf_query_start'].pop()) * 1000
+    perf = g.perf
+    perf['queries'] += 1
+    perf['sql_ms'] += elapsed_ms
+    perf['statements'].append((elapsed_ms, ' '.join(statement.split())[:300]))
+    perf['statements'].sort(key=lambda item: item[0], reverse=True)
+    del perf['statements'][PERF_SLOWEST_STATEMENTS:]
+
+@before_render_template.connect_via(app)
+def _perf_before_render(sender, template, context, **extra):
+    if _perf_active():
+        g.perf['render_started'] = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def _perf_template_rendered(sender, template, context, **extra):
+    if _perf_active() and g.perf.get('render_started'):
+        g.perf['render_ms'] += (time.perf_counter() - g.perf.pop('render_started')) * 1000
+
+@app.before_request
+def start_request_instrumentation():
+    if app.config['PERF_INSTRUMENTATION'] and request.endpoint != 'static':
+        g.perf = {'started': time.perf_counter(), 'queries': 0, 'sql_ms': 0.0, 'render_ms': 0.0, 'statements': []}
+
+@app.after_request
+def finish_request_instrumentation(response):
+    if not _perf_active():
+        return response
+    perf = g.perf
+    total_ms = (time.perf_counter() - perf['started']) * 1000
+    endpoint = request.endpoint or 'unknown'
+    response.headers['X-Query-Count'] = str(perf['queries'])
+    response.headers['X-Query-Time-Ms'] = f"{perf['sql_ms']:.1f}"
+    response.headers['X-Render-Time-Ms'] = f"{perf['render_ms']:.1f}"
+    response.headers['Server-Timing'] = (f"db;dur={perf['sql_ms']:.1f}, render;dur={perf['render_ms']:.1f}, "
+                                         f"total;dur={total_ms:.1f}")
+
+    record = {
+        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'endpoint': endpoint,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'queries': perf['queries'],
+        'sql_ms': round(perf['sql_ms'], 2),
+        'render_ms': round(perf['render_ms'], 2),
+        'total_ms': round(total_ms, 2),
+        'slowest': [{'ms': round(ms, 2), 'sql': sql} for ms, sql in perf['statements']]
+    }
+    with _perf_lock:
+        _perf_history.setdefault(endpoint, deque(maxlen=PERF_HISTORY_SIZE)).append(record)
+        if app.config.get('PERF_LOG_PATH'):
+            try:
+                with open(app.config['PERF_LOG_PATH'], 'a') as log_file:
+                    log_file.write(json.dumps(record) + '\n')
+            except OSError as e:
+                print(f"Could not write performance log: {str(e)}")
+
+    budget = getattr(app.view_functions.get(request.endpoint), 'query_budget', None)
+    if budget is not None and perf['queries'] > budget:
+        response.headers['X-Query-Budget'] = str(budget)
+        message = f"{endpoint} ran {perf['queries']} queries, over its budget of {budget}"
+        if app.config.get('PERF_ENFORCE_BUDGETS', app.testing):
+            raise QueryBudgetExceeded(message)
+        print(f"Warning: {message}")
+    return response
+
+def get_perf_summary():
+    """Summarize the rolling request history per endpoint, slowest first"""
+    rows = []
+    with _perf_lock:
+        history = {endpoint: list(records) for endpoint, records in _perf_history.items()}
+    for endpoint, records in history.items():
+        query_counts = sorted(record['queries'] for record in records)
+        total_times = sorted(record['total_ms'] for record in records)
+        slowest = max(records, key=lambda record: record['total_ms'])
+        view = app.view_functions.get(endpoint)
+        rows.append({
+            'endpoint': endpoint,
+            'requests': len(records),
+            'avg_queries': sum(query_counts) / len(records),
+            'max_queries': query_counts[-1],
+            'budget': getattr(view, 'query_budget', None),
+            'avg_sql_ms': sum(record['sql_ms'] for record in records) / len(records),
+            'avg_render_ms': sum(record['render_ms'] for record in records) / len(records),
+            'avg_total_ms': sum(total_times) / len(records),
+            'p95_total_ms': total_times[min(len(total_times) - 1, int(len(total_times) * 0.95))],
+            'slowest': slowest['slowest']
+        })
+    rows.sort(key=lambda row: row['avg_total_ms'], reverse=True)
+    return rows
+
 @app.before_request
 def before_request():
     session.permanent = True  # Make session permanent
+    start_job_workers()  # Picks up jobs left queued by an earlier run
 
 @app.route('/')
 def index():
@@ -873,176 +3855,35 @@ def login():
 @app.route('/dashboard')
 @login_required
 @admin_required
+@query_budget(12)
 def dashboard():
-    # Get total farms
-    farms = Farm.query.all()
-    
-    # Get active batches
-    active_batches = Batch.query.filter(Batch.status.in_(['ongoing', 'closing'])).all()
-    
-    # Calculate total birds
-    total_birds = sum(batch.available_birds for batch in active_batches)
-    
-    # Get pending schedules count
-    pending_schedules_count = (
-        MedicineSchedule.query.filter_by(completed=False).count() +
-        VaccineSchedule.query.filter_by(completed=False).count() +
-        HealthMaterialSchedule.query.filter_by(completed=False).count()
-    )
-    
-    # Get upcoming schedules (next 7 days)
-    today = datetime.now().date()
-    next_week = today + timedelta(days=7)
-    
-    upcoming_schedules = []
-    
-    # Get medicine schedules
-    medicine_schedules = MedicineSchedule.query.filter(
-        MedicineSchedule.schedule_date >= today,
-        MedicineSchedule.schedule_date <= next_week
-    ).all()
-    upcoming_schedules.extend(medicine_schedules)
-    
-    # Get vaccine schedules
-    vaccine_schedules = VaccineSchedule.query.filter(
-        VaccineSchedule.scheduled_date >= today,
-        VaccineSchedule.scheduled_date <= next_week
-    ).all()
-    upcoming_schedules.extend(vaccine_schedules)
-    
-    # Get health material schedules
-    health_schedules = HealthMaterialSchedule.query.filter(
-        HealthMaterialSchedule.scheduled_date >= today,
-        HealthMaterialSchedule.scheduled_date <= next_week
-    ).all()
-    upcoming_schedules.extend(health_schedules)
-    
-    # Sort all schedules by date
-    upcoming_schedules.sort(key=lambda x: x.schedule_date if hasattr(x, 'schedule_date') else x.scheduled_date)
-    
-    # Aggregate profit by month for the last 12 months
-    # Get the last 12 months
-    today = datetime.now()
-    months = [(today.year if today.month - i > 0 else today.year - 1,
-               (today.month - i - 1) % 12 + 1) for i in range(11, -1, -1)]
+    data = get_dashboard_data(session.get('user_type'))
+    return render_template('dashboard.html', **data)
 
-    # Query profits grouped by year and month
-    profit_data = (
-        db.session.query(
-            extract('year', FinancialSummary.created_at).label('year'),
-            extract('month', FinancialSummary.created_at).label('month'),
-            func.sum(FinancialSummary.total_profit).label('profit')
-        )
-        .group_by('year', 'month')
-        .order_by('year', 'month')
-        .all()
-    )
-
-    # Query average FCR grouped by year and month
-    fcr_data = (
-        db.session.query(
-            extract('year', FinancialSummary.created_at).label('year'),
-            extract('month', FinancialSummary.created_at).label('month'),
-            func.avg(FinancialSummary.fcr_value).label('fcr')
-        )
-        .group_by('year', 'month')
-        .order_by('year', 'month')
-        .all()
-    )
+@app.route('/api/dashboard')
+@login_required
+@admin_required
+@query_budget(12)
+def api_dashboard():
+    return jsonify({'success': True, 'data': get_dashboard_data(session.get('user_type'))})
 
-    # Map (year, month) to profit and fcr
-    profit_map = {(int(row.year), int(row.month)): float(row.profit or 0) for row in profit_data}
-    fcr_map = {(int(row.year), int(row.month)): float(row.fcr or 0) for row in fcr_data}
+@app.route('/admin/perf')
+@login_required
+def admin_perf():
+    if session.get('user_type') != 'admin':
+        flash('Access denied. Administrators only.', 'error')
+        return redirect(url_for('dashboard'))
+    return render_template('perf.html', rows=get_perf_summary(), history_size=PERF_HISTORY_SIZE,
+                           log_path=app.config.get('PERF_LOG_PATH'))
 
-    # Prepare data for the last 12 months
-    profit_by_month = []
-    fcr_by_month = []
-    for year, month in months:
-        label = f"{calendar.month_abbr[month]} {year}"
-        profit = profit_map.get((year, month), 0)
-        fcr = fcr_map.get((year, month), 0)
-        profit_by_month.append({'month': label, 'profit': profit})
-        fcr_by_month.append({'month': label, 'fcr': fcr})
-    
-    # Calculate average FCR and total profit for the current month
-    current_year = today.year
-    current_month = today.month
-    this_month_summaries = FinancialSummary.query.filter(
-        extract('year', FinancialSummary.created_at) == current_year,
-        extract('month', FinancialSummary.created_at) == current_month
-    ).all()
-    if this_month_summaries:
-        avg_fcr_this_month = sum(fs.fcr_value or 0 for fs in this_month_summaries) / len(this_month_summaries)
-        total_profit_this_month = sum(fs.total_profit or 0 for fs in this_month_summaries)
-    else:
-        avg_fcr_this_month = 0
-        total_profit_this_month = 0
-    
-    # Get batches with high or medium risk remarks (excluding closed batches)
-    risk_updates = (
-        BatchUpdate.query
-        .join(Batch, BatchUpdate.batch_id == Batch.id)
-        .filter(BatchUpdate.remarks_priority.in_(['high', 'medium']))
-        .filter(Batch.status != 'closed')
-        .options(joinedload(BatchUpdate.batch))
-        .order_by(
-            BatchUpdate.remarks_priority.desc(),  # 'high' > 'medium'
-            BatchUpdate.created_at.desc()
-        )
-        .all()
-    )
-    # Group by batch, keep only the latest update per batch
-    seen_batches = set()
-    risk_batches = []
-    for update in risk_updates:
-        if update.batch_id not in seen_batches:
-            risk_batches.append({
-                'batch': update.batch,
-                'priority': update.remarks_priority,
-                'remark': update.remarks,
-                'created_at': update.created_at
-            })
-            seen_batches.add(update.batch_id)
-    
-    # Batch status overview
-    batch_status_counts = {
-        'ongoing': Batch.query.filter_by(status='ongoing').count(),
-        'closing': Batch.query.filter_by(status='closing').count(),
-        'closed': Batch.query.filter_by(status='closed').count(),
-    }
-    
-    # Mortality Rate Widget (this month)
-    month_updates = BatchUpdate.query.filter(
-        extract('year', BatchUpdate.created_at) == current_year,
-        extract('month', BatchUpdate.created_at) == current_month
-    ).all()
-    total_mortalities = sum(u.mortality_count for u in month_updates)
-    total_birds = sum(u.batch.total_birds if u.batch else 0 for u in month_updates)
-    if total_birds > 0:
-        avg_mortality_rate_this_month = (total_mortalities / total_birds) * 100
-    else:
-        avg_mortality_rate_this_month = 0
-    
-    # Get batches above 28 days old (ongoing or closing)
-    above_28_batches = []
-    for batch in active_batches:
-        if batch.get_age_days() > 28:
-            above_28_batches.append(batch)
-    
-    return render_template('dashboard.html',
-                         farms=farms,
-                         active_batches=active_batches,
-                         total_birds=total_birds,
-                         pending_schedules_count=pending_schedules_count,
-                         upcoming_schedules=upcoming_schedules,
-                         profit_by_month=profit_by_month,
-                         fcr_by_month=fcr_by_month,
-                         avg_fcr_this_month=avg_fcr_this_month,
-                         total_profit_this_month=total_profit_this_month,
-                         risk_batches=risk_batches,
-                         batch_status_counts=batch_status_counts,
-                         avg_mortality_rate_this_month=avg_mortality_rate_this_month,
-                         above_28_batches=above_28_batches)
+@app.route('/admin/perf/reset', methods=['POST'])
+@login_required
+def reset_admin_perf():
+    if session.get('user_type') != 'admin':
+        return jsonify({'success': False, 'message': 'Administrators only'}), 403
+    with _perf_lock:
+        _perf_history.clear()
+    return jsonify({'success': True})
 
 @app.route('/settings')
 @login_required
@@ -1134,20 +3975,19 @@ def update_system_settings():
 def farms():
     farms = Farm.query.all()
     farm_stats = {}
+    # Active batch counts and shed availability for every farm in two reads
+    active_batch_counts = dict(db.session.query(Batch.farm_id, func.count(Batch.id)).filter(
+        Batch.status.in_(ACTIVE_BATCH_STATUSES)
+    ).group_by(Batch.farm_id).all())
+    shed_availability = get_shed_availability()
     for farm in farms:
-        # Get active batches (ongoing and closing)
-        active_batches = Batch.query.filter(
-            Batch.farm_id == farm.id,
-            Batch.status.in_(['ongoing', 'closing'])
-        ).count()
-        
         # Get completely available sheds
-        shed_available = farm.get_shed_available_capacities()
+        shed_available = shed_availability.get(farm.id, [])
         shed_capacities = farm.get_shed_capacities()
         completely_available_sheds = sum(1 for available, capacity in zip(shed_available, shed_capacities) if available == capacity)
         
         farm_stats[farm.id] = {
-            'ongoing_batches': active_batches,
+            'ongoing_batches': active_batch_counts.get(farm.id, 0),
             'completely_available_sheds': completely_available_sheds
         }
     
@@ -1243,56 +4083,18 @@ def delete_farm(farm_id):
         if active_batches:
             return jsonify({
                 'success': False, 
-                'message': 'Cannot delete farm with active batches. Please close all batches first.'
-            })
-
-        # Get all batches for this farm
-        batches = Batch.query.filter_by(farm_id=farm_id).all()
-        
-        for batch in batches:
-            # Delete all batch updates and their associations
-            for update in batch.updates:
-                # Delete feed associations
-                db.session.execute(
-                    batch_update_feeds.delete().where(
-                        batch_update_feeds.c.batch_update_id == update.id
-                    )
-                )
-                # Delete items (medicines, health materials, vaccines)
-                BatchUpdateItem.query.filter_by(batch_update_id=update.id).delete()
-                # Delete miscellaneous items
-                MiscellaneousItem.query.filter_by(batch_update_id=update.id).delete()
-                db.session.delete(update)
-            
-            # Delete vaccine schedule associations
-            db.session.execute(
-                vaccine_schedule_batches.delete().where(
-                    vaccine_schedule_batches.c.batch_id == batch.id
-                )
-            )
-            
-            # Delete medicine schedule associations
-            db.session.execute(
-                medicine_schedule_batches.delete().where(
-                    medicine_schedule_batches.c.batch_id == batch.id
-                )
-            )
-            
-            # Delete health material schedule associations
-            db.session.execute(
-                health_material_schedule_batches.delete().where(
-                    health_material_schedule_batches.c.batch_id == batch.id
-                )
-            )
-            
-            # Delete harvests
-            Harvest.query.filter_by(batch_id=batch.id).delete()
-            
-            # Finally delete the batch
-            db.session.delete(batch)
-        
-        # Delete the farm
-        db.session.delete(farm)
+                'message': 'Cannot delete farm with active batches. Please close all batches first.'
+            })
+
+        # Large farms can be deleted chunk by chunk in the background to keep lock hold times short
+        data = request.get_json(silent=True) or {}
+        if data.get('background') or request.values.get('background'):
+            farm_name = farm.name
+            job = enqueue_job('delete_farm', farm_id=farm_id)
+            db.session.commit()
+            return jsonify({'success': True, 'message': f'Deleting farm {farm_name} in the background', 'job_id': job.id}), 202
+
+        delete_farm_records(farm_id)
         db.session.commit()
         return jsonify({'success': True})
     except Exception as e:
@@ -1302,49 +4104,74 @@ def delete_farm(farm_id):
 # Batch Management Routes
 @app.route('/batches')
 @login_required
+@query_budget(8)
 def batches():
-    batches = Batch.query.all()
+    batches, next_cursor = get_keyset_page(batch_query('list'), (Batch.created_at, Batch.id))
     farms = Farm.query.all()
     managers = User.query.filter(User.user_type.in_(['manager', 'assistant_supervisor', 'senior_supervisor'])).all()
     return render_template('batches.html', 
                          batches=batches,
+                         next_cursor=next_cursor,
+                         last_updates=get_latest_updates([batch.id for batch in batches]),
                          farms=farms,
                          managers=managers,
                          now=datetime.now(),
                          timedelta=timedelta)  # Add timedelta to template context
 
+@app.route('/api/batches')
+@login_required
+@query_budget(8)
+def batches_page():
+    """The next page of the batch list after ?cursor=, as JSON with the rendered rows and cards"""
+    try:
+        batches, next_cursor = get_keyset_page(batch_query('list'), (Batch.created_at, Batch.id),
+                                               request.args.get('cursor'), request.args.get('limit', type=int))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    context = dict(batches=batches, last_updates=get_latest_updates([batch.id for batch in batches]),
+                   now=datetime.now(), timedelta=timedelta)
+    return jsonify({
+        'success': True,
+        'batches': [{
+            'id': batch.id,
+            'batch_number': batch.batch_number,
+            'farm': batch.farm.name,
+            'status': batch.status,
+            'total_birds': batch.total_birds,
+            'available_birds': batch.available_birds,
+            'total_mortality': batch.total_mortality,
+            'created_at': batch.created_at.isoformat()
+        } for batch in batches],
+        'html': {
+            'rows': render_template('_batch_rows.html', **context),
+            'cards': render_template('_batch_cards.html', **context)
+        },
+        'next_cursor': next_cursor
+    })
+
 def generate_batch_number():
-    # Get the last batch number
-    last_batch = Batch.query.order_by(Batch.id.desc()).first()
-    if last_batch:
-        # Extract the number from the last batch number and increment
-        try:
-            last_number = int(last_batch.batch_number.split('-')[1])
-            new_number = last_number + 1
-        except (IndexError, ValueError):
-            new_number = 1
-    else:
-        new_number = 1
+    """Take the next global BATCH-0001 style number"""
+    connection = db.session.connection()
+    new_number = next_sequence_value(connection, BATCH_NUMBER_SEQUENCE)
+    if new_number is None:
+        seed_batch_number_sequence(connection)
+        new_number = next_sequence_value(connection, BATCH_NUMBER_SEQUENCE)
     
     # Format the new batch number with leading zeros
     return f"BATCH-{new_number:04d}"
 
-def get_next_farm_batch_number(farm_id, new_shed_allocation=None):
-    farm = Farm.query.get(farm_id)
-    if not farm:
-        return 1  # fallback
-
+def get_next_farm_batch_number(farm, new_shed_allocation=None):
     # 1. If the farm only contains one shed, set its farm_number as zero
     if farm.num_sheds == 1:
         return 0
 
     # 2. If the farm doesn't have any ongoing or closing batches and all sheds are either partially filled or fully filled, set farm_number as zero
-    active_batches = Batch.query.filter(
-        Batch.farm_id == farm_id,
-        Batch.status.in_(['ongoing', 'closing'])
-    ).all()
-    shed_capacities = farm.get_shed_capacities() if hasattr(farm, 'get_shed_capacities') else []
-    shed_available = farm.get_shed_available_capacities() if hasattr(farm, 'get_shed_available_capacities') else []
+    has_active_batches = db.session.query(Batch.query.filter(
+        Batch.farm_id == farm.id,
+        Batch.status.in_(ACTIVE_BATCH_STATUSES)
+    ).exists()).scalar()
+    shed_capacities = farm.get_shed_capacities()
+    shed_available = get_shed_availability([farm.id]).get(farm.id, [])
 
     # Subtract the allocation for the currently entering batch if provided
     if new_shed_allocation and len(new_shed_allocation) == len(shed_available):
@@ -1354,21 +4181,11 @@ def get_next_farm_batch_number(farm_id, new_shed_allocation=None):
     fully_empty_sheds = [avail for avail, cap in zip(shed_available, shed_capacities) if avail == cap]
 
     # If there are no ongoing/closing batches and there are no fully empty sheds, treat as not available for new batch
-    if not active_batches and not fully_empty_sheds:
+    if not has_active_batches and not fully_empty_sheds:
         return 0
 
-    # Get all batch numbers for this farm (used by any batch)
-    farm_batches = Batch.query.filter_by(farm_id=farm_id).all()
-    used_numbers = sorted({batch.farm_batch_number for batch in farm_batches if batch.farm_batch_number is not None and batch.farm_batch_number > 0})
-
-    # Find the lowest missing positive integer
-    next_number = 1
-    for num in used_numbers:
-        if num == next_number:
-            next_number += 1
-        elif num > next_number:
-            break
-    return next_number
+    # Lowest positive number not used by any batch of this farm
+    return allocate_farm_batch_number(farm.id)
 
 @app.route('/batches/add', methods=['GET', 'POST'])
 @login_required
@@ -1397,7 +4214,7 @@ def add_batch():
             if farm_number != 0:
                 farm_batch_number = farm_number
             else:
-                farm_batch_number = get_next_farm_batch_number(farm_id, shed_birds)
+                farm_batch_number = get_next_farm_batch_number(farm, shed_birds)
 
             # Create new batch
             batch = Batch(
@@ -1409,13 +4226,15 @@ def add_batch():
                 total_birds=total_birds,
                 extra_chicks=extra_chicks,
                 available_birds=total_birds,
-                shed_birds=json.dumps(shed_birds),
                 cost_per_chicken=cost_per_chicken,
                 created_at=created_at
             )
+            batch.farm = farm
+            batch.set_shed_birds(shed_birds)
 
             db.session.add(batch)
             db.session.flush()  # Get the batch ID without committing
+            db.session.add(BatchLedger(batch=batch))
 
             # Create schedules for the batch
             create_schedules_for_batch(batch)
@@ -1434,10 +4253,14 @@ def add_batch():
     
     # Create farm_sheds dictionary with proper JSON serializable values
     farm_sheds = {}
+    shed_availability = get_shed_availability()
+    active_birds = dict(db.session.query(Batch.farm_id, func.sum(Batch.total_birds)).filter(
+        Batch.status.in_(ACTIVE_BATCH_STATUSES)
+    ).group_by(Batch.farm_id).all())
     for farm in farms:
         try:
             shed_capacities = farm.get_shed_capacities()
-            shed_available = farm.get_shed_available_capacities()
+            shed_available = shed_availability.get(farm.id, [])
             shed_status = []
             
             for cap, avail in zip(shed_capacities, shed_available):
@@ -1446,6 +4269,7 @@ def add_batch():
                 })
             
             farm_sheds[str(farm.id)] = {
+                'available_capacity': farm.total_capacity - (active_birds.get(farm.id) or 0),
                 'num_sheds': int(farm.num_sheds),
                 'shed_capacities': [int(cap) for cap in shed_capacities],
                 'shed_available': [int(avail) for avail in shed_available],
@@ -1515,9 +4339,10 @@ def edit_batch(batch_id):
             # Calculate total harvested birds
             total_harvested = sum(harvest.quantity for harvest in batch.harvests)
             batch.available_birds = total_birds - batch.total_mortality - total_harvested
-            batch.shed_birds = json.dumps(shed_birds)
+            batch.set_shed_birds(shed_birds)
             batch.cost_per_chicken = cost_per_chicken
             batch.created_at = new_created_at
+            refresh_batch_daily_metrics(batch)
 
             db.session.commit()
             flash('Batch updated successfully', 'success')
@@ -1534,8 +4359,49 @@ def edit_batch(batch_id):
 @app.route('/batches/<int:batch_id>/view')
 @login_required
 def view_batch(batch_id):
+    batch = batch_query('detail').filter(Batch.id == batch_id).first_or_404()
+    detail = get_batch_detail(batch, with_updates=False)
+    daily_metrics = get_batch_daily_metrics(batch)
+    # The timeline starts with the latest page; older updates load as it scrolls
+    timeline, next_cursor = get_update_page(batch.id)
+    return render_template('view_batch.html', batch=detail['batch'], detail=detail, daily_metrics=daily_metrics,
+                           daily_series=[metric.to_dict() for metric in daily_metrics],
+                           updates=timeline, next_cursor=next_cursor)
+
+@app.route('/api/batches/<int:batch_id>')
+@login_required
+@query_budget(12)
+def batch_detail(batch_id):
+    """The batch page's data as JSON, for the offline app"""
+    batch = batch_query('detail').filter(Batch.id == batch_id).first_or_404()
+    if session.get('user_type') == 'assistant_supervisor' and batch.manager_id != session.get('user_id'):
+        return jsonify({'success': False, 'message': 'You do not have access to this batch'}), 403
+    detail = get_batch_detail(batch)
+    if session.get('user_type') != 'admin':
+        detail['financial_summary'] = None
+    return jsonify({'success': True, 'detail': jsonable(detail)})
+
+def get_update_page(batch_id, cursor=None, limit=None):
+    """One page of a batch's update timeline as update views, newest first, and the next page's cursor"""
+    rows, next_cursor = get_keyset_page(db.session.query(BatchUpdate.date, BatchUpdate.id).filter(
+        BatchUpdate.batch_id == batch_id), (BatchUpdate.date, BatchUpdate.id), cursor, limit)
+    return get_update_views(batch_id, [row.id for row in rows])[::-1], next_cursor
+
+@app.route('/api/batches/<int:batch_id>/updates')
+@login_required
+def batch_updates_page(batch_id):
+    """The next page of a batch's update timeline after ?cursor=, as JSON with the rendered rows"""
     batch = Batch.query.get_or_404(batch_id)
-    return render_template('view_batch.html', batch=batch)
+    try:
+        updates, next_cursor = get_update_page(batch.id, request.args.get('cursor'), request.args.get('limit', type=int))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'updates': jsonable(updates),
+        'html': {'updates': render_template('_update_rows.html', batch=batch, updates=updates)},
+        'next_cursor': next_cursor
+    })
 
 @app.route('/batches/<int:batch_id>/delete', methods=['POST'])
 @login_required
@@ -1547,83 +4413,12 @@ def delete_batch(batch_id):
         return jsonify({'success': False, 'message': 'You do not have permission to delete this batch'})
     
     try:
-        # First, delete all schedules associated with this batch
-        try:
-            # Delete medicine schedules
-            medicine_schedules = MedicineSchedule.query.filter(
-                MedicineSchedule.batches.any(id=batch.id)
-            ).all()
-            for schedule in medicine_schedules:
-                db.session.delete(schedule)
-            
-            # Delete vaccine schedules
-            vaccine_schedules = VaccineSchedule.query.filter(
-                VaccineSchedule.batches.any(id=batch.id)
-            ).all()
-            for schedule in vaccine_schedules:
-                db.session.delete(schedule)
-            
-            # Delete health material schedules
-            health_material_schedules = HealthMaterialSchedule.query.filter(
-                HealthMaterialSchedule.batches.any(id=batch.id)
-            ).all()
-            for schedule in health_material_schedules:
-                db.session.delete(schedule)
-            
-            db.session.flush()
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'success': False, 'message': f'Error deleting schedules: {str(e)}'})
-
-        # Delete all batch updates and their items
-        updates = BatchUpdate.query.filter_by(batch_id=batch.id).all()
-        for update in updates:
-            try:
-                # Delete all items associated with this update
-                BatchUpdateItem.query.filter_by(batch_update_id=update.id).delete()
-                # Delete all miscellaneous items
-                MiscellaneousItem.query.filter_by(batch_update_id=update.id).delete()
-                # Delete feed associations
-                db.session.execute(
-                    batch_update_feeds.delete().where(
-                        batch_update_feeds.c.batch_update_id == update.id
-                    )
-                )
-                # Delete the update itself
-                db.session.delete(update)
-                db.session.flush()
-            except Exception as e:
-                db.session.rollback()
-                return jsonify({'success': False, 'message': f'Error deleting batch update {update.id}: {str(e)}'})
-        
-        # Delete all harvests
-        try:
-            Harvest.query.filter_by(batch_id=batch.id).delete()
-            db.session.flush()
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'success': False, 'message': f'Error deleting harvests: {str(e)}'})
-        
-        # Delete financial summary
-        try:
-            FinancialSummary.query.filter_by(batch_id=batch.id).delete()
-            db.session.flush()
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'success': False, 'message': f'Error deleting financial summary: {str(e)}'})
-        
-        # Finally delete the batch
-        try:
-            db.session.delete(batch)
-            db.session.commit()
-            return jsonify({'success': True, 'message': 'Batch deleted successfully'})
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'success': False, 'message': f'Error deleting batch: {str(e)}'})
-        
+        delete_batches([batch.id])
+        db.session.commit()
+        return jsonify({'success': True, 'message': 'Batch deleted successfully'})
     except Exception as e:
         db.session.rollback()
-        return jsonify({'success': False, 'message': f'An unexpected error occurred: {str(e)}'})
+        return jsonify({'success': False, 'message': f'Error deleting batch: {str(e)}'})
 
 @app.route('/batches/<int:batch_id>/update-status', methods=['POST'])
 @login_required
@@ -1639,24 +4434,28 @@ def update_batch_status(batch_id):
                 'message': 'Invalid status'
             }), 400
         
+        ledger = get_batch_ledger(batch)
+
         # If changing from closed to another status, remove the financial summary
         if batch.status == 'closed' and new_status != 'closed':
+            ledger.unfreeze()
             if batch.financial_summary:
                 db.session.delete(batch.financial_summary)
         
-        # If changing to closed, create or update financial summary
+        # If changing to closed, freeze the ledger and build the financial summary in the background
+        job = None
         if new_status == 'closed':
             batch.closed_at = datetime.now()  # Set the closed date
-            financial_summary = batch.financial_summary or FinancialSummary(batch_id=batch.id)
-            financial_summary.calculate_summary(batch)
-            db.session.add(financial_summary)
+            ledger.freeze()
+            job = enqueue_job('calculate_summary', batch_id=batch.id)
         
         batch.status = new_status
         db.session.commit()
         
         return jsonify({
             'success': True,
-            'message': f'Batch status updated to {new_status}'
+            'message': f'Batch status updated to {new_status}',
+            'job_id': job.id if job else None
         })
     except Exception as e:
         db.session.rollback()
@@ -1681,11 +4480,7 @@ def update_batch(batch_id):
             form_date = datetime.strptime(form_date_str, '%Y-%m-%d').date()
         except (TypeError, ValueError):
             form_date = selected_date
-        # Check for existing update for the form date
-        existing_update = BatchUpdate.query.filter_by(batch_id=batch.id, date=form_date).first()
-        if existing_update:
-            flash('An update has already been submitted for this batch on the selected date.', 'error')
-            return redirect(url_for('update_batch', batch_id=batch.id, date=form_date_str))
+        ledger = get_batch_ledger(batch)
 
         # Create new batch update
         mortality_count = int(request.form.get('mortality_count', 0))
@@ -1714,6 +4509,13 @@ def update_batch(batch_id):
             remarks_priority=remarks_priority
         )
         db.session.add(new_update)
+        try:
+            db.session.flush()  # Get the new_update.id
+        except IntegrityError:
+            # uq_batch_update_batch_date allows one update per batch per day
+            db.session.rollback()
+            flash('An update has already been submitted for this batch on the selected date.', 'error')
+            return redirect(url_for('update_batch', batch_id=batch_id, date=form_date_str))
 
         # Process feed allocation
         feed_ids = request.form.getlist('feed_id[]')
@@ -1724,7 +4526,7 @@ def update_batch(batch_id):
                 feed_id = int(feed_ids[i])
                 quantity = float(feed_quantities[i])
                 
-                feed = Feed.query.get(feed_id)
+                feed = get_catalog('feed').get(feed_id)
                 if feed:
                     # Update batch feed stock
                     batch.feed_stock += quantity
@@ -1734,9 +4536,9 @@ def update_batch(batch_id):
                         batch_update_id=new_update.id,
                         feed_id=feed_id,
                         quantity=quantity,
-                        price_at_time=feed.price, # Store price at the time of update
-                        quantity_per_unit_at_time=feed.weight,
-                        total_cost=quantity * feed.price
+                        price_at_time=feed['price'], # Store price at the time of update
+                        quantity_per_unit_at_time=feed['weight'],
+                        total_cost=quantity * feed['price']
                     )
                     db.session.execute(update_feed)
 
@@ -1784,14 +4586,13 @@ def update_batch(batch_id):
                                 item = None
                                 if item_type == 'medicine':
                                     schedule = MedicineSchedule.query.get(item_id)
-                                    item = schedule.medicine if schedule else None
+                                    item = get_catalog('medicine').get(schedule.medicine_id) if schedule else None
                                 elif item_type == 'health_material':
                                     schedule = HealthMaterialSchedule.query.get(item_id)
-                                    item = schedule.health_material if schedule else None
+                                    item = get_catalog('health_material').get(schedule.health_material_id) if schedule else None
                                 elif item_type == 'vaccine':
                                     schedule = VaccineSchedule.query.get(item_id)
-                                    item = schedule.vaccine if schedule else None
-                                    item.unit_type = 'ml'
+                                    item = get_catalog('vaccine').get(schedule.vaccine_id) if schedule else None
 
                                 # if item.unit_type:
                                 #     unit_type = item.unit_type
@@ -1802,13 +4603,13 @@ def update_batch(batch_id):
                                     # Create batch update item with current price and schedule ID
                                     update_item = BatchUpdateItem(
                                         batch_update_id=new_update.id,
-                                        item_id=item.id,
+                                        item_id=item['id'],
                                         item_type=item_type,
                                         quantity=quantity,
-                                        quantity_per_unit_at_time=item.quantity_per_unit,  # Use item's quantity_per_unit
-                                        unit_type=item.unit_type,  # Add unit_type from item
-                                        price_at_time=item.price,
-                                        total_cost=item.price * quantity,
+                                        quantity_per_unit_at_time=item['quantity_per_unit'],  # Use item's quantity_per_unit
+                                        unit_type=item['unit_type'],  # Add unit_type from item
+                                        price_at_time=item['price'],
+                                        total_cost=item['price'] * quantity,
                                         schedule_id=schedule.id,
                                         dose_number=schedule.dose_number if item_type == 'vaccine' else None
                                     )
@@ -1826,43 +4627,16 @@ def update_batch(batch_id):
                     print(f"Error processing scheduled item {key}: {str(e)}")
                     continue
 
+        db.session.flush()
+        ledger.apply(get_update_ledger_delta(new_update.id))
+        refresh_batch_daily_metrics(batch, new_update.date)
         db.session.commit()
         flash('Batch update recorded successfully!', 'success')
         return redirect(url_for('view_batch', batch_id=batch.id))
     
     # GET request - show form
     existing_update = BatchUpdate.query.filter_by(batch_id=batch.id, date=selected_date).first()
-    managers = User.query.filter(User.user_type.in_(['senior_supervisor', 'assistant_supervisor'])).all()
-    medicines = Medicine.query.all()
-    medicines_dict = [{
-        'id': m.id,
-        'name': m.name,
-        'quantity_per_unit': m.quantity_per_unit,
-        'unit_type': m.unit_type,
-        'price': m.price,
-        'notes': m.notes
-    } for m in medicines]
-    health_materials = HealthMaterial.query.all()
-    health_materials_dict = [{
-        'id': h.id,
-        'name': h.name,
-        'category': h.category,
-        'quantity_per_unit': h.quantity_per_unit,
-        'unit_type': h.unit_type,
-        'price': h.price,
-        'notes': h.notes
-    } for h in health_materials]
-    vaccines = Vaccine.query.all()
-    vaccines_dict = [{
-        'id': v.id,
-        'name': v.name,
-        'quantity_per_unit': v.quantity_per_unit,
-        'price': v.price,
-        'doses_required': v.doses_required,
-        'dose_ages': v.get_dose_ages(),
-        'notes': v.notes
-    } for v in vaccines]
-    feeds = Feed.query.all()
+    catalogs = {name: get_catalog(name) for name in CATALOG_MODELS}
 
     # Get scheduled items for today
     medicine_schedules = MedicineSchedule.query.filter(
@@ -1888,10 +4662,8 @@ def update_batch(batch_id):
                          medicine_schedules=medicine_schedules,
                          health_material_schedules=health_material_schedules,
                          vaccine_schedules=vaccine_schedules,
-                         medicines=medicines_dict,
-                         health_materials=health_materials_dict,
-                         vaccines=vaccines_dict,
-                         feeds=feeds,
+                         catalogs=catalogs,
+                         feeds=catalogs['feed'].entries,
                          today=datetime.now().date(),
                          selected_date=selected_date,
                          existing_update=existing_update)
@@ -1924,26 +4696,20 @@ def get_batch_update(batch_id, date):
         
         # Get feeds with their quantities and prices
         feeds = []
-        for feed in update.feeds:
-            try:
-                stmt = batch_update_feeds.select().where(
-                    batch_update_feeds.c.batch_update_id == update.id,
-                    batch_update_feeds.c.feed_id == feed.id
-                )
-                result = db.session.execute(stmt).first()
-                if result:
-                    feeds.append({
-                        'id': feed.id,
-                        'brand': feed.brand,
-                        'category': feed.category,
-                        'quantity': float(result.quantity),
-                        'quantity_per_unit_at_time': float(result.quantity_per_unit_at_time),
-                        'price_at_time': float(result.price_at_time),
-                        'total_cost': float(result.total_cost)
-                    })
-            except Exception as e:
-                print(f"Error getting feed data for feed {feed.id}: {str(e)}")
-                continue
+        feed_catalog = get_catalog('feed')
+        for result in db.session.execute(batch_update_feeds.select().where(
+                batch_update_feeds.c.batch_update_id == update.id).order_by(batch_update_feeds.c.feed_id)):
+            feed = feed_catalog.get(result.feed_id)
+            if feed:
+                feeds.append({
+                    'id': feed['id'],
+                    'brand': feed['brand'],
+                    'category': feed['category'],
+                    'quantity': float(result.quantity),
+                    'quantity_per_unit_at_time': float(result.quantity_per_unit_at_time),
+                    'price_at_time': float(result.price_at_time),
+                    'total_cost': float(result.total_cost)
+                })
         
         # Get items with their details
         items = []
@@ -1961,31 +4727,15 @@ def get_batch_update(batch_id, date):
                 }
                 
                 # Get the actual item details based on type
-                if item.item_type == 'medicine':
-                    medicine = Medicine.query.get(item.item_id)
-                    if medicine:
-                        item_data.update({
-                            'name': medicine.name,
-                            'unit_type': medicine.unit_type,
-                            'notes': medicine.notes
-                        })
-                elif item.item_type == 'health_material':
-                    material = HealthMaterial.query.get(item.item_id)
-                    if material:
-                        item_data.update({
-                            'name': material.name,
-                            'category': material.category,
-                            'unit_type': material.unit_type,
-                            'notes': material.notes
-                        })
-                elif item.item_type == 'vaccine':
-                    vaccine = Vaccine.query.get(item.item_id)
-                    if vaccine:
-                        item_data.update({
-                            'name': vaccine.name,
-                            'unit_type': 'ml',
-                            'notes': vaccine.notes
-                        })
+                catalog_item = item.get_item()
+                if catalog_item:
+                    item_data.update({
+                        'name': catalog_item['name'],
+                        'unit_type': catalog_item['unit_type'],
+                        'notes': catalog_item['notes']
+                    })
+                    if item.item_type == 'health_material':
+                        item_data['category'] = catalog_item['category']
                 
                 items.append(item_data)
             except Exception as e:
@@ -2044,7 +4794,7 @@ def edit_batch_update(batch_id, date):
         # Find the update for the specified date
         update = BatchUpdate.query.filter(
             BatchUpdate.batch_id == batch_id,
-            db.func.date(BatchUpdate.date) == update_date
+            BatchUpdate.date == update_date
         ).first()
         
         if not update:
@@ -2104,6 +4854,9 @@ def edit_batch_update(batch_id, date):
                 remarks = request.form.get('remarks', '')
                 remarks_priority = request.form.get('remarks_priority', 'low')
 
+                ledger = get_batch_ledger(batch)
+                old_ledger_delta = get_update_ledger_delta(update.id)
+
                 # Get old feed used
                 old_feed_used = update.feed_used
 
@@ -2188,16 +4941,16 @@ def edit_batch_update(batch_id, date):
                 # Process feeds
                 for feed_id, quantity in zip(feed_data, feed_quantities):
                     if feed_id and quantity and float(quantity) > 0:
-                        feed = Feed.query.get(int(feed_id))
+                        feed = get_catalog('feed').get(int(feed_id))
                         if feed:
                             # Create BatchUpdateItem for feed instead of using the relationship
                             stmt = batch_update_feeds.insert().values(
                                 batch_update_id=update.id,
                                 feed_id=feed_id,
                                 quantity=float(quantity),
-                                quantity_per_unit_at_time=feed.weight,
-                                price_at_time=feed.price,
-                                total_cost=float(quantity) * feed.price
+                                quantity_per_unit_at_time=feed['weight'],
+                                price_at_time=feed['price'],
+                                total_cost=float(quantity) * feed['price']
                             )
                             db.session.execute(stmt)
 
@@ -2254,12 +5007,11 @@ def edit_batch_update(batch_id, date):
                                             # Get the item to get its current price
                                             item = None
                                             if item_type == 'medicine':
-                                                item = Medicine.query.get(item_id)
+                                                item = get_catalog('medicine').get(item_id)
                                             elif item_type == 'health_material':
-                                                item = HealthMaterial.query.get(item_id)
+                                                item = get_catalog('health_material').get(item_id)
                                             elif item_type == 'vaccine':
-                                                item = Vaccine.query.get(item_id)
-                                                item.unit_type = 'ml'
+                                                item = get_catalog('vaccine').get(item_id)
                                             
                                             if item:
                                                 # Create batch update item with current price
@@ -2268,10 +5020,10 @@ def edit_batch_update(batch_id, date):
                                                     item_id=item_id,
                                                     item_type=item_type,
                                                     quantity=quantity,
-                                                    quantity_per_unit_at_time=item.quantity_per_unit,  # Use item's quantity_per_unit
-                                                    unit_type=item.unit_type,  # Add unit_type from item
-                                                    price_at_time=item.price,
-                                                    total_cost=item.price * quantity,
+                                                    quantity_per_unit_at_time=item['quantity_per_unit'],  # Use item's quantity_per_unit
+                                                    unit_type=item['unit_type'],  # Add unit_type from item
+                                                    price_at_time=item['price'],
+                                                    total_cost=item['price'] * quantity,
                                                     schedule_id=schedule.id,
                                                     dose_number=schedule.dose_number if item_type == 'vaccine' else None
                                                 )
@@ -2300,27 +5052,26 @@ def edit_batch_update(batch_id, date):
                                         # Get the appropriate item
                                         item = None
                                         if item_type == 'medicine':
-                                            item = Medicine.query.get(item_id)
+                                            item = get_catalog('medicine').get(item_id)
                                         elif item_type == 'health_material':
-                                            item = HealthMaterial.query.get(item_id)
+                                            item = get_catalog('health_material').get(item_id)
                                         elif item_type == 'vaccine':
-                                            item = Vaccine.query.get(item_id)
+                                            item = get_catalog('vaccine').get(item_id)
                                             dose_number_key = f'other_items[{item_type}][{index}][dose_number]'
                                             dose_number = int(request.form.get(dose_number_key, 1) or 1)
-                                            item.unit_type = 'ml'
                                         
                                         if item:
                                             # Create batch update item with current price
-                                            print(f"Saving {item_type}: id={item.id}, quantity={quantity}, batch_update_id={update.id}")
+                                            print(f"Saving {item_type}: id={item['id']}, quantity={quantity}, batch_update_id={update.id}")
                                             update_item = BatchUpdateItem(
                                                 batch_update_id=update.id,
-                                                item_id=item.id,
+                                                item_id=item['id'],
                                                 item_type=item_type,
                                                 quantity=quantity,
-                                                quantity_per_unit_at_time=item.quantity_per_unit,  # Use item's quantity_per_unit
-                                                unit_type=item.unit_type,  # Add unit_type from item
-                                                price_at_time=item.price,
-                                                total_cost=item.price * quantity,
+                                                quantity_per_unit_at_time=item['quantity_per_unit'],  # Use item's quantity_per_unit
+                                                unit_type=item['unit_type'],  # Add unit_type from item
+                                                price_at_time=item['price'],
+                                                total_cost=item['price'] * quantity,
                                                 schedule_id=None,  # No schedule ID for other items
                                                 dose_number=dose_number if item_type == 'vaccine' else None
                                             )
@@ -2331,6 +5082,9 @@ def edit_batch_update(batch_id, date):
                             print(f"Error processing other item {key}: {str(e)}")
                             continue
 
+                db.session.flush()
+                ledger.apply(subtract_ledger_delta(get_update_ledger_delta(update.id), old_ledger_delta))
+                refresh_batch_daily_metrics(batch, update.date)
                 db.session.commit()
                 flash('Batch update edited successfully!', 'success')
                 return redirect(url_for('view_batch', batch_id=batch.id))
@@ -2344,10 +5098,10 @@ def edit_batch_update(batch_id, date):
                 flash('Error saving batch update. Please try again.', 'error')
         
         # Get available items for extra items
-        medicines = Medicine.query.all()
-        health_materials = HealthMaterial.query.all()
-        vaccines = Vaccine.query.all()
-        feeds = Feed.query.all()
+        medicines = get_catalog('medicine').entries
+        health_materials = get_catalog('health_material').entries
+        vaccines = get_catalog('vaccine').entries
+        feeds = get_catalog('feed').entries
                 
         return render_template('edit_batch_update.html',
                              batch=batch,
@@ -2384,7 +5138,7 @@ def delete_batch_update(batch_id, date):
         # Find the update for the specified date
         update = BatchUpdate.query.filter(
             BatchUpdate.batch_id == batch_id,
-            db.func.date(BatchUpdate.date) == update_date
+            BatchUpdate.date == update_date
         ).first()
         
         if not update:
@@ -2430,8 +5184,12 @@ def delete_batch_update(batch_id, date):
         # Update batch feed stock
         batch.feed_stock = max(0, batch.feed_stock - total_feed_quantity + update.feed_used)
         
+        # Remove the update's contribution from the running ledger
+        get_batch_ledger(batch).apply(get_update_ledger_delta(update.id), sign=-1)
+        
         # Delete the update
         db.session.delete(update)
+        refresh_batch_daily_metrics(batch, update.date)
         db.session.commit()
         
         return jsonify({
@@ -2447,6 +5205,74 @@ def delete_batch_update(batch_id, date):
             'message': 'An error occurred while deleting the update.'
         }), 500
 
+@app.route('/api/catalogs', defaults={'name': None})
+@app.route('/api/catalogs/<any(feed, medicine, vaccine, health_material):name>')
+@login_required
+@query_budget(8)
+def catalogs_api(name):
+    """The catalogs (or one of them) as JSON, with an ETag of their versions so unchanged ones come back as 304"""
+    catalogs = [get_catalog(catalog_name) for catalog_name in ([name] if name else CATALOG_MODELS)]
+    body = '{' + ', '.join(f'{json.dumps(catalog.name)}: {catalog.json}' for catalog in catalogs) + '}'
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag('-'.join(f'{catalog.name}.{catalog.version}' for catalog in catalogs))
+    # Let browsers and the service worker keep the payload but check the ETag every time
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/batch-updates', methods=['POST'])
+@login_required
+def batch_updates_api():
+    """Record daily updates for many batches and dates from one JSON body, {"updates": [...]}, with a result per update"""
+    data = request.get_json(silent=True)
+    entries = data.get('updates') if isinstance(data, dict) else None
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'success': False, 'message': 'Expected a JSON body {"updates": [...]} with at least one update'}), 400
+    if len(entries) > BATCH_UPDATE_LIMIT:
+        return jsonify({'success': False, 'message': f'At most {BATCH_UPDATE_LIMIT} updates can be sent at once'}), 400
+    try:
+        results = apply_batch_updates(entries, session.get('user_type'), session.get('user_id'))
+        db.session.commit()
+    except IntegrityError:
+        # uq_batch_update_batch_date: another request saved one of these updates since they were checked
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': 'An update for one of these batches and dates was saved at the same time. Nothing was recorded, please retry.'
+        }), 409
+    created = sum(1 for result in results if result['status'] == 'created')
+    return jsonify({
+        'success': created == len(results),
+        'message': f'{created} of {len(results)} updates recorded',
+        'results': results
+    })
+
+@app.route('/api/sync', methods=['POST'])
+@login_required
+def sync_api():
+    """Replay operations queued offline, {"operations": [{"key", "kind", "data"}, ...]}, in order with a result per operation"""
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'success': False, 'message': 'Expected a JSON body {"operations": [...]} with at least one operation'}), 400
+    if len(operations) > SYNC_OPERATION_LIMIT:
+        return jsonify({'success': False, 'message': f'At most {SYNC_OPERATION_LIMIT} operations can be sent at once'}), 400
+    try:
+        results = apply_sync_operations(operations, session.get('user_type'), session.get('user_id'))
+        db.session.commit()
+    except IntegrityError:
+        # Another request recorded one of these keys, or an update for the same batch and date, since they were checked
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': 'Some of these operations were saved at the same time by another request. Nothing was recorded, please retry.'
+        }), 409
+    applied = sum(1 for result in results if result['status'] in ('created', 'completed'))
+    return jsonify({
+        'success': applied == len(results),
+        'message': f'{applied} of {len(results)} operations applied',
+        'results': results
+    })
+
 # Feed Management Routes
 @app.route('/feeds')
 @login_required
@@ -2870,36 +5696,20 @@ def manager_harvest():
         today = now.date()
         yesterday = today - timedelta(days=1)
         
-        # Get batches in closing or closed status
+        # Batches ready for harvest
+        batches = batch_query('list').filter(Batch.status == 'closing')
         if session.get('user_type') == 'assistant_supervisor':
-            batches = Batch.query.filter(
-                Batch.manager_id == session.get('user_id'),
-                Batch.status.in_(['closing', 'closed'])
-            ).all()
-        else:
-            batches = Batch.query.filter(
-                Batch.status.in_(['closing', 'closed'])
-            ).all()
-        
-        # Get harvests for these batches
-        harvests = []
-        for batch in batches:
-            batch_harvests = Harvest.query.filter_by(batch_id=batch.id).order_by(Harvest.date.desc()).all()
-            for harvest in batch_harvests:
-                harvests.append({
-                    'id': harvest.id,
-                    'batch_number': batch.batch_number,
-                    'date': harvest.date,
-                    'quantity': harvest.quantity,
-                    'weight': harvest.weight,
-                    'selling_price': harvest.selling_price,
-                    'total_value': harvest.total_value,
-                    'notes': harvest.notes
-                })
+            batches = batches.filter(Batch.manager_id == session.get('user_id'))
+        batches = batches.all()
+
+        # The most recent harvests of closing and closed batches; older ones load as the list scrolls
+        harvests, next_cursor = get_keyset_page(manager_harvest_query(), (Harvest.date, Harvest.id))
         
         return render_template('manager/harvest.html', 
                              batches=batches,
+                             last_updates=get_latest_updates([batch.id for batch in batches]),
                              harvests=harvests,
+                             next_cursor=next_cursor,
                              now=now,
                              today=today,
                              yesterday=yesterday,
@@ -2908,6 +5718,39 @@ def manager_harvest():
         flash('Error loading harvest data: ' + str(e), 'error')
         return redirect(url_for('manager_dashboard'))
 
+def manager_harvest_query():
+    """Harvests of the closing and closed batches the logged-in supervisor may see, with their batch"""
+    query = Harvest.query.join(Batch, Batch.id == Harvest.batch_id).filter(
+        Batch.status.in_(['closing', 'closed'])).options(contains_eager(Harvest.batch))
+    if session.get('user_type') == 'assistant_supervisor':
+        query = query.filter(Batch.manager_id == session.get('user_id'))
+    return query
+
+@app.route('/api/manager/harvests')
+@login_required
+def manager_harvests_page():
+    """The next page of the harvest history after ?cursor=, as JSON with the rendered rows"""
+    try:
+        harvests, next_cursor = get_keyset_page(manager_harvest_query(), (Harvest.date, Harvest.id),
+                                                request.args.get('cursor'), request.args.get('limit', type=int))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'harvests': [{
+            'id': harvest.id,
+            'batch_number': harvest.batch.batch_number,
+            'date': harvest.date.isoformat(),
+            'quantity': harvest.quantity,
+            'weight': harvest.weight,
+            'selling_price': harvest.selling_price,
+            'total_value': harvest.total_value,
+            'notes': harvest.notes
+        } for harvest in harvests],
+        'html': {'harvests': render_template('manager/_harvest_rows.html', harvests=harvests)},
+        'next_cursor': next_cursor
+    })
+
 @app.route('/manager/harvest/<int:batch_id>', methods=['GET', 'POST'])
 @login_required
 def manager_harvest_batch(batch_id):
@@ -2938,23 +5781,7 @@ def manager_harvest_batch(batch_id):
                     flash('Harvest quantity cannot exceed available birds', 'error')
                     return redirect(url_for('manager_harvest_batch', batch_id=batch_id))
                 
-                total_value = weight * selling_price
-                
-                harvest = Harvest(
-                    batch_id=batch.id,
-                    date=now.date(),
-                    quantity=quantity,
-                    weight=weight,
-                    selling_price=selling_price,
-                    total_value=total_value,
-                    notes=notes
-                )
-                
-                # Update batch's available birds
-                batch.available_birds -= quantity
-                batch.check_and_update_status()
-                
-                db.session.add(harvest)
+                record_harvest(batch, now.date(), quantity, weight, selling_price, notes)
                 db.session.commit()
                 
                 flash('Harvest record added successfully', 'success')
@@ -2991,175 +5818,13 @@ def manager_schedules():
         today = datetime.now().date()
         end_date = today + timedelta(days=30)
         
-        # Get schedules based on user type
-        if session.get('user_type') == 'assistant_supervisor':
-            # Get batches assigned to this manager
-            manager_batches = Batch.query.filter_by(manager_id=session.get('user_id')).all()
-            batch_ids = [batch.id for batch in manager_batches]
-            
-            # Health Material Schedules
-            health_material_schedules = HealthMaterialSchedule.query.join(
-                health_material_schedule_batches
-            ).filter(
-                health_material_schedule_batches.c.batch_id.in_(batch_ids),
-                HealthMaterialSchedule.scheduled_date == selected_date
-            ).order_by(HealthMaterialSchedule.scheduled_date).all()
-            
-            # Medical Schedules
-            medical_schedules = MedicineSchedule.query.join(
-                medicine_schedule_batches
-            ).filter(
-                medicine_schedule_batches.c.batch_id.in_(batch_ids),
-                MedicineSchedule.schedule_date == selected_date
-            ).order_by(MedicineSchedule.schedule_date).all()
-            
-            # Vaccine Schedules
-            vaccine_schedules = VaccineSchedule.query.join(
-                vaccine_schedule_batches
-            ).filter(
-                vaccine_schedule_batches.c.batch_id.in_(batch_ids),
-                VaccineSchedule.scheduled_date == selected_date
-            ).order_by(VaccineSchedule.scheduled_date).all()
-            
-            # Get all scheduled dates for the calendar
-            scheduled_dates = set()
-            
-            # Get health material schedule dates
-            health_dates = db.session.query(HealthMaterialSchedule.scheduled_date).join(
-                health_material_schedule_batches
-            ).filter(
-                health_material_schedule_batches.c.batch_id.in_(batch_ids),
-                HealthMaterialSchedule.scheduled_date >= today,
-                HealthMaterialSchedule.scheduled_date <= end_date
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in health_dates)
-            
-            # Get medical schedule dates
-            medical_dates = db.session.query(MedicineSchedule.schedule_date).join(
-                medicine_schedule_batches
-            ).filter(
-                medicine_schedule_batches.c.batch_id.in_(batch_ids),
-                MedicineSchedule.schedule_date >= today,
-                MedicineSchedule.schedule_date <= end_date
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in medical_dates)
-            
-            # Get vaccine schedule dates
-            vaccine_dates = db.session.query(VaccineSchedule.scheduled_date).join(
-                vaccine_schedule_batches
-            ).filter(
-                vaccine_schedule_batches.c.batch_id.in_(batch_ids),
-                VaccineSchedule.scheduled_date >= today,
-                VaccineSchedule.scheduled_date <= end_date
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in vaccine_dates)
-            
-        elif session.get('user_type') == 'senior_supervisor':
-            # Health Material Schedules
-            health_material_schedules = HealthMaterialSchedule.query.join(
-                health_material_schedule_batches
-            ).join(
-                Batch
-            ).filter(
-                Batch.status.in_(['ongoing', 'closing']),
-                HealthMaterialSchedule.scheduled_date == selected_date
-            ).order_by(HealthMaterialSchedule.scheduled_date).all()
-            
-            # Medical Schedules
-            medical_schedules = MedicineSchedule.query.join(
-                medicine_schedule_batches
-            ).join(
-                Batch
-            ).filter(
-                Batch.status.in_(['ongoing', 'closing']),
-                MedicineSchedule.schedule_date == selected_date
-            ).order_by(MedicineSchedule.schedule_date).all()
-            
-            # Vaccine Schedules
-            vaccine_schedules = VaccineSchedule.query.join(
-                vaccine_schedule_batches
-            ).join(
-                Batch
-            ).filter(
-                Batch.status.in_(['ongoing', 'closing']),
-                VaccineSchedule.scheduled_date == selected_date
-            ).order_by(VaccineSchedule.scheduled_date).all()
-        
-            # Get all scheduled dates for the calendar
-            scheduled_dates = set()
-        
-            # Get health material schedule dates
-            health_dates = db.session.query(HealthMaterialSchedule.scheduled_date).join(
-            health_material_schedule_batches
-        ).join(
-            Batch
-        ).filter(
-                Batch.status.in_(['ongoing', 'closing']),
-                HealthMaterialSchedule.scheduled_date >= today,
-                HealthMaterialSchedule.scheduled_date <= end_date
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in health_dates)
-            
-            # Get medical schedule dates
-            medical_dates = db.session.query(MedicineSchedule.schedule_date).join(
-            medicine_schedule_batches
-        ).join(
-            Batch
-        ).filter(
-                Batch.status.in_(['ongoing', 'closing']),
-                MedicineSchedule.schedule_date >= today,
-                MedicineSchedule.schedule_date <= end_date
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in medical_dates)
-            
-            # Get vaccine schedule dates
-            vaccine_dates = db.session.query(VaccineSchedule.scheduled_date).join(
-            vaccine_schedule_batches
-        ).join(
-            Batch
-        ).filter(
-                Batch.status.in_(['ongoing', 'closing']),
-                VaccineSchedule.scheduled_date >= today,
-                VaccineSchedule.scheduled_date <= end_date
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in vaccine_dates)
-        else:
-            # Admin sees all schedules
-            health_material_schedules = HealthMaterialSchedule.query.filter(
-                HealthMaterialSchedule.scheduled_date == selected_date
-            ).order_by(HealthMaterialSchedule.scheduled_date).all()
-            
-            medical_schedules = MedicineSchedule.query.filter(
-                MedicineSchedule.schedule_date == selected_date
-            ).order_by(MedicineSchedule.schedule_date).all()
-            
-            vaccine_schedules = VaccineSchedule.query.filter(
-                VaccineSchedule.scheduled_date == selected_date
-            ).order_by(VaccineSchedule.scheduled_date).all()
-            
-            # Get all scheduled dates for the calendar
-            scheduled_dates = set()
-            
-            # Get health material schedule dates
-            health_dates = db.session.query(HealthMaterialSchedule.scheduled_date).filter(
-                HealthMaterialSchedule.scheduled_date >= today,
-                HealthMaterialSchedule.scheduled_date <= end_date
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in health_dates)
-            
-            # Get medical schedule dates
-            medical_dates = db.session.query(MedicineSchedule.schedule_date).filter(
-                MedicineSchedule.schedule_date >= today,
-                MedicineSchedule.schedule_date <= end_date
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in medical_dates)
-            
-            # Get vaccine schedule dates
-            vaccine_dates = db.session.query(VaccineSchedule.scheduled_date).filter(
-                VaccineSchedule.scheduled_date >= today,
-                VaccineSchedule.scheduled_date <= end_date
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in vaccine_dates)
+        # Schedules and calendar dates come from the schedule_entries view, scoped to the user's batches
+        scope = get_schedule_scope(session.get('user_type'), session.get('user_id'))
+        schedules_by_type = get_schedules_for_date(selected_date, scope)
+        health_material_schedules = schedules_by_type['health_material']
+        medical_schedules = schedules_by_type['medicine']
+        vaccine_schedules = schedules_by_type['vaccine']
+        scheduled_dates = get_schedule_dates(scope, today, end_date)
 
         # Get recent activities
         recent_activities = Activity.query.order_by(Activity.timestamp.desc()).limit(5).all()
@@ -3170,7 +5835,7 @@ def manager_schedules():
                              vaccine_schedules=vaccine_schedules,
                              recent_activities=recent_activities,
                              selected_date=selected_date,
-                             scheduled_dates=list(scheduled_dates))
+                             scheduled_dates=scheduled_dates)
     except Exception as e:
         flash(str(e), 'error')
         return redirect(url_for('manager_dashboard'))
@@ -3390,6 +6055,7 @@ def delete_manager(user_id):
         
         # Update any closed batches to remove manager reference
         Batch.query.filter_by(manager_id=user_id).update({Batch.manager_id: None})
+        Farm.query.filter_by(manager_id=user_id).update({Farm.manager_id: None})
         
         # Delete employee record first if exists
         if user.employee:
@@ -3492,6 +6158,7 @@ def manager_dashboard():
 # Manager-specific routes
 @app.route('/manager/batches')
 @login_required
+@query_budget(8)
 def manager_batches():
     if session.get('user_type') not in ['manager', 'assistant_supervisor', 'senior_supervisor']:
         flash('Access denied. Supervisors only.', 'error')
@@ -3500,16 +6167,19 @@ def manager_batches():
     # Get batches based on user type
     if session.get('user_type') in ['senior_supervisor', 'manager']:
         # Senior Supervisors and Managers can see all batches
-        batches = Batch.query.filter(Batch.status.in_(['ongoing', 'closing'])).all()
+        batches = batch_query('list').filter(Batch.status.in_(['ongoing', 'closing'])).all()
     else:
         # Assistant Supervisors can only see their assigned batches
-        batches = Batch.query.filter(
+        batches = batch_query('list').filter(
             Batch.manager_id == session.get('user_id'),
             Batch.status.in_(['ongoing', 'closing'])
         ).all()
+    batch_ids = [batch.id for batch in batches]
     
     return render_template('manager/batches.html', 
                          batches=batches,
+                         last_updates=get_latest_updates(batch_ids),
+                         batch_costs=get_batch_costs(batch_ids),
                          now=datetime.now(),
                          timedelta=timedelta)  # Add timedelta to template context
 
@@ -3546,9 +6216,11 @@ def manager_view_batch(batch_id):
         flash('Access denied. Supervisors only.', 'error')
         return redirect(url_for('dashboard'))
     
-    batch = Batch.query.get_or_404(batch_id)
+    batch = batch_query('detail').filter(Batch.id == batch_id).first_or_404()
+    detail = get_batch_detail(batch)
     return render_template('manager/view_batch.html', 
-                         batch=batch,
+                         batch=detail['batch'],
+                         detail=detail,
                          now=datetime.now())
 
 @app.route('/manager/batches/<int:batch_id>/update', methods=['GET', 'POST'])
@@ -3582,6 +6254,8 @@ def manager_update_batch(batch_id):
                     
                     # Check if update exists for this date
                     existing_update = BatchUpdate.query.filter_by(batch_id=batch_id, date=target_date).first()
+                    ledger = get_batch_ledger(batch)
+                    old_ledger_delta = get_update_ledger_delta(existing_update.id if existing_update else None)
                     
                     if not existing_update:
                         # Create empty update for this date
@@ -3606,9 +6280,9 @@ def manager_update_batch(batch_id):
                         quantity = float(allocation.get('quantity', 0))
                         
                         if feed_id and quantity > 0:
-                            feed = Feed.query.get(feed_id)
+                            feed = get_catalog('feed').get(int(feed_id))
                             if feed:
-                                price_at_time = feed.price
+                                price_at_time = feed['price']
                                 total_cost = quantity * price_at_time
                                 
                                 # Insert into batch_update_feeds
@@ -3616,7 +6290,7 @@ def manager_update_batch(batch_id):
                                     batch_update_id=existing_update.id,
                                     feed_id=feed_id,
                                     quantity=quantity,
-                                    quantity_per_unit_at_time=feed.weight,
+                                    quantity_per_unit_at_time=feed['weight'],
                                     price_at_time=price_at_time,
                                     total_cost=total_cost
                                 )
@@ -3633,6 +6307,9 @@ def manager_update_batch(batch_id):
                     )
                     db.session.add(past_allocation)
                     
+                    db.session.flush()
+                    ledger.apply(subtract_ledger_delta(get_update_ledger_delta(existing_update.id), old_ledger_delta))
+                    refresh_batch_daily_metrics(batch, existing_update.date)
                     db.session.commit()
                     return jsonify({'success': True, 'message': 'Feed allocation saved successfully'})
                     
@@ -3649,6 +6326,7 @@ def manager_update_batch(batch_id):
             female_weight = float(request.form.get('female_weight', 0) or 0)
             remarks = request.form.get('remarks', '')
             remarks_priority = request.form.get('remarks_priority', 'low')
+            ledger = get_batch_ledger(batch)
 
             # Create new batch update
             batch_update = BatchUpdate(
@@ -3676,18 +6354,18 @@ def manager_update_batch(batch_id):
             feed_quantities = request.form.getlist('feed_quantity[]')
             for feed_id, quantity in zip(feed_ids, feed_quantities):
                 if feed_id and quantity and float(quantity) > 0:
-                    feed = Feed.query.get(feed_id)
+                    feed = get_catalog('feed').get(int(feed_id))
                     if feed:
                         quantity_float = float(quantity)
                         total_quantity += quantity_float
-                        price_at_time = feed.price
+                        price_at_time = feed['price']
                         total_cost = quantity_float * price_at_time
                         # Insert directly into the association table with quantity and price
                         stmt = batch_update_feeds.insert().values(
                             batch_update_id=batch_update.id,
                             feed_id=feed_id,
                             quantity=quantity_float,
-                            quantity_per_unit_at_time=feed.weight,  # Store the weight per unit at time of update
+                            quantity_per_unit_at_time=feed['weight'],  # Store the weight per unit at time of update
                             price_at_time=price_at_time,
                             total_cost=total_cost
                         )
@@ -3755,14 +6433,13 @@ def manager_update_batch(batch_id):
                                     item = None
                                     if item_type == 'medicine':
                                         schedule = MedicineSchedule.query.get(item_id)
-                                        item = schedule.medicine if schedule else None
+                                        item = get_catalog('medicine').get(schedule.medicine_id) if schedule else None
                                     elif item_type == 'health_material':
                                         schedule = HealthMaterialSchedule.query.get(item_id)
-                                        item = schedule.health_material if schedule else None
+                                        item = get_catalog('health_material').get(schedule.health_material_id) if schedule else None
                                     elif item_type == 'vaccine':
                                         schedule = VaccineSchedule.query.get(item_id)
-                                        item = schedule.vaccine if schedule else None
-                                        item.unit_type = 'ml'
+                                        item = get_catalog('vaccine').get(schedule.vaccine_id) if schedule else None
 
                                     # if item.unit_type:
                                     #     unit_type = item.unit_type
@@ -3773,13 +6450,13 @@ def manager_update_batch(batch_id):
                                         # Create batch update item with current price and schedule ID
                                         update_item = BatchUpdateItem(
                                             batch_update_id=batch_update.id,
-                                            item_id=item.id,
+                                            item_id=item['id'],
                                             item_type=item_type,
                                             quantity=quantity,
-                                            quantity_per_unit_at_time=item.quantity_per_unit,  # Use item's quantity_per_unit
-                                            unit_type=item.unit_type,  # Add unit_type from item
-                                            price_at_time=item.price,
-                                            total_cost=item.price * quantity,
+                                            quantity_per_unit_at_time=item['quantity_per_unit'],  # Use item's quantity_per_unit
+                                            unit_type=item['unit_type'],  # Add unit_type from item
+                                            price_at_time=item['price'],
+                                            total_cost=item['price'] * quantity,
                                             schedule_id=schedule.id,
                                             dose_number=schedule.dose_number if item_type == 'vaccine' else None
                                         )
@@ -3816,26 +6493,25 @@ def manager_update_batch(batch_id):
                                     # Get the appropriate item
                                     item = None
                                     if item_type == 'medicine':
-                                        item = Medicine.query.get(item_id)
+                                        item = get_catalog('medicine').get(item_id)
                                     elif item_type == 'health_material':
-                                        item = HealthMaterial.query.get(item_id)
+                                        item = get_catalog('health_material').get(item_id)
                                     elif item_type == 'vaccine':
-                                        item = Vaccine.query.get(item_id)
+                                        item = get_catalog('vaccine').get(item_id)
                                         dose_number_key = f'other_items[{item_type}][{index}][dose_number]'
                                         dose_number = int(request.form.get(dose_number_key, 1) or 1)
-                                        item.unit_type = 'ml'
                                     
                                     if item:
                                         # Create batch update item without schedule ID
                                         update_item = BatchUpdateItem(
                                             batch_update_id=batch_update.id,
-                                            item_id=item.id,
+                                            item_id=item['id'],
                                             item_type=item_type,
                                             quantity=quantity,
-                                            quantity_per_unit_at_time=item.quantity_per_unit,  # Use item's quantity_per_unit
-                                            unit_type=item.unit_type,  # Add unit_type from item
-                                            price_at_time=item.price,
-                                            total_cost=item.price * quantity,
+                                            quantity_per_unit_at_time=item['quantity_per_unit'],  # Use item's quantity_per_unit
+                                            unit_type=item['unit_type'],  # Add unit_type from item
+                                            price_at_time=item['price'],
+                                            total_cost=item['price'] * quantity,
                                             schedule_id=None,  # No schedule ID for other items
                                             dose_number=dose_number if item_type == 'vaccine' else None
                                         )
@@ -3846,6 +6522,9 @@ def manager_update_batch(batch_id):
                         print(f"Error processing other item {key}: {str(e)}")
                         continue
 
+            db.session.flush()
+            ledger.apply(get_update_ledger_delta(batch_update.id))
+            refresh_batch_daily_metrics(batch, batch_update.date)
             db.session.commit()
             flash('Batch update recorded successfully!', 'success')
             return redirect(url_for('manager_view_batch', batch_id=batch.id))
@@ -3904,10 +6583,10 @@ def manager_update_batch(batch_id):
     return render_template('manager/update_batch.html', 
                          batch=batch, 
                          existing_update=existing_update,
-                         feeds=Feed.query.all(),
-                         medicines=Medicine.query.all(),
-                         health_materials=HealthMaterial.query.all(),
-                         vaccines=Vaccine.query.all(),
+                         feeds=get_catalog('feed').entries,
+                         medicines=get_catalog('medicine').entries,
+                         health_materials=get_catalog('health_material').entries,
+                         vaccines=get_catalog('vaccine').entries,
                          medicine_schedules=medicine_schedules,
                          health_material_schedules=health_material_schedules,
                          vaccine_schedules=vaccine_schedules,
@@ -3950,22 +6629,7 @@ def add_harvest(batch_id):
             if quantity > batch.available_birds:
                 flash('Harvest quantity cannot exceed available birds', 'error')
                 return redirect(url_for('add_harvest', batch_id=batch_id))
-            total_value = weight * selling_price
-            harvest = Harvest(
-                batch_id=batch_id,
-                date=date,
-                quantity=quantity,
-                weight=weight,
-                selling_price=selling_price,
-                total_value=total_value,
-                notes=notes
-            )
-            
-            # Update batch's available birds
-            batch.available_birds -= quantity
-            batch.check_and_update_status()
-            
-            db.session.add(harvest)
+            record_harvest(batch, date, quantity, weight, selling_price, notes)
             db.session.commit()
             
             flash('Harvest record added successfully', 'success')
@@ -3985,10 +6649,13 @@ def delete_harvest(harvest_id):
         
         # Add back the harvested birds to available birds
         batch.available_birds += harvest.quantity
+        ledger = get_batch_ledger(batch)
+        ledger.apply(get_harvest_ledger_delta(harvest), sign=-1)
         
         # If batch was closed and this was the last harvest, revert status to closing
         if batch.status == 'closed' and len(batch.harvests) == 1:
             batch.status = 'closing'
+            ledger.unfreeze()
         
         db.session.delete(harvest)
         db.session.commit()
@@ -4028,6 +6695,8 @@ def edit_harvest(harvest_id):
                 return redirect(url_for('edit_harvest', harvest_id=harvest_id))
             
             total_value = weight * selling_price
+            ledger = get_batch_ledger(batch)
+            old_ledger_delta = get_harvest_ledger_delta(harvest)
             
             # Update harvest record
             harvest.quantity = quantity
@@ -4035,6 +6704,7 @@ def edit_harvest(harvest_id):
             harvest.selling_price = selling_price
             harvest.total_value = total_value
             harvest.notes = notes
+            ledger.apply(subtract_ledger_delta(get_harvest_ledger_delta(harvest), old_ledger_delta))
             
             # Update batch's available birds
             batch.available_birds -= quantity_diff
@@ -4053,26 +6723,10 @@ def edit_harvest(harvest_id):
 @login_required
 def pending_schedules_count():
     today = datetime.now().date()
-    
-    # Count vaccine schedules
-    vaccine_count = VaccineSchedule.query.filter(
-        VaccineSchedule.scheduled_date < today,
-        VaccineSchedule.completed == False
-    ).count()
-    
-    # Count health material schedules
-    health_count = HealthMaterialSchedule.query.filter(
-        HealthMaterialSchedule.scheduled_date < today,
-        HealthMaterialSchedule.completed == False
-    ).count()
-    
-    # Count medical schedules
-    medical_count = MedicineSchedule.query.filter(
-        MedicineSchedule.schedule_date < today,
-        MedicineSchedule.completed == False
-    ).count()
-    
-    total_count = health_count + medical_count + vaccine_count
+    total_count = db.session.execute(select(func.count()).select_from(schedule_entries).where(
+        schedule_entries.c.date < today,
+        schedule_entries.c.completed == False
+    )).scalar()
     
     return jsonify({'count': total_count})
 
@@ -4081,69 +6735,31 @@ def pending_schedules_count():
 def pending_schedules():
     today = datetime.now().date()
     schedules = []
-        
-    # Get health material schedules
-    health_schedules = HealthMaterialSchedule.query.filter(
-        HealthMaterialSchedule.scheduled_date < today,
-        HealthMaterialSchedule.completed == False
-    ).all()
-        
-    for schedule in health_schedules:
-            batch = schedule.batches[0] if schedule.batches else None
-            if batch:
-                schedules.append({
-                    'id': schedule.id,
-                    'type': 'health-material',
-                    'name': schedule.health_material.name,
-                    'batch_number': batch.batch_number,
-                    'farm_batch_number': batch.farm_batch_number,
-                    'farm_name': batch.farm.name if batch.farm else '',
-                    'scheduled_date': schedule.scheduled_date.strftime('%d-%m-%Y'),
-                    'icon': 'fa-spray-can'
-                })
-        
-    # Get medical schedules
-    medical_schedules = MedicineSchedule.query.filter(
-        MedicineSchedule.schedule_date < today,
-        MedicineSchedule.completed == False
-    ).all()
-        
-    for schedule in medical_schedules:
-            batch = schedule.batches[0] if schedule.batches else None
-            if batch:
-                schedules.append({
-                    'id': schedule.id,
-                    'type': 'medicine',
-                    'name': schedule.medicine.name,
-                    'batch_number': batch.batch_number,
-                    'farm_batch_number': batch.farm_batch_number,
-                    'farm_name': batch.farm.name if batch.farm else '',
-                    'scheduled_date': schedule.schedule_date.strftime('%d-%m-%Y'),
-                    'icon': 'fa-pills'
-                })
-        
-    # Get vaccine schedules
-    vaccine_schedules = VaccineSchedule.query.filter(
-        VaccineSchedule.scheduled_date < today,
-        VaccineSchedule.completed == False
-    ).all()
-        
-    for schedule in vaccine_schedules:
-            batch = schedule.batches[0] if schedule.batches else None
-            if batch:
-                schedules.append({
-                    'id': schedule.id,
-                    'type': 'vaccine',
-                    'name': schedule.vaccine.name,
-                    'batch_number': batch.batch_number,
-                    'farm_batch_number': batch.farm_batch_number,
-                    'farm_name': batch.farm.name if batch.farm else '',
-                    'scheduled_date': schedule.scheduled_date.strftime('%d-%m-%Y'),
-                    'icon': 'fa-syringe'
-            })
-    
-    # Sort schedules by date
-    schedules.sort(key=lambda x: datetime.strptime(x['scheduled_date'], '%d-%m-%Y'))
+    seen = set()
+
+    # One query over schedule_entries; a schedule shared by several batches is listed under its first batch
+    rows = db.session.execute(select(
+        schedule_entries.c.schedule_type, schedule_entries.c.schedule_id, schedule_entries.c.item_name,
+        schedule_entries.c.date, Batch.batch_number, Batch.farm_batch_number, Farm.name
+    ).join(Batch, Batch.id == schedule_entries.c.batch_id).outerjoin(Farm, Farm.id == Batch.farm_id).where(
+        schedule_entries.c.date < today,
+        schedule_entries.c.completed == False
+    ).order_by(schedule_entries.c.date, schedule_entries.c.batch_id))
+
+    for item_type, schedule_id, name, scheduled_date, batch_number, farm_batch_number, farm_name in rows:
+        if (item_type, schedule_id) in seen:
+            continue
+        seen.add((item_type, schedule_id))
+        schedules.append({
+            'id': schedule_id,
+            'type': item_type.replace('_', '-'),
+            'name': name,
+            'batch_number': batch_number,
+            'farm_batch_number': farm_batch_number,
+            'farm_name': farm_name or '',
+            'scheduled_date': scheduled_date.strftime('%d-%m-%Y'),
+            'icon': SCHEDULE_ENTRY_ICONS[item_type]
+        })
     
     return jsonify({'schedules': schedules})
 
@@ -4161,17 +6777,10 @@ def schedules():
         selected_date = datetime.now().date()
     
     # Get schedules for the selected date
-    health_material_schedules = HealthMaterialSchedule.query.filter(
-        HealthMaterialSchedule.scheduled_date == selected_date
-    ).all()
-    
-    medical_schedules = MedicineSchedule.query.filter(
-        MedicineSchedule.schedule_date == selected_date
-    ).all()
-    
-    vaccine_schedules = VaccineSchedule.query.filter(
-        VaccineSchedule.scheduled_date == selected_date
-    ).all()
+    schedules_by_type = get_schedules_for_date(selected_date)
+    health_material_schedules = schedules_by_type['health_material']
+    medical_schedules = schedules_by_type['medicine']
+    vaccine_schedules = schedules_by_type['vaccine']
     
     recent_activities = Activity.query.order_by(Activity.timestamp.desc()).limit(10).all()
         
@@ -4394,96 +7003,12 @@ def save_fcr_rates():
 def get_scheduled_dates():
     try:
         # Get all scheduled dates for the calendar
-        scheduled_dates = set()
-        
-        if session.get('user_type') == 'assistant_supervisor':
-            # Get batches assigned to this supervisor
-            supervisor_batches = Batch.query.filter_by(manager_id=session.get('user_id')).all()
-            batch_ids = [batch.id for batch in supervisor_batches]
-            
-            # Get health material schedule dates
-            health_dates = db.session.query(HealthMaterialSchedule.scheduled_date).join(
-                health_material_schedule_batches
-            ).filter(
-                health_material_schedule_batches.c.batch_id.in_(batch_ids)
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in health_dates)
-            
-            # Get medical schedule dates
-            medical_dates = db.session.query(MedicineSchedule.schedule_date).join(
-                medicine_schedule_batches
-            ).filter(
-                medicine_schedule_batches.c.batch_id.in_(batch_ids)
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in medical_dates)
-            
-            # Get vaccine schedule dates
-            vaccine_dates = db.session.query(VaccineSchedule.scheduled_date).join(
-                vaccine_schedule_batches
-            ).filter(
-                vaccine_schedule_batches.c.batch_id.in_(batch_ids)
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in vaccine_dates)
-        elif session.get('user_type') == 'senior_supervisor':
-            # Senior Supervisors see all dates
-            # Get health material schedule dates
-            health_dates = db.session.query(HealthMaterialSchedule.scheduled_date).join(
-                health_material_schedule_batches
-            ).join(
-                Batch
-            ).filter(
-                Batch.status.in_(['ongoing', 'closing'])
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in health_dates)
-            
-            # Get medical schedule dates
-            medical_dates = db.session.query(MedicineSchedule.schedule_date).join(
-                medicine_schedule_batches
-            ).join(
-                Batch
-            ).filter(
-                Batch.status.in_(['ongoing', 'closing'])
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in medical_dates)
-            
-            # Get vaccine schedule dates
-            vaccine_dates = db.session.query(VaccineSchedule.scheduled_date).join(
-                vaccine_schedule_batches
-            ).join(
-                Batch
-            ).filter(
-                Batch.status.in_(['ongoing', 'closing'])
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in vaccine_dates)
-        else:
-            # Senior Supervisors see all dates
-            # Get health material schedule dates
-            health_dates = db.session.query(HealthMaterialSchedule.scheduled_date).join(
-                health_material_schedule_batches
-            ).join(
-                Batch
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in health_dates)
-            
-            # Get medical schedule dates
-            medical_dates = db.session.query(MedicineSchedule.schedule_date).join(
-                medicine_schedule_batches
-            ).join(
-                Batch
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in medical_dates)
-            
-            # Get vaccine schedule dates
-            vaccine_dates = db.session.query(VaccineSchedule.scheduled_date).join(
-                vaccine_schedule_batches
-            ).join(
-                Batch
-            ).all()
-            scheduled_dates.update(date[0].strftime('%Y-%m-%d') for date in vaccine_dates)
+        scope = get_schedule_scope(session.get('user_type'), session.get('user_id'))
+        scheduled_dates = get_schedule_dates(scope)
         
         return jsonify({
             'success': True,
-            'dates': list(scheduled_dates)
+            'dates': scheduled_dates
         })
     except Exception as e:
         return jsonify({
@@ -4509,9 +7034,12 @@ def set_auto_schedule():
             
             if auto_schedule:
                 db.session.delete(auto_schedule)
+                job = None
+                if request.json.get('apply_to_open_batches'):
+                    job = enqueue_job('regenerate_schedules', item_type=item_type, item_id=int(item_id))
                 db.session.commit()
                 flash('Auto schedule has been removed successfully!', 'success')
-                return jsonify({'success': True})
+                return jsonify({'success': True, 'job_id': job.id if job else None})
             else:
                 return jsonify({'success': False, 'message': 'No auto schedule found to remove'})
         
@@ -4539,14 +7067,19 @@ def set_auto_schedule():
             auto_schedule = AutoSchedule(
                 item_type=item_type,
                 item_id=item_id,
-                schedule_ages=json.dumps(ages),
                 notes=notes
             )
+            auto_schedule.set_schedule_ages(ages)
             db.session.add(auto_schedule)
 
+        # Optionally rewrite the upcoming schedules of every open batch to match, in the background
+        job = None
+        if request.form.get('apply_to_open_batches') in ('1', 'true', 'on'):
+            job = enqueue_job('regenerate_schedules', item_type=item_type, item_id=int(item_id))
+
         db.session.commit()
         flash('Auto schedule has been set successfully!', 'success')
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'job_id': job.id if job else None})
     except Exception as e:
         db.session.rollback()
         flash('Error setting auto schedule: ' + str(e), 'error')
@@ -4568,73 +7101,122 @@ def get_auto_schedule(item_type, item_id):
         })
     return jsonify({'success': False, 'message': 'No auto schedule found'})
 
+def create_schedules_for_batches(batches, auto_schedules=None, from_date=None):
+    """Create auto-schedules for many batches with bulk inserts.
+
+    The referenced medicines, vaccines and health materials come from the
+    catalog cache, and every schedule row and association row is
+    written with a single executemany per table. Nothing is committed, so
+    the schedules land in the caller's transaction. With from_date only
+    schedules on or after that date are created.
+    """
+    batches = [batch for batch in batches if batch is not None]
+    if not batches:
+        return 0
+    if auto_schedules is None:
+        auto_schedules = AutoSchedule.query.all()
+    db.session.flush()  # Make sure every batch has an id
+
+    tables = get_schedule_tables()
+    items = {}
+    for item_type in tables:
+        item_ids = {int(auto_schedule.item_id) for auto_schedule in auto_schedules if auto_schedule.item_type == item_type}
+        items[item_type] = get_catalog(item_type).get_many(item_ids) if item_ids else {}
+
+    rows = {item_type: [] for item_type in tables}
+    row_batch_ids = {item_type: [] for item_type in tables}
+    now = datetime.now()
+    for auto_schedule in auto_schedules:
+        if auto_schedule.item_type not in tables:
+            continue
+        item = items[auto_schedule.item_type].get(int(auto_schedule.item_id))
+        if item is None:
+            continue
+        _, _, _, _, item_column, date_column = tables[auto_schedule.item_type]
+        dose_ages = item['dose_ages'] if auto_schedule.item_type == 'vaccine' else None
+        for age in auto_schedule.get_schedule_ages():
+            for batch in batches:
+                schedule_date = batch.created_at.date() - timedelta(days=1) + timedelta(days=age)
+                if from_date is not None and schedule_date < from_date:
+                    continue
+                row = {item_column: item['id'], date_column: schedule_date, 'notes': auto_schedule.notes or '',
+                       'completed': False, 'auto_generated': True, 'created_at': now, 'updated_at': now}
+                if dose_ages is not None:
+                    # Find the appropriate dose number based on age
+                    row['dose_number'] = dose_ages.index(age) + 1 if isinstance(dose_ages, list) and age in dose_ages else 1
+                rows[auto_schedule.item_type].append(row)
+                row_batch_ids[auto_schedule.item_type].append(batch.id)
+
+    created = 0
+    for item_type, (schedule_model, link_table, link_column, _, _, _) in tables.items():
+        if not rows[item_type]:
+            continue
+        schedule_ids = db.session.scalars(
+            insert(schedule_model).returning(schedule_model.id, sort_by_parameter_order=True),
+            rows[item_type]
+        ).all()
+        db.session.execute(link_table.insert(), [
+            {link_column: schedule_id, 'batch_id': batch_id}
+            for schedule_id, batch_id in zip(schedule_ids, row_batch_ids[item_type])
+        ])
+        created += len(schedule_ids)
+
+    for batch in batches:
+        db.session.expire(batch, ['medicine_schedules', 'vaccine_schedules', 'health_material_schedules'])
+    return created
+
 def create_schedules_for_batch(batch):
     """Create schedules for a new batch based on auto-schedules"""
-    try:
-        # Get all auto-schedules
-        auto_schedules = AutoSchedule.query.all()
-        
-        for auto_schedule in auto_schedules:
-            try:
-                # Get schedule ages and ensure they are integers
-                ages = [int(age) for age in auto_schedule.get_schedule_ages() if age is not None]
-                batch_created_date = batch.created_at.date() - timedelta(days=1)
-                
-                for age in ages:
-                    schedule_date = batch_created_date + timedelta(days=age)
-                    
-                    if auto_schedule.item_type == 'medicine':
-                        medicine = Medicine.query.get(auto_schedule.item_id)
-                        if medicine:
-                            schedule = MedicineSchedule(
-                                medicine_id=medicine.id,
-                                schedule_date=schedule_date,
-                                notes=auto_schedule.notes or '',
-                                completed=False
-                            )
-                            schedule.batches.append(batch)
-                            db.session.add(schedule)
-                    
-                    elif auto_schedule.item_type == 'vaccine':
-                        vaccine = Vaccine.query.get(auto_schedule.item_id)
-                        if vaccine:
-                            # Find the appropriate dose number based on age
-                            dose_ages = vaccine.get_dose_ages()
-                            if isinstance(dose_ages, list) and age in dose_ages:
-                                dose_number = dose_ages.index(age) + 1
-                            else:
-                                dose_number = 1
-                                
-                            schedule = VaccineSchedule(
-                                vaccine_id=vaccine.id,
-                                dose_number=dose_number,
-                                scheduled_date=schedule_date,
-                                notes=auto_schedule.notes or '',
-                                completed=False
-                            )
-                            schedule.batches.append(batch)
-                            db.session.add(schedule)
-                    
-                    elif auto_schedule.item_type == 'health_material':
-                        material = HealthMaterial.query.get(auto_schedule.item_id)
-                        if material:
-                            schedule = HealthMaterialSchedule(
-                                health_material_id=material.id,
-                                scheduled_date=schedule_date,
-                                notes=auto_schedule.notes or '',
-                                completed=False
-                            )
-                            schedule.batches.append(batch)
-                            db.session.add(schedule)
-            except Exception as e:
-                print(f"Error processing auto schedule {auto_schedule.id}: {str(e)}")
-                continue
-        
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error creating schedules for batch: {str(e)}")
-        raise
+    return create_schedules_for_batches([batch])
+
+def regenerate_schedules_for_batches(batches, item_type=None, item_id=None):
+    """Replace the pending, upcoming auto-generated schedules of many batches.
+
+    Incomplete auto_generated schedules dated today or later are deleted
+    (optionally only for one item) and recreated from the current
+    auto-schedules. Schedules added by hand, completed schedules and
+    schedules shared with batches outside the list are kept.
+    """
+    batches = [batch for batch in batches if batch is not None]
+    if not batches:
+        return 0, 0
+    today = datetime.now().date()
+    batch_ids = [batch.id for batch in batches]
+    tables = get_schedule_tables()
+
+    removed = 0
+    for schedule_type, (schedule_model, link_table, link_column, _, item_column, date_column) in tables.items():
+        if item_type is not None and schedule_type != item_type:
+            continue
+        link_schedule_id = getattr(link_table.c, link_column)
+        candidates = db.session.query(schedule_model.id).join(
+            link_table, link_schedule_id == schedule_model.id
+        ).filter(
+            link_table.c.batch_id.in_(batch_ids),
+            schedule_model.auto_generated == True,
+            schedule_model.completed == False,
+            getattr(schedule_model, date_column) >= today
+        )
+        if item_id is not None:
+            candidates = candidates.filter(getattr(schedule_model, item_column) == int(item_id))
+        shared = db.session.query(link_schedule_id).filter(
+            link_schedule_id.in_(candidates),
+            ~link_table.c.batch_id.in_(batch_ids)
+        )
+        schedule_ids = [row[0] for row in candidates.filter(~schedule_model.id.in_(shared)).distinct()]
+        for start in range(0, len(schedule_ids), COST_ENGINE_CHUNK_SIZE):
+            chunk = schedule_ids[start:start + COST_ENGINE_CHUNK_SIZE]
+            db.session.execute(link_table.delete().where(link_schedule_id.in_(chunk)))
+            db.session.query(schedule_model).filter(schedule_model.id.in_(chunk)).delete(synchronize_session=False)
+        removed += len(schedule_ids)
+
+    auto_schedules = AutoSchedule.query
+    if item_type is not None:
+        auto_schedules = auto_schedules.filter(AutoSchedule.item_type == item_type)
+    if item_id is not None:
+        auto_schedules = auto_schedules.filter(AutoSchedule.item_id == int(item_id))
+    created = create_schedules_for_batches(batches, auto_schedules.all(), from_date=today)
+    return removed, created
 
 # # Modify the add_batch route to include auto-scheduling
 # @app.route('/batches/add', methods=['GET', 'POST'])
@@ -4728,56 +7310,101 @@ def offline():
 
 @app.route('/batchreport')
 @login_required
+@query_budget(10)
 def batch_report():
-    batches = Batch.query.filter_by(status='closed').all()
+    # Only what the picker shows, in one query however many farms the batches are spread over
+    batches = db.session.execute(select(Batch.id, Batch.batch_number, Farm.name.label('farm_name')).join(
+        Farm, Farm.id == Batch.farm_id).where(Batch.status == 'closed').order_by(Batch.id)).all()
     batch_id = request.args.get('batch_id', type=int)
     selected_batch = None
+    daily_metrics = []
     if batch_id:
-        selected_batch = Batch.query.get(batch_id)
-    return render_template('batchreport.html', batches=batches, selected_batch=selected_batch)
+        selected_batch = batch_query('report').filter(Batch.id == batch_id).first()
+        if selected_batch:
+            daily_metrics = get_batch_daily_metrics(selected_batch)
+    return render_template('batchreport.html', batches=batches, selected_batch=selected_batch, daily_metrics=daily_metrics)
 
 @app.route('/farmreport')
 @login_required
+@query_budget(10)
 def farm_report():
     farms = Farm.query.all()
     farm_id = request.args.get('farm_id', type=int)
+    period = request.args.get('period', 'all')
     selected_farm = None
     report = None
+    periods = []
+    managers = {}
+    ranking = []
     if farm_id:
-        selected_farm = Farm.query.get(farm_id)
-        batches = Batch.query.filter_by(farm_id=farm_id).all()
-        batch_ids = [b.id for b in batches]
-        # Get all financial summaries for these batches
-        summaries = [b.financial_summary for b in batches if b.financial_summary]
-        total_batches = len(batches)
-        total_profit = sum(s.total_profit for s in summaries if s.total_profit and s.total_profit > 0)
-        total_loss = sum(s.total_profit for s in summaries if s.total_profit and s.total_profit < 0)
-        total_expenses = sum((s.total_feed_cost or 0) + (s.total_medicine_cost or 0) + (s.total_vaccine_cost or 0) + (s.total_health_material_cost or 0) + (s.total_miscellaneous_cost or 0) + (s.total_bird_cost or 0) for s in summaries)
-        # All managers who managed any batch in this farm
-        manager_ids = set(b.manager_id for b in batches if b.manager_id)
-        managers = [User.query.get(mid) for mid in manager_ids]
-        # Most profitable batch
-        most_profitable = None
-        if summaries:
-            most_profitable = max(summaries, key=lambda s: s.total_profit if s.total_profit is not None else float('-inf'))
-        # Average mortality rate
-        mortality_rates = [(b.total_mortality / b.total_birds) * 100 for b in batches if b.total_birds > 0]
-        avg_mortality_rate = sum(mortality_rates) / len(mortality_rates) if mortality_rates else 0
-        # Average FCR
-        fcr_values = [s.fcr_value for s in summaries if s.fcr_value is not None]
-        avg_fcr = sum(fcr_values) / len(fcr_values) if fcr_values else 0
-        report = {
-            'total_batches': total_batches,
-            'total_profit': total_profit,
-            'total_loss': total_loss,
-            'total_expenses': total_expenses,
-            'managers': managers,
-            'most_profitable_batch': most_profitable.batch if most_profitable else None,
-            'most_profitable_manager': most_profitable.batch.manager if most_profitable and most_profitable.batch and most_profitable.batch.manager else None,
-            'avg_mortality_rate': avg_mortality_rate,
-            'avg_fcr': avg_fcr
-        }
-    return render_template('farmreport.html', farms=farms, selected_farm=selected_farm, report=report)
+        selected_farm = db.session.get(Farm, farm_id)
+        report = get_farm_report(farm_id, period)
+        periods = list(db.session.execute(select(farm_report_cube.c.period, farm_report_cube.c.period_type).where(
+            farm_report_cube.c.farm_id == farm_id).order_by(farm_report_cube.c.period.desc())))
+        # Everyone who managed a batch on this farm, with their employee record, in one query
+        managers = {manager.id: manager for manager in User.query.join(Batch, Batch.manager_id == User.id).filter(
+            Batch.farm_id == farm_id).options(joinedload(User.employee)).distinct()}
+    else:
+        ranking = rank_farms(period)
+    open_batches = db.session.query(func.count(Batch.id)).filter(
+        Batch.farm_id == farm_id, Batch.status.in_(ACTIVE_BATCH_STATUSES)).scalar() if farm_id else 0
+    return render_template('farmreport.html', farms=farms, selected_farm=selected_farm, report=report,
+                           period=period, periods=periods, managers=managers, ranking=ranking,
+                           open_batches=open_batches)
+
+@app.route('/api/farm-rankings')
+@login_required
+def farm_rankings():
+    """Farms ranked on one metric of the report cube, e.g. ?period=2025-Q1&metric=avg_fcr&order=asc"""
+    metric = request.args.get('metric', 'net_profit')
+    if metric not in REPORT_RANKING_METRICS:
+        return jsonify({'success': False, 'message': f"metric must be one of {', '.join(REPORT_RANKING_METRICS)}"}), 400
+    rows = rank_farms(request.args.get('period', 'all'), metric, request.args.get('order', 'desc') != 'asc',
+                      request.args.get('limit', type=int))
+    return jsonify({
+        'success': True,
+        'farms': [{key: value.isoformat() if isinstance(value, datetime) else value for key, value in row.items()}
+                  for row in rows]
+    })
+
+@app.route('/export/<dataset>.<any(csv, xlsx):file_format>')
+@login_required
+@admin_required
+def export_dataset(dataset, file_format):
+    """Stream a dataset of the batch history, e.g. /export/feeds.xlsx?farm_id=1&start_date=2025-01-01&status=closed"""
+    if dataset not in EXPORT_DATASETS:
+        return jsonify({'success': False, 'message': f"dataset must be one of {', '.join(EXPORT_DATASETS)}"}), 404
+    try:
+        start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date') else None
+        end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be given as YYYY-MM-DD'}), 400
+    try:
+        # Parsed by hand: type=int would quietly export every farm for a mistyped id
+        farm_id = int(request.args['farm_id']) if request.args.get('farm_id') else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'farm_id must be a whole number'}), 400
+    status = request.args.get('status') or None
+    if status is not None and status not in BATCH_STATUSES:
+        return jsonify({'success': False, 'message': f"status must be one of {', '.join(BATCH_STATUSES)}"}), 400
+    statement = build_export_query(dataset, farm_id, status, start_date, end_date)
+    header = [column.name for column in statement.selected_columns]
+    rows = iter_export_rows(statement)
+    filename = f"{dataset}-{datetime.now().strftime('%Y%m%d')}.{file_format}"
+    if file_format == 'csv':
+        body, mimetype = stream_csv(header, rows), 'text/csv'
+    else:
+        body, mimetype = stream_xlsx(dataset, header, rows), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return app.response_class(stream_with_context(body), mimetype=mimetype,
+                              headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,566 @@
+"""Synthetic data generator and route benchmark.
+
+Generate a database:
+    python benchmark.py generate --db bench.db --farms 10 --sheds 4 --years 2
+
+Benchmark the hot routes against a copy of it:
+    python benchmark.py run --db bench.db --iterations 20
+
+Results are written as JSON to benchmark_results/ so runs on different
+commits can be compared with `python benchmark.py compare old.json new.json`.
+
+Hammer update_batch from many threads while others read the dashboard:
+    python benchmark.py concurrency --db bench.db --threads 16 --updates 10
+
+Add --postgres to `run` or `concurrency` to import the generated database
+into a throwaway PostgreSQL cluster (initdb/pg_ctl on PATH, psycopg2
+installed, not run as root) and benchmark against that instead.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+BENCH_PASSWORD = 'bench'
+BATCH_LENGTH_DAYS = 42  # Days from placement to the first harvest
+DOWNTIME_DAYS = 14  # Cleaning between batches
+RESULTS_DIR = 'benchmark_results'
+
+
+def sqlite_url(db_path):
+    return 'sqlite:///' + os.path.abspath(db_path)
+
+
+def load_app(database_url):
+    """Import the app against the given database"""
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('PERF_INSTRUMENTATION', '1')
+    import app as farm_app
+    return farm_app
+
+
+def start_postgres(workdir):
+    """Start a throwaway PostgreSQL cluster under workdir, returning its URL and a stop function"""
+    for tool in ('initdb', 'pg_ctl', 'createdb'):
+        if not shutil.which(tool):
+            sys.exit(f'{tool} is not on PATH, install PostgreSQL to use --postgres')
+    data_dir = os.path.join(workdir, 'pgdata')
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    subprocess.run(['initdb', '-D', data_dir, '-U', 'farm', '--auth=trust', '-E', 'UTF8'],
+                   check=True, stdout=subprocess.DEVNULL)
+    # Unix socket only, inside workdir, so nothing else can reach it
+    subprocess.run(['pg_ctl', '-D', data_dir, '-l', os.path.join(workdir, 'postgres.log'), '-w',
+                    '-o', f"-p {port} -k {workdir} -c listen_addresses=''", 'start'],
+                   check=True, stdout=subprocess.DEVNULL)
+    subprocess.run(['createdb', '-h', workdir, '-p', str(port), '-U', 'farm', 'farm'], check=True)
+
+    def stop():
+        subprocess.run(['pg_ctl', '-D', data_dir, '-m', 'fast', '-w', 'stop'], stdout=subprocess.DEVNULL)
+
+    return f'postgresql+psycopg2://farm@/farm?host={workdir}&port={port}', stop
+
+
+def open_scratch_database(args):
+    """Load the app against a scratch copy of args.db so benchmark writes never touch it.
+
+    Returns the app module and a cleanup function. With --postgres the copy
+    is imported into a local PostgreSQL cluster instead of a file copy.
+    """
+    if not os.path.exists(args.db):
+        sys.exit(f'{args.db} does not exist, run `python benchmark.py generate` first')
+    workdir = tempfile.mkdtemp(prefix='farm-bench-')
+    if not args.postgres:
+        db_copy = os.path.join(workdir, 'bench.db')
+        shutil.copy(args.db, db_copy)
+        m = load_app(sqlite_url(db_copy))
+
+        def cleanup_copy():
+            m.stop_job_workers()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        return m, cleanup_copy
+
+    url, stop_postgres = start_postgres(workdir)
+    try:
+        m = load_app(url)
+        with m.app.app_context():
+            copied = m.import_database(sqlite_url(args.db))
+        print(f'Imported {sum(copied.values())} rows into PostgreSQL')
+    except BaseException:
+        stop_postgres()
+        raise
+
+    def cleanup():
+        m.stop_job_workers()
+        with m.app.app_context():
+            m.db.engine.dispose()
+        stop_postgres()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return m, cleanup
+
+
+def create_catalog(m, rng):
+    feeds = []
+    for brand in ('Suguna', 'Venky', 'Godrej'):
+        for category, price in (('pre-starter', 48), ('starter', 45), ('finisher', 42)):
+            feeds.append(m.Feed(brand=brand, category=category, weight=50, price=price + rng.randint(-3, 3)))
+    medicines = [m.Medicine(name=f'Medicine {i}', quantity_per_unit=1, unit_type='litre', price=rng.randint(80, 400))
+                 for i in range(1, 9)]
+    vaccines = [m.Vaccine(name=name, quantity_per_unit=1000, price=rng.randint(150, 600), doses_required=2,
+                          dose_ages=json.dumps(ages))
+                for name, ages in (('Lasota', [7, 21]), ('Gumboro', [14, 24]), ('IB', [5, 18]))]
+    materials = [m.HealthMaterial(name=f'Material {i}', category='Disinfectant', quantity_per_unit=1,
+                                  unit_type='litre', price=rng.randint(50, 250))
+                 for i in range(1, 6)]
+    m.db.session.add_all(feeds + medicines + vaccines + materials)
+    m.db.session.flush()
+
+    auto_schedules = [m.AutoSchedule(item_type='medicine', item_id=medicine.id,
+                                     schedule_ages=json.dumps(sorted(rng.sample(range(1, 35), 3))))
+                      for medicine in medicines[:4]]
+    auto_schedules += [m.AutoSchedule(item_type='vaccine', item_id=vaccine.id, schedule_ages=vaccine.dose_ages)
+                       for vaccine in vaccines]
+    auto_schedules += [m.AutoSchedule(item_type='health_material', item_id=material.id,
+                                      schedule_ages=json.dumps([1, 15, 30]))
+                       for material in materials[:2]]
+    m.db.session.add_all(auto_schedules)
+    m.db.session.add_all([
+        m.FCRRate(lower_limit=0, upper_limit=1.5, rate=8),
+        m.FCRRate(lower_limit=1.5, upper_limit=1.7, rate=6),
+        m.FCRRate(lower_limit=1.7, upper_limit=None, rate=4),
+    ])
+    m.db.session.commit()
+    return feeds, medicines, vaccines, materials
+
+
+def create_users(m, farms):
+    admin = m.User(username='bench_admin', user_type='admin')
+    admin.set_password(BENCH_PASSWORD)
+    senior = m.User(username='bench_senior', user_type='senior_supervisor')
+    senior.set_password(BENCH_PASSWORD)
+    m.db.session.add_all([admin, senior])
+    supervisors = []
+    for i in range(farms):
+        supervisor = m.User(username=f'bench_supervisor_{i + 1}', user_type='assistant_supervisor')
+        supervisor.set_password(BENCH_PASSWORD)
+        supervisors.append(supervisor)
+    m.db.session.add_all(supervisors)
+    m.db.session.flush()
+    m.db.session.add(m.Employee(name='Bench Senior', user_id=senior.id, phone_number='9000000000'))
+    for i, supervisor in enumerate(supervisors):
+        m.db.session.add(m.Employee(name=f'Supervisor {i + 1}', user_id=supervisor.id,
+                                    phone_number=f'9{i + 1:09d}'))
+    m.db.session.commit()
+    return supervisors
+
+
+def add_batch_history(m, rng, farm, supervisor, farm_batch_number, start, catalog, today):
+    """Create one batch with daily updates, scheduled items, harvests and its summary"""
+    feeds, medicines, vaccines, materials = catalog
+    shed_capacities = farm.get_shed_capacities()
+    shed_birds = [int(capacity * rng.uniform(0.8, 1.0)) for capacity in shed_capacities]
+    total_birds = sum(shed_birds)
+    batch = m.Batch(farm_id=farm.id, manager_id=supervisor.id, batch_number=f'BATCH-{0:04d}',
+                    farm_batch_number=farm_batch_number, brand=rng.choice(['Cobb', 'Ross', 'Hubbard']),
+                    total_birds=total_birds, extra_chicks=int(total_birds * 0.01), available_birds=total_birds,
+                    cost_per_chicken=rng.uniform(28, 42), status='ongoing', created_at=start)
+    batch.set_shed_birds(shed_birds)
+    m.db.session.add(batch)
+    m.db.session.flush()
+    batch.batch_number = f'BATCH-{batch.id:04d}'
+    m.create_schedules_for_batch(batch)
+
+    schedules = {}
+    for schedule in batch.medicine_schedules:
+        schedules.setdefault(schedule.schedule_date, []).append(('medicine', schedule, schedule.medicine))
+    for schedule in batch.vaccine_schedules:
+        schedules.setdefault(schedule.scheduled_date, []).append(('vaccine', schedule, schedule.vaccine))
+    for schedule in batch.health_material_schedules:
+        schedules.setdefault(schedule.scheduled_date, []).append(('health_material', schedule,
+                                                                  schedule.health_material))
+
+    brand = rng.choice(['Suguna', 'Venky', 'Godrej'])
+    brand_feeds = [feed for feed in feeds if feed.brand == brand]
+    last_day = min(BATCH_LENGTH_DAYS, (today - start.date()).days)
+    alive = total_birds
+    for day in range(last_day):
+        date = start.date() + timedelta(days=day)
+        age = day + 1
+        feed = brand_feeds[0 if age <= 10 else 1 if age <= 24 else 2]
+        mortality = min(alive, int(rng.expovariate(1 / max(1.0, total_birds * 0.0006))))
+        feed_used = round(total_birds * (0.02 + 0.0045 * age) / feed.weight, 1)
+        update = m.BatchUpdate(batch_id=batch.id, date=date, mortality_count=mortality, feed_used=feed_used,
+                               avg_weight=round(0.04 + 0.055 * age, 3), male_weight=round(0.045 + 0.06 * age, 3),
+                               female_weight=round(0.035 + 0.05 * age, 3),
+                               remarks=rng.choice(['', '', '', 'Birds active', 'Low water intake']),
+                               remarks_priority=rng.choice(['low', 'low', 'low', 'medium', 'high']),
+                               created_at=datetime.combine(date, datetime.min.time()) + timedelta(hours=18))
+        m.db.session.add(update)
+        m.db.session.flush()
+        alive -= mortality
+        batch.total_mortality += mortality
+        batch.available_birds -= mortality
+        batch.feed_usage += feed_used
+        batch.feed_stock -= feed_used
+
+        if day % 3 == 0:
+            packets = round(feed_used * 3 + rng.randint(0, 5))
+            m.db.session.execute(m.batch_update_feeds.insert().values(
+                batch_update_id=update.id, feed_id=feed.id, quantity=packets,
+                quantity_per_unit_at_time=feed.weight, price_at_time=feed.price,
+                total_cost=packets * feed.price))
+            batch.feed_stock += packets
+
+        for item_type, schedule, item in schedules.get(date, []):
+            if item is None:
+                continue
+            quantity = rng.randint(1, 4)
+            m.db.session.add(m.BatchUpdateItem(
+                batch_update_id=update.id, item_id=item.id, item_type=item_type, quantity=quantity,
+                quantity_per_unit_at_time=item.quantity_per_unit, unit_type=getattr(item, 'unit_type', 'ml'),
+                price_at_time=item.price, total_cost=quantity * item.price, schedule_id=schedule.id,
+                dose_number=getattr(schedule, 'dose_number', None)))
+            schedule.completed = True
+
+        if rng.random() < 0.1:
+            medicine = rng.choice(medicines)
+            m.db.session.add(m.BatchUpdateItem(
+                batch_update_id=update.id, item_id=medicine.id, item_type='medicine', quantity=1,
+                quantity_per_unit_at_time=medicine.quantity_per_unit, unit_type=medicine.unit_type,
+                price_at_time=medicine.price, total_cost=medicine.price))
+        if rng.random() < 0.08:
+            units = rng.randint(1, 10)
+            price = rng.choice([15, 40, 120])
+            m.db.session.add(m.MiscellaneousItem(
+                batch_update_id=update.id, name=rng.choice(['Litter', 'Electricity', 'Labour']),
+                quantity_per_unit=1, unit_type='piece', price_per_unit=price, units_used=units,
+                total_cost=units * price))
+        if day == BATCH_LENGTH_DAYS - 1 and batch.feed_stock > 2:
+            returned = round(batch.feed_stock / 2)
+            m.db.session.add(m.BatchFeedReturn(batch_update_id=update.id, feed_id=feed.id, quantity=returned))
+            batch.feed_stock -= returned
+
+    m.get_batch_ledger(batch)
+    m.refresh_batch_daily_metrics(batch)
+    harvest_start = start.date() + timedelta(days=BATCH_LENGTH_DAYS)
+    if harvest_start + timedelta(days=3) <= today:
+        batch.status = 'closing'
+        for i in range(3):
+            quantity = batch.available_birds if i == 2 else batch.available_birds // (3 - i)
+            weight = round(quantity * rng.uniform(2.1, 2.6), 1)
+            price = rng.uniform(90, 120)
+            m.db.session.add(m.Harvest(batch_id=batch.id, date=harvest_start + timedelta(days=i), quantity=quantity,
+                                       weight=weight, selling_price=price, total_value=weight * price))
+            batch.available_birds -= quantity
+        m.db.session.flush()
+        m.rebuild_batch_ledger(batch)
+        batch.check_and_update_status()
+        batch.closed_at = datetime.combine(harvest_start + timedelta(days=2), datetime.min.time())
+        m.db.session.commit()
+        # Closing queued the summary job; run it here, as no web process is around to
+        m.work_jobs('benchmark', until_idle=True)
+        m.FinancialSummary.query.filter_by(batch_id=batch.id).update({'created_at': batch.closed_at})
+    m.db.session.commit()
+    return batch
+
+
+def generate(args):
+    if os.path.exists(args.db):
+        if not args.force:
+            sys.exit(f'{args.db} already exists, pass --force to overwrite it')
+        os.remove(args.db)
+    m = load_app(sqlite_url(args.db))
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    today = datetime.now().date()
+    with m.app.app_context():
+        m.db.create_all()
+        catalog = create_catalog(m, rng)
+        supervisors = create_users(m, args.farms)
+        batches = 0
+        for i in range(args.farms):
+            capacities = [rng.choice([2000, 3000, 4000, 5000]) for _ in range(args.sheds)]
+            farm = m.Farm(name=f'Farm {i + 1}', total_capacity=sum(capacities), num_sheds=args.sheds,
+                          shed_capacities=json.dumps(capacities), total_area=sum(capacities) * 1.1,
+                          owner_name=f'Owner {i + 1}', contact_number=f'8{i + 1:09d}',
+                          manager_id=supervisors[i].id)
+            m.db.session.add(farm)
+            m.db.session.commit()
+
+            start = datetime.combine(today - timedelta(days=int(365 * args.years)), datetime.min.time())
+            start += timedelta(days=rng.randint(0, 20), hours=8)
+            farm_batch_number = 1
+            while start.date() < today:
+                add_batch_history(m, rng, farm, supervisors[i], farm_batch_number, start, catalog, today)
+                batches += 1
+                farm_batch_number += 1
+                start += timedelta(days=BATCH_LENGTH_DAYS + 3 + DOWNTIME_DAYS + rng.randint(0, 7))
+            print(f'Farm {i + 1}/{args.farms}: {farm_batch_number - 1} batches')
+
+        counts = {name: model.query.count() for name, model in (
+            ('farms', m.Farm), ('batches', m.Batch), ('batch_updates', m.BatchUpdate),
+            ('batch_update_items', m.BatchUpdateItem), ('harvests', m.Harvest))}
+    print(f'Generated {counts} in {time.perf_counter() - started:.1f}s -> {args.db}')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def login(client, username):
+    response = client.post('/login', data={'username': username, 'password': BENCH_PASSWORD})
+    if response.status_code not in (200, 302):
+        sys.exit(f'Could not log in as {username}')
+
+
+def measure(client, method, url, iterations, data_factory=None):
+    timings = []
+    queries = []
+    statuses = set()
+    for i in range(iterations):
+        started = time.perf_counter()
+        if method == 'POST':
+            response = client.post(url, data=data_factory(i))
+        else:
+            response = client.get(url)
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(int(response.headers.get('X-Query-Count', 0)))
+        statuses.add(response.status_code)
+    return {
+        'method': method,
+        'url': url,
+        'iterations': iterations,
+        'statuses': sorted(statuses),
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'max_ms': round(max(timings), 2),
+        'queries_p50': statistics.median(queries),
+        'queries_max': max(queries)
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(args):
+    # Work on a copy so the update POSTs never change the generated data set
+    m, cleanup = open_scratch_database(args)
+
+    with m.app.app_context():
+        open_batch = m.Batch.query.filter(m.Batch.status == 'ongoing').order_by(m.Batch.id.desc()).first()
+        closed_batch = m.Batch.query.filter(m.Batch.status == 'closed').order_by(m.Batch.id.desc()).first()
+        busiest_farm_id = m.db.session.query(m.Batch.farm_id).group_by(m.Batch.farm_id).order_by(
+            m.db.func.count(m.Batch.id).desc()).limit(1).scalar()
+        last_update = m.BatchUpdate.query.filter_by(batch_id=open_batch.id).order_by(
+            m.BatchUpdate.date.desc()).first() if open_batch else None
+        feed_id = m.Feed.query.first().id
+        counts = {'batches': m.Batch.query.count(), 'batch_updates': m.BatchUpdate.query.count()}
+    if open_batch is None or closed_batch is None:
+        sys.exit('The database needs at least one ongoing and one closed batch')
+    first_free_date = (last_update.date if last_update else datetime.now().date()) + timedelta(days=1)
+
+    def update_form(i):
+        return {'date': (first_free_date + timedelta(days=i)).strftime('%Y-%m-%d'), 'mortality_count': 3,
+                'feed_used': 10, 'avg_weight': 1.2, 'male_weight': 1.3, 'female_weight': 1.1, 'remarks': '',
+                'remarks_priority': 'low', 'feed_id[]': [feed_id], 'feed_quantity[]': ['20']}
+
+    admin = m.app.test_client()
+    login(admin, 'bench_admin')
+    supervisor = m.app.test_client()
+    login(supervisor, 'bench_senior')
+
+    routes = [
+        (admin, 'GET', '/dashboard', None),
+        (admin, 'GET', '/batches', None),
+        (admin, 'GET', f'/batches/{open_batch.id}/view', None),
+        (admin, 'GET', f'/batches/{closed_batch.id}/view', None),
+        (supervisor, 'GET', '/manager/schedules', None),
+        (admin, 'GET', '/pending-schedules', None),
+        (admin, 'GET', f'/farmreport?farm_id={busiest_farm_id}', None),
+        (admin, 'GET', f'/batchreport?batch_id={closed_batch.id}', None),
+        (admin, 'POST', f'/batches/{open_batch.id}/update', update_form),
+    ]
+    results = []
+    for client, method, url, data_factory in routes:
+        result = measure(client, method, url, args.iterations, data_factory)
+        results.append(result)
+        print(f"{method:4} {url:45} p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  "
+              f"queries {result['queries_p50']:>6}")
+
+    report = {
+        'revision': git_revision(),
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'database': os.path.abspath(args.db),
+        'backend': 'postgresql' if args.postgres else 'sqlite',
+        'data': counts,
+        'iterations': args.iterations,
+        'routes': results
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['revision']}.json")
+    with open(output, 'w') as results_file:
+        json.dump(report, results_file, indent=2)
+    cleanup()
+    print(f'Results saved to {output}')
+
+
+def concurrency(args):
+    m, cleanup = open_scratch_database(args)
+    m.app.config['PROPAGATE_EXCEPTIONS'] = False  # Failed requests become 500s instead of killing the thread
+
+    with m.app.app_context():
+        open_batches = m.Batch.query.filter(m.Batch.status == 'ongoing').order_by(m.Batch.id).all()
+        if not open_batches:
+            sys.exit('The database needs at least one ongoing batch')
+        first_free = {}
+        for batch in open_batches:
+            last_date = m.db.session.query(m.db.func.max(m.BatchUpdate.date)).filter(
+                m.BatchUpdate.batch_id == batch.id).scalar()
+            first_free[batch.id] = (last_date or batch.created_at.date()) + timedelta(days=1)
+        batch_ids = [batch.id for batch in open_batches]
+        updates_before = m.BatchUpdate.query.count()
+        feed_id = m.Feed.query.first().id
+
+    results = {'writes': [], 'reads': [], 'errors': []}
+    lock = threading.Lock()
+    start_line = threading.Barrier(args.threads + args.readers)
+    writers_done = threading.Event()
+
+    def writer(slot):
+        client = m.app.test_client()
+        login(client, 'bench_admin')
+        batch_id = batch_ids[slot % len(batch_ids)]
+        # Threads sharing a batch get disjoint date ranges so every update is legitimate
+        first_day = first_free[batch_id] + timedelta(days=(slot // len(batch_ids)) * args.updates)
+        start_line.wait()
+        for i in range(args.updates):
+            form = {'date': (first_day + timedelta(days=i)).strftime('%Y-%m-%d'), 'mortality_count': 1,
+                    'feed_used': 1, 'avg_weight': 1.2, 'male_weight': 1.3, 'female_weight': 1.1, 'remarks': '',
+                    'remarks_priority': 'low', 'feed_id[]': [feed_id], 'feed_quantity[]': ['2']}
+            started = time.perf_counter()
+            response = client.post(f'/batches/{batch_id}/update', data=form)
+            elapsed = (time.perf_counter() - started) * 1000
+            # Success redirects to the batch page; a refused update redirects back to the form
+            ok = response.status_code == 302 and '/update' not in response.headers.get('Location', '')
+            with lock:
+                results['writes'].append(elapsed)
+                if not ok:
+                    results['errors'].append(f"POST batch {batch_id} {form['date']}: {response.status_code}")
+
+    def reader():
+        client = m.app.test_client()
+        login(client, 'bench_admin')
+        start_line.wait()
+        while not writers_done.is_set():
+            for url in ('/dashboard', '/batches', '/pending-schedules'):
+                m.invalidate_dashboard_cache()
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    results['reads'].append(elapsed)
+                    if response.status_code != 200:
+                        results['errors'].append(f'GET {url}: {response.status_code}')
+
+    writers = [threading.Thread(target=writer, args=(slot,)) for slot in range(args.threads)]
+    readers = [threading.Thread(target=reader) for _ in range(args.readers)]
+    started = time.perf_counter()
+    for thread in writers + readers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    writers_done.set()
+    for thread in readers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with m.app.app_context():
+        written = m.BatchUpdate.query.count() - updates_before
+        drift = m.find_ledger_drift()
+    expected = args.threads * args.updates
+    for label in ('writes', 'reads'):
+        timings = results[label]
+        if timings:
+            print(f'{label:6} {len(timings):5}  p50 {statistics.median(timings):8.1f} ms  '
+                  f'p95 {percentile(timings, 0.95):8.1f} ms  max {max(timings):8.1f} ms')
+    print(f'{written} of {expected} updates written in {elapsed:.1f}s, '
+          f"{len(results['errors'])} failed requests, {len(drift)} ledger fields drifted")
+    for error in results['errors'][:20]:
+        print(f'  {error}')
+    cleanup()
+    if results['errors'] or written != expected or drift:
+        sys.exit(1)
+
+
+def compare(args):
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    previous = {(route['method'], route['url']): route for route in before['routes']}
+    print(f"{before['revision']} -> {after['revision']}")
+    for route in after['routes']:
+        old = previous.get((route['method'], route['url']))
+        if not old:
+            continue
+        print(f"{route['method']:4} {route['url']:45} p50 {old['p50_ms']:8.1f} -> {route['p50_ms']:8.1f} ms  "
+              f"queries {old['queries_p50']:>6} -> {route['queries_p50']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = subparsers.add_parser('generate', help='Build a synthetic SQLite database')
+    generate_parser.add_argument('--db', default='bench.db')
+    generate_parser.add_argument('--farms', type=int, default=10)
+    generate_parser.add_argument('--sheds', type=int, default=4)
+    generate_parser.add_argument('--years', type=float, default=2)
+    generate_parser.add_argument('--seed', type=int, default=42)
+    generate_parser.add_argument('--force', action='store_true', help='Overwrite an existing database')
+    generate_parser.set_defaults(func=generate)
+
+    run_parser = subparsers.add_parser('run', help='Benchmark the hot routes')
+    run_parser.add_argument('--db', default='bench.db')
+    run_parser.add_argument('--iterations', type=int, default=20)
+    run_parser.add_argument('--output', help='Where to write the JSON results')
+    run_parser.add_argument('--postgres', action='store_true', help='Run against a local PostgreSQL copy')
+    run_parser.set_defaults(func=run)
+
+    concurrency_parser = subparsers.add_parser('concurrency', help='Hammer update_batch from many threads')
+    concurrency_parser.add_argument('--db', default='bench.db')
+    concurrency_parser.add_argument('--threads', type=int, default=16, help='Threads posting daily updates')
+    concurrency_parser.add_argument('--updates', type=int, default=10, help='Updates posted by each thread')
+    concurrency_parser.add_argument('--readers', type=int, default=2, help='Threads reading the dashboard meanwhile')
+    concurrency_parser.add_argument('--postgres', action='store_true', help='Run against a local PostgreSQL copy')
+    concurrency_parser.set_defaults(func=concurrency)
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -97,14 +97,27 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        # SQLite table rebuilds drop the old table, which with foreign keys on
+        # would cascade into its children. The pragma only changes outside a
+        # transaction, so it goes straight to the driver before alembic begins.
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            connection.connection.driver_connection.execute('PRAGMA foreign_keys=OFF')
+
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
             **conf_args
         )
 
-        with context.begin_transaction():
-            context.run_migrations()
+        try:
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            if sqlite:
+                connection.rollback()
+                foreign_keys = current_app.config.get('SQLITE_PRAGMAS', {}).get('foreign_keys', 'OFF')
+                connection.connection.driver_connection.execute(f'PRAGMA foreign_keys={foreign_keys}')
 
 
 if context.is_offline_mode():
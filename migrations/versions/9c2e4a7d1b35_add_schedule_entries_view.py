@@ -0,0 +1,64 @@
+"""Add schedule_entries view and schedule indexes
+
+Revision ID: 9c2e4a7d1b35
+Revises: f50001fcdc88
+Create Date: 2026-10-17 09:12:41.218530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c2e4a7d1b35'
+down_revision = 'f50001fcdc88'
+branch_labels = None
+depends_on = None
+
+
+SCHEDULE_ENTRIES_VIEW = """
+CREATE VIEW schedule_entries AS
+SELECT 'medicine' AS schedule_type, s.id AS schedule_id, s.medicine_id AS item_id, i.name AS item_name,
+       l.batch_id AS batch_id, s.schedule_date AS date, s.completed AS completed,
+       CAST(NULL AS INTEGER) AS dose_number
+FROM medicine_schedule s
+JOIN medicine_schedule_batches l ON l.medicine_schedule_id = s.id
+JOIN medicine i ON i.id = s.medicine_id
+UNION ALL
+SELECT 'vaccine', s.id, s.vaccine_id, i.name, l.batch_id, s.scheduled_date, s.completed,
+       CAST(s.dose_number AS INTEGER)
+FROM vaccine_schedule s
+JOIN vaccine_schedule_batches l ON l.vaccine_schedule_id = s.id
+JOIN vaccine i ON i.id = s.vaccine_id
+UNION ALL
+SELECT 'health_material', s.id, s.health_material_id, i.name, l.batch_id, s.scheduled_date, s.completed,
+       CAST(NULL AS INTEGER)
+FROM health_material_schedule s
+JOIN health_material_schedule_batches l ON l.health_material_schedule_id = s.id
+JOIN health_material i ON i.id = s.health_material_id
+"""
+
+
+def upgrade():
+    op.create_index('ix_medicine_schedule_date_completed', 'medicine_schedule', ['schedule_date', 'completed'])
+    op.create_index('ix_vaccine_schedule_date_completed', 'vaccine_schedule', ['scheduled_date', 'completed'])
+    op.create_index('ix_health_material_schedule_date_completed', 'health_material_schedule',
+                    ['scheduled_date', 'completed'])
+    op.create_index('ix_medicine_schedule_batches_batch', 'medicine_schedule_batches',
+                    ['batch_id', 'medicine_schedule_id'])
+    op.create_index('ix_vaccine_schedule_batches_batch', 'vaccine_schedule_batches',
+                    ['batch_id', 'vaccine_schedule_id'])
+    op.create_index('ix_health_material_schedule_batches_batch', 'health_material_schedule_batches',
+                    ['batch_id', 'health_material_schedule_id'])
+    op.execute('DROP VIEW IF EXISTS schedule_entries')
+    op.execute(SCHEDULE_ENTRIES_VIEW)
+
+
+def downgrade():
+    op.execute('DROP VIEW IF EXISTS schedule_entries')
+    op.drop_index('ix_health_material_schedule_batches_batch', table_name='health_material_schedule_batches')
+    op.drop_index('ix_vaccine_schedule_batches_batch', table_name='vaccine_schedule_batches')
+    op.drop_index('ix_medicine_schedule_batches_batch', table_name='medicine_schedule_batches')
+    op.drop_index('ix_health_material_schedule_date_completed', table_name='health_material_schedule')
+    op.drop_index('ix_vaccine_schedule_date_completed', table_name='vaccine_schedule')
+    op.drop_index('ix_medicine_schedule_date_completed', table_name='medicine_schedule')
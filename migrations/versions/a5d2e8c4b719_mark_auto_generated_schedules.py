@@ -0,0 +1,105 @@
+"""Mark the schedules made from auto-schedules so regeneration leaves hand-made ones alone
+
+Revision ID: a5d2e8c4b719
+Revises: e2b7c5a93f18
+Create Date: 2026-10-18 10:41:27.815302
+
+"""
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5d2e8c4b719'
+down_revision = 'e2b7c5a93f18'
+branch_labels = None
+depends_on = None
+
+
+# Same definition as in c7a9e2f4d813. SQLite refuses to rebuild a table a view
+# depends on, so the view is dropped around the column changes.
+SCHEDULE_ENTRIES_VIEW = """
+CREATE VIEW schedule_entries AS
+SELECT 'medicine' AS schedule_type, s.id AS schedule_id, s.medicine_id AS item_id, i.name AS item_name,
+       l.batch_id AS batch_id, s.schedule_date AS date, s.completed AS completed,
+       CAST(NULL AS INTEGER) AS dose_number
+FROM medicine_schedule s
+JOIN medicine_schedule_batches l ON l.medicine_schedule_id = s.id
+JOIN medicine i ON i.id = s.medicine_id
+UNION ALL
+SELECT 'vaccine', s.id, s.vaccine_id, i.name, l.batch_id, s.scheduled_date, s.completed,
+       CAST(s.dose_number AS INTEGER)
+FROM vaccine_schedule s
+JOIN vaccine_schedule_batches l ON l.vaccine_schedule_id = s.id
+JOIN vaccine i ON i.id = s.vaccine_id
+UNION ALL
+SELECT 'health_material', s.id, s.health_material_id, i.name, l.batch_id, s.scheduled_date, s.completed,
+       CAST(NULL AS INTEGER)
+FROM health_material_schedule s
+JOIN health_material_schedule_batches l ON l.health_material_schedule_id = s.id
+JOIN health_material i ON i.id = s.health_material_id
+"""
+
+# item_type: (schedule table, association table, its schedule column, item column, date column)
+SCHEDULE_TABLES = {
+    'medicine': ('medicine_schedule', 'medicine_schedule_batches', 'medicine_schedule_id', 'medicine_id', 'schedule_date'),
+    'vaccine': ('vaccine_schedule', 'vaccine_schedule_batches', 'vaccine_schedule_id', 'vaccine_id', 'scheduled_date'),
+    'health_material': ('health_material_schedule', 'health_material_schedule_batches', 'health_material_schedule_id',
+                        'health_material_id', 'scheduled_date')
+}
+
+
+def mark_existing_schedules(connection):
+    """Flag the schedules that sit exactly where an auto-schedule of their item puts one for their batch.
+
+    Nothing recorded where the existing rows came from, so a schedule a user
+    added by hand on such a day is flagged too; every other one is kept as
+    hand-made and never touched by regeneration.
+    """
+    ages = {}
+    for item_type, item_id, age in connection.execute(text(
+            'SELECT a.item_type, a.item_id, g.age_days FROM auto_schedule a '
+            'JOIN auto_schedule_age g ON g.auto_schedule_id = a.id')):
+        ages.setdefault((item_type, int(item_id)), set()).add(age)
+
+    for item_type, (table, link_table, link_column, item_column, date_column) in SCHEDULE_TABLES.items():
+        rows = connection.execute(text(
+            f'SELECT s.id, s.{item_column}, s.{date_column}, b.created_at FROM {table} s '
+            f'JOIN {link_table} l ON l.{link_column} = s.id JOIN batch b ON b.id = l.batch_id'
+        ).columns(sa.column('id', sa.Integer), sa.column('item_id', sa.Integer),
+                  sa.column('date', sa.Date), sa.column('created_at', sa.DateTime)))
+        marked = set()
+        for schedule_id, item_id, date, created_at in rows:
+            item_ages = ages.get((item_type, item_id))
+            if item_ages and (date - created_at.date() + timedelta(days=1)).days in item_ages:
+                marked.add(schedule_id)
+        marked = sorted(marked)
+        schedules = sa.table(table, sa.column('id'), sa.column('auto_generated'))
+        for start in range(0, len(marked), 500):
+            connection.execute(schedules.update().where(
+                schedules.c.id.in_(marked[start:start + 500])).values(auto_generated=True))
+
+
+def upgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    added = False
+    for table, *_ in SCHEDULE_TABLES.values():
+        # The app's create_all may already have made the tables with the column
+        if 'auto_generated' in {column['name'] for column in inspector.get_columns(table)}:
+            continue
+        op.add_column(table, sa.Column('auto_generated', sa.Boolean(), nullable=False, server_default=sa.false()))
+        added = True
+    if added:
+        mark_existing_schedules(connection)
+
+
+def downgrade():
+    op.execute('DROP VIEW IF EXISTS schedule_entries')
+    for table, *_ in SCHEDULE_TABLES.values():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('auto_generated')
+    op.execute(SCHEDULE_ENTRIES_VIEW)
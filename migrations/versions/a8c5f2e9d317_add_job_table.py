@@ -0,0 +1,47 @@
+"""Add the job table for background work
+
+Revision ID: a8c5f2e9d317
+Revises: f29d4e7b8a61
+Create Date: 2026-10-17 19:26:51.804417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c5f2e9d317'
+down_revision = 'f29d4e7b8a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all may already have made the table on startup
+    if 'job' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table('job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('dedupe_key', sa.String(length=255), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('worker', sa.String(length=100), nullable=True),
+        sa.Column('run_after', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_job_status_run_after', 'job', ['status', 'run_after'])
+    op.create_index('ix_job_dedupe_key_status', 'job', ['dedupe_key', 'status'])
+
+
+def downgrade():
+    op.drop_index('ix_job_dedupe_key_status', table_name='job')
+    op.drop_index('ix_job_status_run_after', table_name='job')
+    op.drop_table('job')
@@ -0,0 +1,48 @@
+"""Add indexes for the hot query paths and one update per batch per day
+
+Revision ID: b41d7e06a9c3
+Revises: 9c2e4a7d1b35
+Create Date: 2026-10-17 11:40:05.613904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41d7e06a9c3'
+down_revision = '9c2e4a7d1b35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The unique index cannot be built while a batch has two updates on the same day
+    connection = op.get_bind()
+    duplicates = connection.execute(text(
+        'SELECT batch_id, date, COUNT(*) FROM batch_update GROUP BY batch_id, date HAVING COUNT(*) > 1'
+    )).fetchall()
+    if duplicates:
+        listing = ', '.join(f'batch {batch_id} on {date} ({count} updates)' for batch_id, date, count in duplicates)
+        raise RuntimeError(f'Merge or delete the duplicate daily updates before upgrading: {listing}')
+
+    op.create_index('ix_batch_status', 'batch', ['status'])
+    op.create_index('ix_batch_manager_status', 'batch', ['manager_id', 'status'])
+    op.create_index('ix_batch_farm_status', 'batch', ['farm_id', 'status'])
+    op.create_index('uq_batch_update_batch_date', 'batch_update', ['batch_id', 'date'], unique=True)
+    op.create_index('ix_batch_update_remarks_priority', 'batch_update', ['remarks_priority', 'created_at'])
+    op.create_index('ix_harvest_batch_date', 'harvest', ['batch_id', 'date'])
+    op.create_index('ix_batch_update_item_update_type', 'batch_update_item', ['batch_update_id', 'item_type'])
+    op.create_index('ix_batch_update_feeds_feed_update', 'batch_update_feeds', ['feed_id', 'batch_update_id'])
+
+
+def downgrade():
+    op.drop_index('ix_batch_update_feeds_feed_update', table_name='batch_update_feeds')
+    op.drop_index('ix_batch_update_item_update_type', table_name='batch_update_item')
+    op.drop_index('ix_harvest_batch_date', table_name='harvest')
+    op.drop_index('ix_batch_update_remarks_priority', table_name='batch_update')
+    op.drop_index('uq_batch_update_batch_date', table_name='batch_update')
+    op.drop_index('ix_batch_farm_status', table_name='batch')
+    op.drop_index('ix_batch_manager_status', table_name='batch')
+    op.drop_index('ix_batch_status', table_name='batch')
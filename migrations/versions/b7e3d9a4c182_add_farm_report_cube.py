@@ -0,0 +1,49 @@
+"""Add the farm report cube
+
+Revision ID: b7e3d9a4c182
+Revises: a8c5f2e9d317
+Create Date: 2026-10-17 21:04:12.318850
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3d9a4c182'
+down_revision = 'a8c5f2e9d317'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all may already have made the table on startup. The
+    # rows are filled by the app when it finds the cube empty, or with
+    # `flask rebuild-report-cube`.
+    if 'farm_report_cube' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table('farm_report_cube',
+        sa.Column('farm_id', sa.Integer(), nullable=False),
+        sa.Column('period', sa.String(length=10), nullable=False),
+        sa.Column('period_type', sa.String(length=10), nullable=False),
+        sa.Column('batch_count', sa.Integer(), nullable=False),
+        sa.Column('total_profit', sa.Float(), nullable=False),
+        sa.Column('total_loss', sa.Float(), nullable=False),
+        sa.Column('net_profit', sa.Float(), nullable=False),
+        sa.Column('total_expenses', sa.Float(), nullable=False),
+        sa.Column('avg_mortality_rate', sa.Float(), nullable=False),
+        sa.Column('avg_fcr', sa.Float(), nullable=False),
+        sa.Column('best_batch_id', sa.Integer(), nullable=True),
+        sa.Column('best_batch_number', sa.String(length=50), nullable=True),
+        sa.Column('best_batch_profit', sa.Float(), nullable=True),
+        sa.Column('best_manager_id', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['farm_id'], ['farm.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('farm_id', 'period')
+    )
+    op.create_index('ix_farm_report_cube_period_net_profit', 'farm_report_cube', ['period', 'net_profit'])
+
+
+def downgrade():
+    op.drop_index('ix_farm_report_cube_period_net_profit', table_name='farm_report_cube')
+    op.drop_table('farm_report_cube')
@@ -0,0 +1,29 @@
+"""Add the indexes behind the keyset-paginated batch and harvest listings
+
+Revision ID: c4d8a2f61e95
+Revises: b7e3d9a4c182
+Create Date: 2026-10-17 23:31:47.902315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8a2f61e95'
+down_revision = 'b7e3d9a4c182'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'ix_batch_created_at_id' not in {index['name'] for index in inspector.get_indexes('batch')}:
+        op.create_index('ix_batch_created_at_id', 'batch', ['created_at', 'id'])
+    if 'ix_harvest_date_id' not in {index['name'] for index in inspector.get_indexes('harvest')}:
+        op.create_index('ix_harvest_date_id', 'harvest', ['date', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_harvest_date_id', table_name='harvest')
+    op.drop_index('ix_batch_created_at_id', table_name='batch')
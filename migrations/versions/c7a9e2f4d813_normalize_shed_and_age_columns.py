@@ -0,0 +1,226 @@
+"""Move shed capacities, shed birds, dose ages and schedule ages into tables
+
+Revision ID: c7a9e2f4d813
+Revises: b41d7e06a9c3
+Create Date: 2026-10-17 14:02:37.481226
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a9e2f4d813'
+down_revision = 'b41d7e06a9c3'
+branch_labels = None
+depends_on = None
+
+
+# Same definition as in 9c2e4a7d1b35. SQLite refuses to rebuild a table a view
+# depends on, so the view is dropped around the column changes.
+SCHEDULE_ENTRIES_VIEW = """
+CREATE VIEW schedule_entries AS
+SELECT 'medicine' AS schedule_type, s.id AS schedule_id, s.medicine_id AS item_id, i.name AS item_name,
+       l.batch_id AS batch_id, s.schedule_date AS date, s.completed AS completed,
+       CAST(NULL AS INTEGER) AS dose_number
+FROM medicine_schedule s
+JOIN medicine_schedule_batches l ON l.medicine_schedule_id = s.id
+JOIN medicine i ON i.id = s.medicine_id
+UNION ALL
+SELECT 'vaccine', s.id, s.vaccine_id, i.name, l.batch_id, s.scheduled_date, s.completed,
+       CAST(s.dose_number AS INTEGER)
+FROM vaccine_schedule s
+JOIN vaccine_schedule_batches l ON l.vaccine_schedule_id = s.id
+JOIN vaccine i ON i.id = s.vaccine_id
+UNION ALL
+SELECT 'health_material', s.id, s.health_material_id, i.name, l.batch_id, s.scheduled_date, s.completed,
+       CAST(NULL AS INTEGER)
+FROM health_material_schedule s
+JOIN health_material_schedule_batches l ON l.health_material_schedule_id = s.id
+JOIN health_material i ON i.id = s.health_material_id
+"""
+
+
+def parse_list(value):
+    try:
+        values = json.loads(value) if value else []
+    except (TypeError, ValueError):
+        return []
+    return values if isinstance(values, list) else []
+
+
+def create_tables():
+    # The app's create_all may already have made these tables on startup
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'shed' not in existing:
+        op.create_table('shed',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('farm_id', sa.Integer(), nullable=False),
+            sa.Column('shed_number', sa.Integer(), nullable=False),
+            sa.Column('capacity', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['farm_id'], ['farm.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('farm_id', 'shed_number', name='uq_shed_farm_number')
+        )
+    if 'batch_shed_allocation' not in existing:
+        op.create_table('batch_shed_allocation',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('batch_id', sa.Integer(), nullable=False),
+            sa.Column('shed_id', sa.Integer(), nullable=False),
+            sa.Column('birds', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['batch_id'], ['batch.id']),
+            sa.ForeignKeyConstraint(['shed_id'], ['shed.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('batch_id', 'shed_id', name='uq_batch_shed_allocation_batch_shed')
+        )
+        op.create_index('ix_batch_shed_allocation_shed', 'batch_shed_allocation', ['shed_id'])
+    if 'vaccine_dose' not in existing:
+        op.create_table('vaccine_dose',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('vaccine_id', sa.Integer(), nullable=False),
+            sa.Column('dose_number', sa.Integer(), nullable=False),
+            sa.Column('age_days', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['vaccine_id'], ['vaccine.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('vaccine_id', 'dose_number', name='uq_vaccine_dose_vaccine_number')
+        )
+    if 'auto_schedule_age' not in existing:
+        op.create_table('auto_schedule_age',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('auto_schedule_id', sa.Integer(), nullable=False),
+            sa.Column('position', sa.Integer(), nullable=False),
+            sa.Column('age_days', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['auto_schedule_id'], ['auto_schedule.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('auto_schedule_id', 'position', name='uq_auto_schedule_age_position')
+        )
+
+
+def upgrade():
+    create_tables()
+    connection = op.get_bind()
+    op.execute('DROP VIEW IF EXISTS schedule_entries')
+
+    # Farms: one shed row per capacity, skipping farms that already have rows
+    shed_ids = {}
+    for farm_id, capacities in connection.execute(text('SELECT id, shed_capacities FROM farm')).fetchall():
+        existing = connection.execute(text('SELECT shed_number, id FROM shed WHERE farm_id = :farm_id'),
+                                      {'farm_id': farm_id}).fetchall()
+        if not existing:
+            for shed_number, capacity in enumerate(parse_list(capacities), 1):
+                connection.execute(text(
+                    'INSERT INTO shed (farm_id, shed_number, capacity) VALUES (:farm_id, :shed_number, :capacity)'
+                ), {'farm_id': farm_id, 'shed_number': shed_number, 'capacity': int(capacity or 0)})
+            existing = connection.execute(text('SELECT shed_number, id FROM shed WHERE farm_id = :farm_id'),
+                                          {'farm_id': farm_id}).fetchall()
+        for shed_number, shed_id in existing:
+            shed_ids[(farm_id, shed_number)] = shed_id
+
+    # Batches: one allocation row per shed holding birds
+    allocated = {row[0] for row in connection.execute(text('SELECT DISTINCT batch_id FROM batch_shed_allocation'))}
+    for batch_id, farm_id, shed_birds in connection.execute(
+            text('SELECT id, farm_id, shed_birds FROM batch')).fetchall():
+        if batch_id in allocated:
+            continue
+        for shed_number, birds in enumerate(parse_list(shed_birds), 1):
+            if not birds:
+                continue
+            shed_id = shed_ids.get((farm_id, shed_number))
+            if shed_id is None:
+                # The farm lost this shed after the batch was placed: keep it as a retired shed
+                # (numbered above num_sheds, capacity 0) so the batch's shed history survives
+                shed_id = connection.execute(text(
+                    'INSERT INTO shed (farm_id, shed_number, capacity) VALUES (:farm_id, :shed_number, 0) RETURNING id'
+                ), {'farm_id': farm_id, 'shed_number': shed_number}).scalar()
+                shed_ids[(farm_id, shed_number)] = shed_id
+            connection.execute(text(
+                'INSERT INTO batch_shed_allocation (batch_id, shed_id, birds) VALUES (:batch_id, :shed_id, :birds)'
+            ), {'batch_id': batch_id, 'shed_id': shed_id, 'birds': int(birds)})
+
+    converted = {row[0] for row in connection.execute(text('SELECT DISTINCT vaccine_id FROM vaccine_dose'))}
+    for vaccine_id, dose_ages in connection.execute(text('SELECT id, dose_ages FROM vaccine')).fetchall():
+        if vaccine_id in converted:
+            continue
+        for dose_number, age in enumerate(parse_list(dose_ages), 1):
+            connection.execute(text(
+                'INSERT INTO vaccine_dose (vaccine_id, dose_number, age_days) VALUES (:vaccine_id, :dose_number, :age)'
+            ), {'vaccine_id': vaccine_id, 'dose_number': dose_number, 'age': int(age)})
+
+    converted = {row[0] for row in connection.execute(text('SELECT DISTINCT auto_schedule_id FROM auto_schedule_age'))}
+    for auto_schedule_id, schedule_ages in connection.execute(
+            text('SELECT id, schedule_ages FROM auto_schedule')).fetchall():
+        if auto_schedule_id in converted:
+            continue
+        ages = [int(age) for age in parse_list(schedule_ages) if age is not None]
+        for position, age in enumerate(ages):
+            connection.execute(text(
+                'INSERT INTO auto_schedule_age (auto_schedule_id, position, age_days) '
+                'VALUES (:auto_schedule_id, :position, :age)'
+            ), {'auto_schedule_id': auto_schedule_id, 'position': position, 'age': age})
+
+    with op.batch_alter_table('farm', schema=None) as batch_op:
+        batch_op.drop_column('shed_capacities')
+    with op.batch_alter_table('batch', schema=None) as batch_op:
+        batch_op.drop_column('shed_birds')
+    with op.batch_alter_table('vaccine', schema=None) as batch_op:
+        batch_op.drop_column('dose_ages')
+    with op.batch_alter_table('auto_schedule', schema=None) as batch_op:
+        batch_op.drop_column('schedule_ages')
+    op.execute(SCHEDULE_ENTRIES_VIEW)
+
+
+def downgrade():
+    op.execute('DROP VIEW IF EXISTS schedule_entries')
+    with op.batch_alter_table('farm', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('shed_capacities', sa.Text(), nullable=False, server_default='[]'))
+    with op.batch_alter_table('batch', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('shed_birds', sa.Text(), nullable=False, server_default='[]'))
+    with op.batch_alter_table('vaccine', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('dose_ages', sa.Text(), nullable=False, server_default='[]'))
+    with op.batch_alter_table('auto_schedule', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('schedule_ages', sa.Text(), nullable=False, server_default='[]'))
+
+    connection = op.get_bind()
+    capacities = {}
+    for farm_id, shed_number, capacity in connection.execute(
+            text('SELECT farm_id, shed_number, capacity FROM shed ORDER BY farm_id, shed_number')):
+        capacities.setdefault(farm_id, {})[shed_number] = capacity
+    for farm_id, sheds in capacities.items():
+        values = [sheds.get(number, 0) for number in range(1, max(sheds) + 1)]
+        connection.execute(text('UPDATE farm SET shed_capacities = :value WHERE id = :id'),
+                           {'value': json.dumps(values), 'id': farm_id})
+
+    birds = {}
+    for batch_id, shed_number, count in connection.execute(text(
+            'SELECT a.batch_id, s.shed_number, a.birds FROM batch_shed_allocation a JOIN shed s ON s.id = a.shed_id')):
+        birds.setdefault(batch_id, {})[shed_number] = count
+    for batch_id, sheds in birds.items():
+        values = [sheds.get(number, 0) for number in range(1, max(sheds) + 1)]
+        connection.execute(text('UPDATE batch SET shed_birds = :value WHERE id = :id'),
+                           {'value': json.dumps(values), 'id': batch_id})
+
+    ages = {}
+    for vaccine_id, age in connection.execute(
+            text('SELECT vaccine_id, age_days FROM vaccine_dose ORDER BY vaccine_id, dose_number')):
+        ages.setdefault(vaccine_id, []).append(age)
+    for vaccine_id, values in ages.items():
+        connection.execute(text('UPDATE vaccine SET dose_ages = :value WHERE id = :id'),
+                           {'value': json.dumps(values), 'id': vaccine_id})
+
+    ages = {}
+    for auto_schedule_id, age in connection.execute(
+            text('SELECT auto_schedule_id, age_days FROM auto_schedule_age ORDER BY auto_schedule_id, position')):
+        ages.setdefault(auto_schedule_id, []).append(age)
+    for auto_schedule_id, values in ages.items():
+        connection.execute(text('UPDATE auto_schedule SET schedule_ages = :value WHERE id = :id'),
+                           {'value': json.dumps(values), 'id': auto_schedule_id})
+
+    op.drop_table('auto_schedule_age')
+    op.drop_table('vaccine_dose')
+    op.drop_index('ix_batch_shed_allocation_shed', table_name='batch_shed_allocation')
+    op.drop_table('batch_shed_allocation')
+    op.drop_table('shed')
+    op.execute(SCHEDULE_ENTRIES_VIEW)
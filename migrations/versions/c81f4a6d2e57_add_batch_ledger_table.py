@@ -0,0 +1,50 @@
+"""Add the batch_ledger table holding running financial totals per batch
+
+Revision ID: c81f4a6d2e57
+Revises: a5d2e8c4b719
+Create Date: 2026-10-18 11:20:43.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f4a6d2e57'
+down_revision = 'a5d2e8c4b719'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all may already have made the table on startup. Ledgers
+    # of existing batches are built from their rows the first time they are read.
+    if 'batch_ledger' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table('batch_ledger',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('batch_id', sa.Integer(), nullable=False),
+        sa.Column('feed_packets', sa.Float(), nullable=False),
+        sa.Column('feed_kg', sa.Float(), nullable=False),
+        sa.Column('feed_cost', sa.Float(), nullable=False),
+        sa.Column('returned_packets', sa.Float(), nullable=False),
+        sa.Column('returned_kg', sa.Float(), nullable=False),
+        sa.Column('medicine_cost', sa.Float(), nullable=False),
+        sa.Column('vaccine_cost', sa.Float(), nullable=False),
+        sa.Column('health_material_cost', sa.Float(), nullable=False),
+        sa.Column('miscellaneous_cost', sa.Float(), nullable=False),
+        sa.Column('harvested_birds', sa.Integer(), nullable=False),
+        sa.Column('weight_sold', sa.Float(), nullable=False),
+        sa.Column('revenue', sa.Float(), nullable=False),
+        sa.Column('frozen', sa.Boolean(), nullable=False),
+        sa.Column('frozen_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['batch_id'], ['batch.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('batch_id')
+    )
+
+
+def downgrade():
+    op.drop_table('batch_ledger')
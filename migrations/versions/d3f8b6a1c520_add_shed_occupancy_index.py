@@ -0,0 +1,46 @@
+"""Add the shed_occupancy index of birds placed per shed by active batches
+
+Revision ID: d3f8b6a1c520
+Revises: c7a9e2f4d813
+Create Date: 2026-10-17 16:21:05.118342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f8b6a1c520'
+down_revision = 'c7a9e2f4d813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all may already have made the table on startup
+    if 'shed_occupancy' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table('shed_occupancy',
+            sa.Column('shed_id', sa.Integer(), nullable=False),
+            sa.Column('farm_id', sa.Integer(), nullable=False),
+            sa.Column('occupied_birds', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['shed_id'], ['shed.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['farm_id'], ['farm.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('shed_id')
+        )
+        op.create_index('ix_shed_occupancy_farm_id', 'shed_occupancy', ['farm_id'])
+    op.execute('DELETE FROM shed_occupancy')
+    # Same computation as compute_shed_occupancy() in app.py
+    op.execute("""
+        INSERT INTO shed_occupancy (shed_id, farm_id, occupied_birds)
+        SELECT s.id, s.farm_id,
+               COALESCE(SUM(CASE WHEN b.status IN ('ongoing', 'closing') THEN a.birds ELSE 0 END), 0)
+        FROM shed s
+        LEFT OUTER JOIN batch_shed_allocation a ON a.shed_id = s.id
+        LEFT OUTER JOIN batch b ON b.id = a.batch_id
+        GROUP BY s.id, s.farm_id
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_shed_occupancy_farm_id', table_name='shed_occupancy')
+    op.drop_table('shed_occupancy')
@@ -0,0 +1,52 @@
+"""Add the batch_daily_metrics table holding precomputed per-day series
+
+Revision ID: d6b1e93f4a28
+Revises: c81f4a6d2e57
+Create Date: 2026-10-18 11:34:06.572931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6b1e93f4a28'
+down_revision = 'c81f4a6d2e57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all may already have made the table on startup. Series
+    # of existing batches are built the first time they are read.
+    if 'batch_daily_metrics' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table('batch_daily_metrics',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('batch_id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('age_days', sa.Integer(), nullable=False),
+        sa.Column('mortality', sa.Integer(), nullable=False),
+        sa.Column('cumulative_mortality', sa.Integer(), nullable=False),
+        sa.Column('birds_alive', sa.Integer(), nullable=False),
+        sa.Column('feed_delivered_packets', sa.Float(), nullable=False),
+        sa.Column('feed_delivered_kg', sa.Float(), nullable=False),
+        sa.Column('feed_used_kg', sa.Float(), nullable=False),
+        sa.Column('feed_returned_kg', sa.Float(), nullable=False),
+        sa.Column('avg_weight', sa.Float(), nullable=False),
+        sa.Column('male_weight', sa.Float(), nullable=False),
+        sa.Column('female_weight', sa.Float(), nullable=False),
+        sa.Column('daily_gain', sa.Float(), nullable=False),
+        sa.Column('daily_cost', sa.Float(), nullable=False),
+        sa.Column('running_cost', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['batch_id'], ['batch.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('batch_id', 'date', name='uq_batch_daily_metrics_batch_date')
+    )
+    op.create_index('ix_batch_daily_metrics_batch_id', 'batch_daily_metrics', ['batch_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_batch_daily_metrics_batch_id', table_name='batch_daily_metrics')
+    op.drop_table('batch_daily_metrics')
@@ -0,0 +1,37 @@
+"""Add the sync_operation table behind idempotent offline replay
+
+Revision ID: e2b7c5a93f18
+Revises: c4d8a2f61e95
+Create Date: 2026-10-17 23:58:12.406518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7c5a93f18'
+down_revision = 'c4d8a2f61e95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all may already have made the table on startup
+    if 'sync_operation' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table('sync_operation',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('result', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('sync_operation')
@@ -0,0 +1,78 @@
+"""Add the farm batch number counters, free lists and the global batch number sequence
+
+Revision ID: e6a1c93d7f24
+Revises: d3f8b6a1c520
+Create Date: 2026-10-17 17:05:42.639107
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a1c93d7f24'
+down_revision = 'd3f8b6a1c520'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all may already have made these on startup
+    inspector = sa.inspect(op.get_bind())
+    existing = set(inspector.get_table_names())
+    if 'farm_batch_number_counter' not in existing:
+        op.create_table('farm_batch_number_counter',
+            sa.Column('farm_id', sa.Integer(), nullable=False),
+            sa.Column('next_number', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['farm_id'], ['farm.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('farm_id')
+        )
+    if 'farm_batch_number_free' not in existing:
+        op.create_table('farm_batch_number_free',
+            sa.Column('farm_id', sa.Integer(), nullable=False),
+            sa.Column('number', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['farm_id'], ['farm.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('farm_id', 'number')
+        )
+    if 'number_sequence' not in existing:
+        op.create_table('number_sequence',
+            sa.Column('name', sa.String(length=50), nullable=False),
+            sa.Column('next_value', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('name')
+        )
+    if 'ix_batch_farm_number' not in {index['name'] for index in inspector.get_indexes('batch')}:
+        op.create_index('ix_batch_farm_number', 'batch', ['farm_id', 'farm_batch_number'])
+
+    # Same seeding as seed_farm_batch_numbers() and seed_batch_number_sequence() in app.py,
+    # rebuilt from scratch so it also replaces whatever startup seeded
+    op.execute('DELETE FROM farm_batch_number_free')
+    op.execute('DELETE FROM farm_batch_number_counter')
+    op.execute("DELETE FROM number_sequence WHERE name = 'batch_number'")
+    connection = op.get_bind()
+    held = {farm_id: set() for farm_id in connection.execute(text('SELECT id FROM farm')).scalars()}
+    issued = [0]
+    for farm_id, number, batch_number in connection.execute(
+            text('SELECT farm_id, farm_batch_number, batch_number FROM batch')):
+        if number and number > 0:
+            held.setdefault(farm_id, set()).add(number)
+        try:
+            issued.append(int(batch_number.split('-')[1]))
+        except (AttributeError, IndexError, ValueError):
+            pass
+    for farm_id, numbers in held.items():
+        top = max(numbers, default=0)
+        connection.execute(text('INSERT INTO farm_batch_number_counter (farm_id, next_number) VALUES (:farm_id, :next_number)'),
+                           {'farm_id': farm_id, 'next_number': top + 1})
+        free = [{'farm_id': farm_id, 'number': number} for number in range(1, top) if number not in numbers]
+        if free:
+            connection.execute(text('INSERT INTO farm_batch_number_free (farm_id, number) VALUES (:farm_id, :number)'), free)
+    connection.execute(text("INSERT INTO number_sequence (name, next_value) VALUES ('batch_number', :next_value)"),
+                       {'next_value': max(issued) + 1})
+
+
+def downgrade():
+    op.drop_index('ix_batch_farm_number', table_name='batch')
+    op.drop_table('number_sequence')
+    op.drop_table('farm_batch_number_free')
+    op.drop_table('farm_batch_number_counter')
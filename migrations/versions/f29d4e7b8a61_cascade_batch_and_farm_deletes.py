@@ -0,0 +1,108 @@
+"""Cascade deletes from farms, batches, batch updates, sheds and schedules to their children
+
+Revision ID: f29d4e7b8a61
+Revises: e6a1c93d7f24
+Create Date: 2026-10-17 18:12:09.530214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f29d4e7b8a61'
+down_revision = 'e6a1c93d7f24'
+branch_labels = None
+depends_on = None
+
+
+# Same definition as in 9c2e4a7d1b35. SQLite refuses to rebuild a table a view
+# depends on, so the view is dropped around the rebuilds.
+SCHEDULE_ENTRIES_VIEW = """
+CREATE VIEW schedule_entries AS
+SELECT 'medicine' AS schedule_type, s.id AS schedule_id, s.medicine_id AS item_id, i.name AS item_name,
+       l.batch_id AS batch_id, s.schedule_date AS date, s.completed AS completed,
+       CAST(NULL AS INTEGER) AS dose_number
+FROM medicine_schedule s
+JOIN medicine_schedule_batches l ON l.medicine_schedule_id = s.id
+JOIN medicine i ON i.id = s.medicine_id
+UNION ALL
+SELECT 'vaccine', s.id, s.vaccine_id, i.name, l.batch_id, s.scheduled_date, s.completed,
+       CAST(s.dose_number AS INTEGER)
+FROM vaccine_schedule s
+JOIN vaccine_schedule_batches l ON l.vaccine_schedule_id = s.id
+JOIN vaccine i ON i.id = s.vaccine_id
+UNION ALL
+SELECT 'health_material', s.id, s.health_material_id, i.name, l.batch_id, s.scheduled_date, s.completed,
+       CAST(NULL AS INTEGER)
+FROM health_material_schedule s
+JOIN health_material_schedule_batches l ON l.health_material_schedule_id = s.id
+JOIN health_material i ON i.id = s.health_material_id
+"""
+
+# table: [(column, referred table)] of the foreign keys that get ON DELETE CASCADE
+CASCADES = {
+    'shed': [('farm_id', 'farm')],
+    'batch': [('farm_id', 'farm')],
+    'batch_shed_allocation': [('batch_id', 'batch'), ('shed_id', 'shed')],
+    'medicine_schedule_batches': [('medicine_schedule_id', 'medicine_schedule'), ('batch_id', 'batch')],
+    'vaccine_schedule_batches': [('vaccine_schedule_id', 'vaccine_schedule'), ('batch_id', 'batch')],
+    'health_material_schedule_batches': [('health_material_schedule_id', 'health_material_schedule'), ('batch_id', 'batch')],
+    'batch_update': [('batch_id', 'batch')],
+    'batch_update_feeds': [('batch_update_id', 'batch_update')],
+    'batch_update_items': [('batch_update_id', 'batch_update')],
+    'batch_update_item': [('batch_update_id', 'batch_update')],
+    'batch_feed_return': [('batch_update_id', 'batch_update')],
+    'miscellaneous_item': [('batch_update_id', 'batch_update')],
+    'past_feed_allocation': [('batch_update_id', 'batch_update')],
+    'harvest': [('batch_id', 'batch')],
+    'financial_summary': [('batch_id', 'batch')],
+    'batch_ledger': [('batch_id', 'batch')],
+    'batch_daily_metrics': [('batch_id', 'batch')],
+}
+
+# SQLite foreign keys are unnamed; batch mode names them by this convention
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def set_ondelete(ondelete):
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    sqlite = connection.dialect.name == 'sqlite'
+    existing = set(inspector.get_table_names())
+    if sqlite:
+        op.execute('DROP VIEW IF EXISTS schedule_entries')
+
+    for table, foreign_keys in CASCADES.items():
+        if table not in existing:
+            continue
+        reflected = {tuple(fk['constrained_columns']): fk for fk in inspector.get_foreign_keys(table)}
+        changes = []
+        for column, referred in foreign_keys:
+            fk = reflected.get((column,))
+            # Skip columns without a foreign key and ones already in the wanted state
+            if fk is None or (fk.get('options', {}).get('ondelete') or '').upper() == (ondelete or ''):
+                continue
+            changes.append((column, referred, fk['name'] or f'fk_{table}_{column}_{referred}'))
+        if not changes:
+            continue
+        if sqlite:
+            with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+                for column, referred, name in changes:
+                    batch_op.drop_constraint(name, type_='foreignkey')
+                    batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+        else:
+            for column, referred, name in changes:
+                op.drop_constraint(name, table, type_='foreignkey')
+                op.create_foreign_key(name, table, referred, [column], ['id'], ondelete=ondelete)
+
+    if sqlite:
+        op.execute(SCHEDULE_ENTRIES_VIEW)
+
+
+def upgrade():
+    set_ondelete('CASCADE')
+
+
+def downgrade():
+    set_ondelete(None)
@@ -43,6 +43,29 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
+// Poll a background job until it finishes; resolves with the job, rejects when it failed
+function waitForJob(jobId, interval = 1000) {
+    return new Promise((resolve, reject) => {
+        function poll() {
+            fetch(`/jobs/${jobId}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (!data.success) {
+                        reject(new Error(data.message));
+                    } else if (data.job.status === 'succeeded') {
+                        resolve(data.job);
+                    } else if (data.job.status === 'failed') {
+                        reject(new Error(data.job.error || 'Job failed'));
+                    } else {
+                        setTimeout(poll, interval);
+                    }
+                })
+                .catch(reject);
+        }
+        poll();
+    });
+}
+
 // // Form submission handling
 // document.getElementById('loginForm').addEventListener('submit', function(e) {
 //     e.preventDefault();
@@ -55,4 +78,51 @@ document.addEventListener('DOMContentLoaded', function() {
     
 //     // For now, we'll just show an alert
 //     alert('Login functionality will be implemented with the backend');
-// }); 
\ No newline at end of file
+// }); 
+// Append the following pages of a keyset-paginated listing as the sentinel scrolls into view.
+// url answers {success, html: {name: markup}, next_cursor}; targets maps each name to the
+// element its markup goes into. The first cursor comes from the sentinel's data-cursor.
+function infiniteScroll(sentinel, url, targets, onLoad) {
+    if (!sentinel) return null;
+    let cursor = sentinel.dataset.cursor;
+    let loading = null;
+
+    function loadMore() {
+        if (!cursor) return Promise.resolve(false);
+        if (loading) return loading;
+        const separator = url.includes('?') ? '&' : '?';
+        loading = fetch(`${url}${separator}cursor=${encodeURIComponent(cursor)}`)
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) throw new Error(data.message);
+                Object.entries(targets).forEach(([name, target]) => {
+                    target.insertAdjacentHTML('beforeend', data.html[name] || '');
+                });
+                cursor = data.next_cursor;
+                if (onLoad) onLoad(data);
+                if (cursor) {
+                    // Observe again so a sentinel that is still in view loads the page after
+                    observer.unobserve(sentinel);
+                    observer.observe(sentinel);
+                } else {
+                    observer.disconnect();
+                    sentinel.remove();
+                }
+                return true;
+            })
+            .finally(() => { loading = null; });
+        return loading;
+    }
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadMore().catch(error => console.error('Error loading more:', error));
+        }
+    }, { rootMargin: '200px' });
+    if (cursor) {
+        observer.observe(sentinel);
+    } else {
+        sentinel.remove();
+    }
+    return { loadMore, hasMore: () => Boolean(cursor) };
+}
@@ -11,6 +11,211 @@ const urlsToCache = [
     '/manifest.json'
 ];
 
+// Offline write queue. Daily updates, harvests and schedule completions that
+// fail for want of a connection are kept in IndexedDB as sync operations,
+// each with an idempotency key made here, and replayed in order to /api/sync
+// once the connection is back. The server records every key, so a replay
+// whose response was lost can be sent again without applying anything twice.
+const SYNC_DB_NAME = 'bismi-farms-sync';
+const SYNC_STORE = 'operations';
+const SYNC_TAG = 'sync-queue';
+const SYNC_CHUNK_SIZE = 500;  // SYNC_OPERATION_LIMIT on the server
+const SCHEDULE_TYPES = {'medicine': 'medicine', 'vaccine': 'vaccine', 'health-material': 'health_material'};
+
+// POST routes whose writes can be queued, and how to turn their body into a sync operation
+const QUEUEABLE_ROUTES = [
+    {pattern: /^\/(?:manager\/)?batches\/(\d+)\/update$/, kind: 'daily_update', toData: dailyUpdateData},
+    {pattern: /^\/batches\/(\d+)\/harvest\/add$/, kind: 'harvest', toData: harvestData},
+    {pattern: /^\/manager\/harvest\/(\d+)$/, kind: 'harvest', toData: harvestData},
+    {pattern: /^\/(medicine|vaccine|health-material)\/schedule\/(\d+)\/complete$/, kind: 'schedule_completion', toData: scheduleCompletionData},
+    {pattern: /^\/manager\/schedule\/(vaccine|health-material)\/(\d+)\/complete$/, kind: 'schedule_completion', toData: scheduleCompletionData}
+];
+
+function isFormPost(request) {
+    const contentType = request.headers.get('Content-Type') || '';
+    return contentType.startsWith('application/x-www-form-urlencoded') || contentType.startsWith('multipart/form-data');
+}
+
+function localDate() {
+    const now = new Date();
+    const pad = value => String(value).padStart(2, '0');
+    return `${now.getFullYear()}-${pad(now.getMonth() + 1)}-${pad(now.getDate())}`;
+}
+
+// Form values as JSON numbers, leaving anything unparseable for the server to reject
+function formNumber(value) {
+    if (value === null || value === '') {
+        return undefined;
+    }
+    const number = Number(value);
+    return Number.isNaN(number) ? value : number;
+}
+
+function formString(value) {
+    return value === null || value === '' ? undefined : value;
+}
+
+async function dailyUpdateData(request, match) {
+    const form = await request.formData();
+    const data = {
+        batch_id: Number(match[1]),
+        date: formString(form.get('date')) || localDate(),
+        mortality_count: formNumber(form.get('mortality_count')),
+        feed_used: formNumber(form.get('feed_used')),
+        avg_weight: formNumber(form.get('avg_weight')),
+        male_weight: formNumber(form.get('male_weight')),
+        female_weight: formNumber(form.get('female_weight')),
+        remarks: formString(form.get('remarks')),
+        remarks_priority: formString(form.get('remarks_priority')),
+        feeds: [],
+        feed_returns: [],
+        scheduled_items: [],
+        other_items: [],
+        miscellaneous: []
+    };
+
+    // The form posts parallel lists; rows without a feed or a quantity are skipped as on the server
+    const pairs = (ids, quantities) => form.getAll(ids).map((id, i) => ({
+        feed_id: formNumber(id), quantity: formNumber(form.getAll(quantities)[i])
+    })).filter(feed => feed.feed_id !== undefined && feed.quantity);
+    data.feeds = pairs('feed_id[]', 'feed_quantity[]');
+    data.feed_returns = pairs('feed_return_id[]', 'feed_return_quantity[]');
+
+    const otherItems = {};
+    for (const [name, value] of form.entries()) {
+        let parts = name.match(/^scheduled_items\[(\w+)\]\[(\d+)\]\[selected\]$/);
+        if (parts && value === '1') {
+            const quantity = formNumber(form.get(`scheduled_items[${parts[1]}][${parts[2]}][quantity]`));
+            if (quantity) {
+                data.scheduled_items.push({item_type: parts[1], schedule_id: Number(parts[2]), quantity: quantity});
+            }
+            continue;
+        }
+        parts = name.match(/^other_items\[(\w+)\]\[(\d+)\]\[(id|quantity|dose_number)\]$/);
+        if (parts) {
+            const item = otherItems[`${parts[1]}-${parts[2]}`] = otherItems[`${parts[1]}-${parts[2]}`] || {item_type: parts[1]};
+            item[parts[3] === 'id' ? 'item_id' : parts[3]] = formNumber(value);
+        }
+    }
+    data.other_items = Object.values(otherItems).filter(item => item.item_id !== undefined && item.quantity);
+
+    form.getAll('misc_name[]').forEach((name, i) => {
+        if (name) {
+            data.miscellaneous.push({
+                name: name,
+                quantity_per_unit: formNumber(form.getAll('misc_quantity_per_unit[]')[i]),
+                unit_type: form.getAll('misc_unit_type[]')[i],
+                price_per_unit: formNumber(form.getAll('misc_price_per_unit[]')[i]),
+                units_used: formNumber(form.getAll('misc_units_used[]')[i])
+            });
+        }
+    });
+    return data;
+}
+
+async function harvestData(request, match) {
+    const form = await request.formData();
+    return {
+        batch_id: Number(match[1]),
+        date: formString(form.get('harvest_date')) || localDate(),
+        quantity: formNumber(form.get('quantity')) || 0,
+        weight: formNumber(form.get('weight')) || 0,
+        selling_price: formNumber(form.get('selling_price')) || 0,
+        notes: form.get('notes') || ''
+    };
+}
+
+async function scheduleCompletionData(request, match) {
+    return {item_type: SCHEDULE_TYPES[match[1]], schedule_id: Number(match[2])};
+}
+
+function openSyncDatabase() {
+    return new Promise((resolve, reject) => {
+        const open = indexedDB.open(SYNC_DB_NAME, 1);
+        open.onupgradeneeded = () => open.result.createObjectStore(SYNC_STORE, {keyPath: 'id', autoIncrement: true});
+        open.onsuccess = () => resolve(open.result);
+        open.onerror = () => reject(open.error);
+    });
+}
+
+// Run fn against the operations store in one transaction, resolving with its request's result once committed
+async function withSyncStore(mode, fn) {
+    const database = await openSyncDatabase();
+    return new Promise((resolve, reject) => {
+        const transaction = database.transaction(SYNC_STORE, mode);
+        const storeRequest = fn(transaction.objectStore(SYNC_STORE));
+        transaction.oncomplete = () => resolve(storeRequest && storeRequest.result);
+        transaction.onerror = () => reject(transaction.error);
+    }).finally(() => database.close());
+}
+
+async function queueOperation(request, route, match) {
+    const operation = {
+        key: self.crypto.randomUUID(),
+        kind: route.kind,
+        data: await route.toData(request, match),
+        url: request.url,
+        queued_at: new Date().toISOString()
+    };
+    await withSyncStore('readwrite', store => store.add(operation));
+    if (self.registration.sync) {
+        self.registration.sync.register(SYNC_TAG).catch(() => {});
+    }
+    console.log('Queued offline:', operation.kind, operation.key);
+
+    const message = 'You are offline. This has been saved on this device and will be sent when the connection is back.';
+    if (request.mode === 'navigate') {
+        return new Response(
+            `<!DOCTYPE html><html><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>Saved offline - Bismi Farms</title><link rel="stylesheet" href="/static/css/style.css"></head>
+            <body><div style="text-align: center; padding: 2rem;"><h1>Saved offline</h1><p>${message}</p>
+            <p><a href="javascript:history.back()">Go back</a></p></div></body></html>`,
+            {status: 202, headers: {'Content-Type': 'text/html; charset=utf-8'}}
+        );
+    }
+    return new Response(JSON.stringify({success: true, queued: true, message: message}),
+        {status: 202, headers: {'Content-Type': 'application/json'}});
+}
+
+async function notifyClients(message) {
+    const clientList = await self.clients.matchAll({type: 'window'});
+    clientList.forEach(client => client.postMessage(message));
+}
+
+// Send the queue to /api/sync oldest first. Operations leave the queue only
+// once the server has answered for them; a failed or refused request (offline,
+// logged out, a concurrent save) leaves them for the next attempt.
+let replaying = null;
+
+function replayQueue() {
+    if (!replaying) {
+        replaying = sendQueue().finally(() => { replaying = null; });
+    }
+    return replaying;
+}
+
+async function sendQueue() {
+    let operations = await withSyncStore('readonly', store => store.getAll());
+    while (operations.length) {
+        const chunk = operations.slice(0, SYNC_CHUNK_SIZE);
+        const response = await fetch('/api/sync', {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({operations: chunk.map(({key, kind, data}) => ({key, kind, data}))})
+        });
+        // An expired session redirects to the login page rather than answering with JSON
+        if (!response.ok || response.redirected || !(response.headers.get('Content-Type') || '').includes('application/json')) {
+            throw new Error(`Sync failed with status ${response.status}`);
+        }
+        const body = await response.json();
+        await withSyncStore('readwrite', store => chunk.forEach(operation => store.delete(operation.id)));
+        const problems = body.results.filter(result => !['created', 'completed'].includes(result.status));
+        await notifyClients({type: 'SYNC_RESULTS', applied: body.results.length - problems.length, problems: problems});
+        operations = operations.slice(SYNC_CHUNK_SIZE);
+    }
+}
+
 // Install service worker
 self.addEventListener('install', event => {
     console.log('Service Worker installing...');
@@ -29,6 +234,38 @@ self.addEventListener('install', event => {
 // Fetch resources
 self.addEventListener('fetch', event => {
     console.log('Fetching:', event.request.url);
+
+    // Queueable form posts go to the network, and into the offline queue when it cannot be reached.
+    // JSON posts to the same URLs (such as add_past_feed_allocation) are not form data and pass through.
+    if (event.request.method === 'POST' && isFormPost(event.request)) {
+        const path = new URL(event.request.url).pathname;
+        for (const route of QUEUEABLE_ROUTES) {
+            const match = path.match(route.pattern);
+            if (match) {
+                const queuedCopy = event.request.clone();
+                event.respondWith(fetch(event.request).catch(() => queueOperation(queuedCopy, route, match)));
+                return;
+            }
+        }
+    }
+
+    // Catalogs go to the network first, where the browser revalidates them
+    // with their ETag; the cached copy is only used offline
+    if (new URL(event.request.url).pathname.startsWith('/api/catalogs')) {
+        event.respondWith(
+            fetch(event.request)
+                .then(response => {
+                    if (response.ok) {
+                        const responseToCache = response.clone();
+                        caches.open(CACHE_NAME).then(cache => cache.put(event.request, responseToCache));
+                    }
+                    return response;
+                })
+                .catch(() => caches.match(event.request))
+        );
+        return;
+    }
+
     event.respondWith(
         caches.match(event.request)
             .then(response => {
@@ -75,6 +312,7 @@ self.addEventListener('fetch', event => {
 // Activate and clean up old caches
 self.addEventListener('activate', event => {
     console.log('Service Worker activating...');
+    event.waitUntil(replayQueue().catch(error => console.error('Sync failed:', error)));
     event.waitUntil(
         caches.keys().then(cacheNames => {
             return Promise.all(
@@ -89,9 +327,20 @@ self.addEventListener('activate', event => {
     );
 });
 
+// Replay the offline queue when background sync says the connection is back
+self.addEventListener('sync', event => {
+    if (event.tag === SYNC_TAG) {
+        event.waitUntil(replayQueue());
+    }
+});
+
 // Handle messages from the client
 self.addEventListener('message', event => {
     if (event.data === 'SKIP_WAITING') {
         self.skipWaiting();
     }
+    // Pages ask for a replay when they load or come back online, for browsers without background sync
+    if (event.data === 'REPLAY_QUEUE') {
+        event.waitUntil(replayQueue().catch(error => console.error('Sync failed:', error)));
+    }
 }); 
\ No newline at end of file